@@ -0,0 +1,232 @@
+# Local stand-in for discord, shared by replay_events.py and yousaidhowfast_load.py
+# The kernel and modules run unchanged: gateway payloads go through discord.py's own parsers, so handlers get real discord.py objects,
+# while the REST API is replaced by a stub that records what modules send and the database is a scratch sqlite file
+
+import sys, os, io, asyncio, tempfile, itertools, glob, shutil, datetime
+
+sys.path.insert(1, os.getcwd() + "/libs")
+sys.path.insert(1, os.getcwd() + "/common")
+sys.path.insert(1, os.getcwd())
+
+from contextlib import redirect_stdout, redirect_stderr
+from typing import Any, Dict, List, Optional
+
+import discord
+
+from scratch_config import scratch_config  # pylint: disable=E0401
+
+
+class fake_discord:
+    __slots__ = "main", "scratch", "api_calls", "sent", "parse_errors", "_snowflakes"
+
+    def __init__(self) -> None:
+
+        self.scratch = tempfile.mkdtemp(prefix="sonnet-fake-discord-")
+
+        # Modules get a fresh sqlite db so runs never touch real data, lib_sonnetconfig reads the config during module load
+        scratch_config(self.scratch, DB_TYPE="sqlite3", DB_SCHEMA="per-guild", SQLITE3_LOCATION=os.path.join(self.scratch, "sonnetdb.db"))
+
+        # Checked before any database lib loads, a harness run must never reach the configured database
+        import lib_sonnetconfig  # pylint: disable=E0401
+        assert "lib_sonnetdb" not in sys.modules, "lib_sonnetdb was imported before the scratch config"
+        assert lib_sonnetconfig.DB_TYPE == "sqlite3", f"{lib_sonnetconfig.DB_TYPE=}"
+        assert os.path.dirname(os.path.abspath(lib_sonnetconfig.SQLITE3_LOCATION)) == os.path.abspath(self.scratch), f"{lib_sonnetconfig.SQLITE3_LOCATION=}"
+
+        # Reroute stderr and stdout to ignore import warnings from main
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            import main  # pylint: disable=E0401
+            err = main.kernel_load_command_modules()
+
+        if err:
+            print(err[0])
+
+        # Mirror the client main would build, but never chunk guilds since there is no websocket
+        intents, member_cache_flags, _ = main.gateway_policy(set(main.dynamiclib_modules_exec_dict))
+        main.rebuild_client(False, intents=intents, member_cache_flags=member_cache_flags, chunk_guilds_at_startup=False, guild_ready_timeout=0.1)
+        if intents.presences:
+            main.Client.event(main.on_presence_update)
+        main.compile_event_dispatch()
+
+        self.main: Any = main
+        self.api_calls: Dict[str, int] = {}
+        # Messages sent or edited through the API, keyed by channel id
+        self.sent: Dict[int, List[Dict[str, Any]]] = {}
+        self.parse_errors: Dict[str, int] = {}
+        self._snowflakes = itertools.count()
+
+    def snowflake(self) -> int:
+        """
+        Returns a unique snowflake for the current time, antispam reads message age from it
+        """
+        return discord.utils.time_snowflake(datetime.datetime.now(datetime.timezone.utc)) | (next(self._snowflakes) & 0x3FFFFF)
+
+    async def start(self) -> None:
+        """
+        Attaches the client to the running loop and swaps in the REST stub, must be called before feeding events
+        """
+
+        await self.main.Client._async_setup_hook()
+        self.main.Client.http.request = self._request
+
+    def feed(self, name: str, data: Dict[str, Any]) -> bool:
+        """
+        Parses a gateway dispatch as if it came from discord, returns False for events discord.py does not know
+        """
+
+        try:
+            parse = self.main.Client._connection.parsers[name]
+        except KeyError:
+            return False
+
+        try:
+            parse(data)
+        except Exception:
+            # usually a payload recorded by a newer gateway version than this discord.py understands
+            self.parse_errors[name] = self.parse_errors.get(name, 0) + 1
+
+        return True
+
+    async def drain(self) -> None:
+        """
+        Waits until every dispatched event handler has finished
+        """
+
+        # discord.py names every task it dispatches an event on
+        while pending := [t for t in asyncio.all_tasks() if t.get_name().startswith("discord.py: ") and not t.done()]:
+            await asyncio.wait(pending)
+
+    def reset_metrics(self) -> None:
+        self.main.metrics = self.main.kernel_metrics()
+        self.main._guild_db_stats().clear()
+        self.api_calls.clear()
+        self.sent.clear()
+
+    def api_report(self) -> str:
+        return "\n".join(f"{k}: {v}" for k, v in sorted(self.api_calls.items(), key=lambda i: -i[1]))
+
+    def close(self) -> None:
+        shutil.rmtree(self.scratch, ignore_errors=True)
+        for i in glob.glob("datastore/*.cache.db"):
+            os.remove(i)
+
+    async def _request(self, route: Any, **kwargs: Any) -> Any:
+
+        key = f"{route.method} {route.path}"
+        self.api_calls[key] = self.api_calls.get(key, 0) + 1
+
+        # Sent and edited messages are echoed back like discord would, everything else returns empty
+        if route.method in ("POST", "PATCH") and route.path.startswith("/channels/{channel_id}/messages"):
+            payload: Dict[str, Any] = kwargs.get("json") or {}
+            self.sent.setdefault(route.channel_id or 0, []).append(payload)
+
+            user = self.main.Client.user
+            author = user._to_minimal_user_json() if user else user_payload(0, "replay")
+
+            return message_payload(self.snowflake(), route.channel_id or 0, None, author, payload.get("content") or "", embeds=payload.get("embeds") or [])
+        elif route.method in ("DELETE", "PUT"):
+            return None
+        else:
+            return {}
+
+
+def user_payload(user_id: int, name: str, bot: bool = False) -> Dict[str, Any]:
+    return {"id": str(user_id), "username": name, "discriminator": "0", "global_name": None, "avatar": None, "bot": bot}
+
+
+def member_payload(user: Optional[Dict[str, Any]] = None, guild_id: Optional[int] = None) -> Dict[str, Any]:
+    member: Dict[str, Any] = {"roles": [], "joined_at": "2020-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+    if user is not None:
+        member["user"] = user
+    if guild_id is not None:
+        member["guild_id"] = str(guild_id)
+    return member
+
+
+def ready_payload(bot: Dict[str, Any], guild_ids: List[int]) -> Dict[str, Any]:
+    return {"v": 10, "user": bot, "guilds": [{"id": str(i), "unavailable": True} for i in guild_ids], "session_id": "fake", "application": {"id": bot["id"], "flags": 0}}
+
+
+def guild_payload(guild_id: int, owner_id: int, channel_ids: List[int], members: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "id": str(guild_id),
+        "name": f"guild {guild_id}",
+        "icon": None,
+        "owner_id": str(owner_id),
+        "roles": [{
+            "id": str(guild_id),
+            "name": "@everyone",
+            "permissions": "0",
+            "position": 0,
+            "color": 0,
+            "hoist": False,
+            "managed": False,
+            "mentionable": False
+            }],
+        "channels": [{
+            "id": str(i),
+            "type": 0,
+            "name": f"channel-{n}",
+            "position": n,
+            "permission_overwrites": [],
+            "guild_id": str(guild_id)
+            } for n, i in enumerate(channel_ids)],
+        "members": [member_payload(user) for user in members],
+        "member_count": len(members),
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "threads": [],
+        "stage_instances": [],
+        "guild_scheduled_events": [],
+        "voice_states": [],
+        "presences": [],
+        "large": False,
+        "verification_level": 0,
+        "default_message_notifications": 0,
+        "explicit_content_filter": 0,
+        "mfa_level": 0,
+        "premium_tier": 0,
+        "nsfw_level": 0,
+        "preferred_locale": "en-US",
+        "system_channel_flags": 0,
+        "afk_timeout": 300,
+        }
+
+
+def message_payload(message_id: int, channel_id: int, guild_id: Optional[int], author: Dict[str, Any], content: str, embeds: List[Dict[str, Any]] = []) -> Dict[str, Any]:
+    message: Dict[str, Any] = {
+        "id": str(message_id),
+        "channel_id": str(channel_id),
+        "author": author,
+        "content": content,
+        "timestamp": discord.utils.snowflake_time(message_id).isoformat(),
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": embeds,
+        "pinned": False,
+        "type": 0,
+        }
+    if guild_id is not None:
+        message["guild_id"] = str(guild_id)
+        message["member"] = member_payload()
+    return message
+
+
+def reaction_payload(message_id: int, channel_id: int, guild_id: int, user: Dict[str, Any], emoji: str) -> Dict[str, Any]:
+    return {
+        "user_id": user["id"],
+        "message_id": str(message_id),
+        "channel_id": str(channel_id),
+        "guild_id": str(guild_id),
+        "member": member_payload(user),
+        "emoji": {
+            "id": None,
+            "name": emoji
+            },
+        "burst": False,
+        "type": 0,
+        }
@@ -7,7 +7,8 @@ sys.path.insert(1, os.getcwd() + '/common')
 sys.path.insert(1, os.getcwd() + '/libs')
 sys.path.insert(1, os.getcwd())
 
-from typing import Callable, TypeVar, List, Optional, Final, Iterable, Type, Any
+from contextlib import contextmanager
+from typing import Callable, TypeVar, List, Optional, Final, Iterable, Iterator, Type, Any, Set, Tuple
 
 T = TypeVar("T")
 OUT = TypeVar("OUT")
@@ -172,11 +173,452 @@ def test_ramfs() -> Optional[Iterable[Exception]]:
 
     assertdir([], [])
 
+    # handles resolve once and survive their directory being removed and recreated
+    handle = testfs.handle("guild/caches/conf")
+
+    try:
+        must_raise(handle.read, FileNotFoundError)
+        handle.create(f_type=bytes, f_args=[8])
+        assert testfs.handle("guild/caches/conf") is handle, "handle was not memoized"
+        assert testfs.read_f("guild/caches/conf") == bytes(8)
+
+        testfs.rmdir("guild/caches")
+        must_raise(handle.read, FileNotFoundError)
+
+        testfs.create_f("guild/caches/conf", f_type=bytes, f_args=[4])
+        assert handle.read() == bytes(4), "handle read from a removed directory"
+        assert testfs.handle("guild/caches").ls() == (["conf"], [])
+
+        testfs.rmdir("guild")
+        assert testfs.handle("guild/caches/conf") is not handle, "handle outlived its top level directory"
+        must_raise(lambda: testfs.handle(dirlist=[]), FileNotFoundError)
+    except AssertionError as e:
+        errs.append(e)
+
+    assertdir([], [])
+
+    # ttl directories expire, and lru eviction only drops guild directories in least recently used order
+    try:
+        testfs.set_ttl("1/files/2", ttl=0)
+        testfs.set_ttl("1/files/3", ttl=3600)
+        assert testfs.expire() == 1 and testfs.ls("1/files") == ([], ["3"])
+
+        for guild in ("10", "20", "30"):
+            testfs.create_f(f"{guild}/caches/conf", f_type=bytes, f_args=[4096])
+        testfs.create_f("global/stats", f_type=bytes, f_args=[4096])
+        testfs.handle("10/caches/conf").read()
+
+        assert testfs.evict_lru(testfs.du()) == []
+        assert testfs.evict_lru(testfs.du() - 1) == ["1"], "least recently used guild was not evicted first"
+        assert testfs.evict_lru(testfs.du() - 8192) == ["20", "30"], "guilds were not evicted in lru order"
+        assert "global" in testfs.ls()[1] and "10" in testfs.ls()[1]
+    except AssertionError as e:
+        errs.append(e)
+
+    for directory in testfs.ls()[1]:
+        testfs.rmdir(directory)
+
+    # invalidate keeps entries whose producer version is current, drops stale and untagged entries
+    try:
+        testfs.create_f("7/caches/conf")
+        testfs.handle("7/caches/conf").tag("lib_a", 1)
+        testfs.create_f("7/regex/url")
+        testfs.tag("7/regex", producer="lib_b", version=1)
+        testfs.create_f("7/asam", f_type=dict)
+        testfs.tag("7/asam", producer="lib_a", version=2)
+        testfs.create_f("7/untagged")
+        must_raise(lambda: testfs.tag("7/missing", producer="lib_a"), FileNotFoundError)
+
+        assert testfs.invalidate(lambda producer, version: producer == "lib_a" and version != 1) == 2
+        assert testfs.ls("7") == ([], ["caches", "regex"]) and testfs.ls("7/caches") == (["conf"], [])
+        assert testfs.invalidate(lambda producer, version: producer == "lib_b") == 1 and testfs.ls("7") == ([], ["caches"])
+    except AssertionError as e:
+        errs.append(e)
+
+    for directory in testfs.ls()[1]:
+        testfs.rmdir(directory)
+
+    if errs: return errs
+    else: return None
+
+
+@try_or_return
+def test_blacklist_store() -> Optional[Iterable[Exception]]:
+
+    from contextlib import redirect_stdout, redirect_stderr
+    import tempfile
+
+    sink = io.StringIO()
+
+    # Reroute stderr and stdout to ignore import warnings from main
+    with redirect_stdout(sink):
+        with redirect_stderr(sink):
+            from main import blacklist_store  # pylint: disable=E0401
+
+    errs = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        snapshot, journal = f"{tmp}/blacklist.json", f"{tmp}/blacklist.journal"
+
+        store = blacklist_store(snapshot, journal)
+
+        try:
+            assert store.add("guild", 1) and store.add("user", 2) and store.add("user", 3)
+            assert not store.add("user", 2), "duplicate add was journaled"
+            assert store.remove("user", 3) and not store.remove("user", 3)
+            must_raise(lambda: store.add("channel", 4), KeyError)
+
+            # journal is replayed on load without a compaction having happened
+            with open(journal, "a", encoding="utf-8") as fp:
+                fp.write("+ user 5\n+ user\n")
+
+            reloaded = blacklist_store(snapshot, journal)
+            assert (reloaded.guild, reloaded.user) == ({1}, {2, 5}), f"{(reloaded.guild, reloaded.user)=}"
+
+            with open(journal, "r", encoding="utf-8") as fp:
+                assert fp.read() == "", "journal was not compacted on load"
+        except AssertionError as e:
+            errs.append(e)
+
     if errs: return errs
     else: return None
 
 
-testfuncs: List[Callable[[], Optional[Iterable[Exception]]]] = [test_parse_duration, test_ramfs]
+@try_or_return
+def test_latency_histogram() -> Optional[Iterable[Exception]]:
+
+    from contextlib import redirect_stdout, redirect_stderr
+
+    sink = io.StringIO()
+
+    # Reroute stderr and stdout to ignore import warnings from main
+    with redirect_stdout(sink):
+        with redirect_stderr(sink):
+            from main import latency_histogram  # pylint: disable=E0401
+
+    hist = latency_histogram()
+
+    for ms in range(1, 101):
+        hist.observe(ms / 1000)
+
+    out = []
+
+    try:
+        test_func_io(hist.percentile, 50, 0.05)
+        test_func_io(hist.percentile, 95, 0.1)
+        hist.observe(60.0)
+        test_func_io(hist.percentile, 100, 60.0)
+    except AssertionError as e:
+        out.append(e)
+
+    if out: return out
+    else: return None
+
+
+@try_or_return
+def test_reload_order() -> Optional[Iterable[Exception]]:
+
+    from contextlib import redirect_stdout, redirect_stderr
+
+    sink = io.StringIO()
+
+    # Reroute stderr and stdout to ignore import warnings from main
+    with redirect_stdout(sink):
+        with redirect_stderr(sink):
+            from main import _reload_order  # pylint: disable=E0401
+
+    graph = {"cmd_a": {"lib_b", "lib_c"}, "lib_b": {"lib_c"}, "lib_c": set(), "dlib_d": {"lib_b"}}
+
+    out = []
+
+    try:
+        test_func_io(lambda dirty: _reload_order(dirty, graph), {"cmd_a", "lib_b", "lib_c", "dlib_d"}, ["lib_c", "lib_b", "cmd_a", "dlib_d"])
+        test_func_io(lambda dirty: _reload_order(dirty, graph), {"cmd_a", "dlib_d"}, ["cmd_a", "dlib_d"])
+    except AssertionError as e:
+        out.append(e)
+
+    if out: return out
+    else: return None
+
+
+@try_or_return
+def test_gateway_policy() -> Optional[Iterable[Exception]]:
+
+    from contextlib import redirect_stdout, redirect_stderr
+
+    sink = io.StringIO()
+
+    with redirect_stdout(sink):
+        with redirect_stderr(sink):
+            from main import gateway_policy  # pylint: disable=E0401
+
+    import discord
+
+    def enabled(events: Set[str]) -> Tuple[List[str], bool]:
+        intents, _, chunk = gateway_policy(events)
+        return sorted(name for name, value in intents if value), chunk
+
+    def named(*names: str) -> List[str]:
+        # canonical names, emojis_and_stickers is expressions on newer discord.py
+        return sorted(name for name, value in discord.Intents(**{i: True for i in names}) if value)
+
+    # cache backing intents stay on, the emoji cache would otherwise freeze at its boot state
+    kernel = named("guilds", "guild_messages", "dm_messages", "message_content", "emojis_and_stickers", "voice_states", "guild_scheduled_events", "integrations", "invites", "webhooks")
+
+    out = []
+
+    try:
+        test_func_io(enabled, {"on-message", "on-ready"}, (kernel, False))
+        test_func_io(enabled, {"on-raw-reaction-add", "on-member-join"}, (sorted(kernel + ["dm_reactions", "guild_reactions", "members"]), False))
+        test_func_io(enabled, {"on-member-update"}, (sorted(kernel + ["members"]), True))
+    except AssertionError as e:
+        out.append(e)
+
+    if out: return out
+    else: return None
+
+
+@try_or_return
+def test_gateway_recorder() -> Optional[Iterable[Exception]]:
+
+    import tempfile
+    from contextlib import redirect_stdout, redirect_stderr
+
+    sink = io.StringIO()
+
+    with redirect_stdout(sink):
+        with redirect_stderr(sink):
+            from main import gateway_recorder, read_gateway_log  # pylint: disable=E0401
+
+    out = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "events.gz")
+
+        recorder = gateway_recorder(path)
+        recorder.record('{"op":11,"d":null}')
+        recorder.record('{"op":0,"t":"MESSAGE_CREATE","s":1,\n"d":{"content":"a\\nb"}}')
+        recorder.close()
+
+        try:
+            test_func_io(lambda p: [(name, data) for _, name, data in read_gateway_log(p)], path, [("MESSAGE_CREATE", {"content": "a\nb"})])
+        except AssertionError as e:
+            out.append(e)
+
+    if out: return out
+    else: return None
+
+
+@try_or_return
+def test_fair_scheduler() -> Optional[Iterable[Exception]]:
+
+    import asyncio
+    from contextlib import redirect_stdout, redirect_stderr
+
+    sink = io.StringIO()
+
+    with redirect_stdout(sink):
+        with redirect_stderr(sink):
+            from main import fair_scheduler  # pylint: disable=E0401
+
+    async def grant_order() -> List[str]:
+        sched = fair_scheduler(1, 3)
+        order: List[str] = []
+
+        async def event(guild: int, name: str) -> None:
+            slot = sched.try_acquire(guild) or await sched.wait(guild)
+            order.append(name)
+            await asyncio.sleep(0)
+            sched.release(slot)
+
+        # Guild 1 holds the only slot and queues three more events before guild 2 queues one
+        first = sched.try_acquire(1)
+        assert first is not None
+        tasks = [asyncio.create_task(event(1, f"a{i}")) for i in range(3)] + [asyncio.create_task(event(2, "b0"))]
+        await asyncio.sleep(0)
+        sched.release(first)
+        await asyncio.gather(*tasks)
+
+        return order
+
+    out = []
+
+    try:
+        test_func_io(lambda _: asyncio.run(grant_order()), None, ["a0", "b0", "a1", "a2"])
+    except AssertionError as e:
+        out.append(e)
+
+    if out: return out
+    else: return None
+
+
+@contextmanager
+def scratch_sonnetdb(**config: Any) -> Iterator[Any]:
+    """
+    Imports a private lib_sonnetdb on a scratch sqlite database, so tests never touch the configured database
+    config overrides further lib_sonnetconfig options, the imported lib_sonnetdb and lib_sonnetconfig are left as they were
+    """
+
+    import importlib, tempfile, shutil, queue
+    import lib_sonnetconfig  # pylint: disable=E0401
+
+    scratch = tempfile.mkdtemp(prefix="sonnet-manualtest-")
+    overrides = {"DB_TYPE": "sqlite3", "DB_SCHEMA": "per-guild", "SQLITE3_LOCATION": os.path.join(scratch, "sonnetdb.db"), **config}
+
+    saved_config = {k: getattr(lib_sonnetconfig, k) for k in overrides}
+    saved_module = sys.modules.pop("lib_sonnetdb", None)
+
+    try:
+        for k, v in overrides.items():
+            setattr(lib_sonnetconfig, k, v)
+        sonnetdb = importlib.import_module("lib_sonnetdb")
+    finally:
+        for k, v in saved_config.items():
+            setattr(lib_sonnetconfig, k, v)
+        sys.modules.pop("lib_sonnetdb", None)
+        if saved_module is not None:
+            sys.modules["lib_sonnetdb"] = saved_module
+
+    try:
+        yield sonnetdb
+    finally:
+        sonnetdb.flush_write_behind()
+        if sonnetdb._executor is not None:
+            sonnetdb._executor.shutdown()
+        while True:
+            try:
+                sonnetdb._pool._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        sonnetdb.db_connection.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+@try_or_return
+def test_write_behind() -> Optional[Iterable[Exception]]:
+
+    import asyncio
+
+    guild = 4242
+
+    async def staged_then_flushed() -> List[Any]:
+        db = lib_sonnetdb.async_db_hlapi(guild)
+        queue = lib_sonnetdb._write_behind
+
+        await db.add_config("prefix", "?")
+        await db.add_infraction("wbtest0", "1", "2", "warn", "[AUTOMOD] test", 0, True)
+        await db.add_infraction("wbtest1", "1", "2", "warn", "test", 0)
+        await db.delete_infraction("wbtest1")
+
+        # staged rows are visible to both apis before anything is committed
+        with lib_sonnetdb.db_hlapi(guild) as sdb:
+            staged = [
+                queue.size,
+                await db.grab_config("prefix"),
+                sdb.grab_config("prefix"),
+                sdb.grab_filter_infractions(user=1, automod=True, count=True),
+                sdb.grab_infraction("wbtest1"),
+                ]
+
+        # run() commits staged rows first
+        committed = await db.run(lambda d: (d.grab_config("prefix"), d.grab_filter_infractions(user=1, count=True)))
+
+        return staged + [committed, queue.size, queue.flushing]
+
+    out = []
+
+    with scratch_sonnetdb() as lib_sonnetdb:
+        try:
+            test_func_io(lambda _: asyncio.run(staged_then_flushed()), None, [3, "?", "?", 1, None, ("?", 1), 0, {}])
+        except AssertionError as e:
+            out.append(e)
+
+    if out: return out
+    else: return None
+
+
+@try_or_return
+def test_shared_schema() -> Optional[Iterable[Exception]]:
+
+    from lib_shared_schema import shared_schema_handler, split_table  # pylint: disable=E0401
+    from lib_sql_handler import db_handler  # pylint: disable=E0401
+
+    db = shared_schema_handler(db_handler(":memory:"))
+
+    for guild in (1, 2):
+        db.make_new_table(f"{guild}_config", [("property", tuple, 1), ("value", str)])
+        db.add_to_table(f"{guild}_config", [["property", "prefix"], ["value", f"p{guild}"]])
+    db.delete_table("1_config")
+    db.add_to_table("1_config", [["property", "prefix"], ["value", "again"]])
+
+    # guild index names map onto one shared index, deletes stay inside the guild
+    db.make_new_index("1_config", "1_config_value", ["value"])
+    db.make_new_index("2_config", "2_config_value", ["value"])
+    db.add_to_table("2_config", [["property", "suffix"], ["value", "s2"]])
+    db.multidelete_rows_from_table("2_config", [["property", "suffix"]])
+
+    # db_hlapi on the shared layout, mutes of every guild come from one table
+    with scratch_sonnetdb(DB_SCHEMA="shared") as sonnetdb:
+        for guild in (1, 2):
+            with sonnetdb.db_hlapi(guild) as hdb:
+                hdb.add_config("prefix", f"p{guild}")
+                hdb.mute_user(10 + guild, 0, f"m{guild}")
+        with sonnetdb.db_hlapi(None) as hdb:
+            mutes = sorted(hdb.fetch_all_mutes())
+        with sonnetdb.db_hlapi(2) as hdb:
+            prefix = hdb.grab_config("prefix")
+
+    out = []
+
+    try:
+        assert split_table("None_mutes") == (0, "mutes") and split_table("version_info") is None
+        assert db.list_tables("shared_config_value") == (("shared_config_value", ), ), f"{db.list_tables('shared_config_value')=}"
+        assert mutes == [("1", "m1", "11", 0), ("2", "m2", "12", 0)] and prefix == "p2", f"{mutes=} {prefix=}"
+        assert db.fetch_table("1_config") == (("prefix", "again"), ), f"{db.fetch_table('1_config')=}"
+        assert db.fetch_table("2_config") == (("prefix", "p2"), ), f"{db.fetch_table('2_config')=}"
+        assert db.list_tables("%_config") == (("1_config", ), ("2_config", )), f"{db.list_tables('%_config')=}"
+        # rows come back in insertion order, guild 1 was written last
+        assert sorted(db.fetch_all_guilds("config")) == [("1", "prefix", "again"), ("2", "prefix", "p2")], f"{db.fetch_all_guilds('config')=}"
+    except AssertionError as e:
+        out.append(e)
+
+    if out: return out
+    else: return None
+
+
+@try_or_return
+def test_index_registry() -> Optional[Iterable[Exception]]:
+
+    table = "4343_infractions"
+
+    with scratch_sonnetdb() as sonnetdb:
+        with sonnetdb.db_hlapi(4343) as db:
+            db.create_guild_db()
+            created = table in sonnetdb._indexed_tables
+            # a table this process has not seen is picked up by the verifier
+            sonnetdb._indexed_tables.discard(table)
+            checked = db.verify_infraction_indexes()
+            indexes = {i[0] for i in db._db.list_tables(f"{table}_%")}
+            expected = {f"{table}_{i}" for i in sonnetdb._infraction_indexes}
+            registered = table in sonnetdb._indexed_tables
+
+    out = []
+
+    try:
+        assert created and registered and checked == 1, f"{created=} {registered=} {checked=}"
+        assert expected <= indexes, f"{indexes=}"
+    except AssertionError as e:
+        out.append(e)
+
+    if out: return out
+    else: return None
+
+
+testfuncs: List[Callable[[], Optional[Iterable[Exception]]]] = [
+    test_parse_duration, test_ramfs, test_blacklist_store, test_latency_histogram, test_reload_order, test_gateway_policy, test_gateway_recorder, test_fair_scheduler, test_write_behind,
+    test_shared_schema, test_index_registry
+    ]
 
 
 def main_tests() -> None:
@@ -0,0 +1,137 @@
+import sys, os, json, hashlib, argparse
+
+sys.path.insert(1, os.getcwd() + "/libs")
+sys.path.insert(1, os.getcwd() + "/common")
+
+from typing import Any, Dict, List, Tuple
+
+from lib_sonnetconfig import DB_TYPE, SQLITE3_LOCATION
+from lib_shared_schema import shared_schema_handler, split_table
+
+if DB_TYPE == "mariadb":
+    from lib_mdb_handler import db_handler
+    with open(".login-info.txt", encoding="utf-8") as login_info_file:
+        db_connection_parameters: Any = json.load(login_info_file)
+else:
+    from lib_sql_handler import db_handler  # type: ignore[assignment]
+    db_connection_parameters = SQLITE3_LOCATION
+
+parser = argparse.ArgumentParser(
+    description="Copies a per-guild database into the shared schema layout (DB_SCHEMA = \"shared\")",
+    epilog="""Online migration: run this while the bot is still on the per-guild layout, every table is copied in its own transaction so the bot keeps running.
+Then stop the bot and run it again, only tables that changed since the last run are copied. Set DB_SCHEMA = "shared" and start the bot.
+Once the bot runs on the shared layout, --drop removes per-guild tables that are unchanged since they were copied."""
+    )
+parser.add_argument("--progress", default="datastore/shared_schema_migration.json", help="file recording what has been copied (default datastore/shared_schema_migration.json)")
+parser.add_argument("--drop", action="store_true", help="drop per-guild tables that were copied and have not changed since, copies nothing")
+parsed = parser.parse_args()
+
+# Column types as db_handler.make_new_table takes them, primary keys are VARCHAR since mariadb can not key TEXT
+typemap: Dict[str, Any] = {"VARCHAR": tuple, "TEXT": str, "INT": int(64)}
+
+
+def table_columns(db: Any, table: str) -> List[Tuple[Any, ...]]:
+    """
+    Reads the schema of a per-guild table, empty if the name is not a table
+    """
+
+    columns: List[Tuple[Any, ...]] = []
+
+    if DB_TYPE == "mariadb":
+        db.cur.execute(f"SHOW COLUMNS FROM {table}")
+        described = [(i[0], i[1], i[3] == "PRI") for i in db.cur]
+    else:
+        db.cur.execute(f"PRAGMA table_info('{table}')")
+        described = [(i[1], i[2], i[5] > 0) for i in db.cur.fetchall()]
+
+    for name, sqltype, primary in described:
+        typ = next((v for k, v in typemap.items() if k in str(sqltype).upper()), str)
+        columns.append((name, typ, 1) if primary else (name, typ))
+
+    return columns
+
+
+def digest(rows: Tuple[Any, ...]) -> str:
+    return hashlib.sha256(repr(rows).encode("utf8")).hexdigest()
+
+
+source = db_handler(db_connection_parameters)
+dest = shared_schema_handler(db_handler(db_connection_parameters))
+
+progress: Dict[str, str] = {}
+if os.path.isfile(parsed.progress):
+    with open(parsed.progress, encoding="utf-8") as fp:
+        progress = json.load(fp)
+
+# Every per guild table, the LIKE also matches indexes on sqlite so names without columns are skipped
+schemas: Dict[str, List[Tuple[Any, ...]]] = {}
+for (table, ) in source.list_tables("%"):
+    if split_table(table) is not None and (columns := table_columns(source, table)):
+        schemas[table] = columns
+
+if parsed.drop:
+    dropped = 0
+    for table in schemas:
+        if table in progress and progress[table] == digest(source.fetch_table(table)):
+            source.delete_table(table)
+            del progress[table]
+            dropped += 1
+    source.commit()
+
+    with open(parsed.progress, "w", encoding="utf-8") as fp:
+        json.dump(progress, fp)
+
+    print(f"Dropped {dropped} per-guild tables, {len(schemas) - dropped} were not copied or changed since")
+    sys.exit(0)
+
+# Shared tables take the widest schema seen for their name, guilds created before a column was added leave it empty
+widest: Dict[str, List[Tuple[Any, ...]]] = {}
+for table, columns in schemas.items():
+    _, name = split_table(table) or (0, table)
+    if len(columns) > len(widest.get(name, [])):
+        widest[name] = columns
+
+for name, columns in widest.items():
+    # the guild in the name only routes it to the shared table
+    dest.make_new_table(f"None_{name}", columns)
+dest.commit()
+
+copied = 0
+rows_copied = 0
+
+for table, columns in schemas.items():
+
+    rows = source.fetch_table(table)
+    rows_digest = digest(rows)
+
+    if progress.get(table) == rows_digest:
+        continue
+
+    # The guilds rows are replaced in one transaction, so a rerun picks up edits and deletes made since the last copy
+    dest.delete_table(table)
+    if rows:
+        dest.add_many_to_table(table, tuple(i[0] for i in columns), [tuple(i) for i in rows])
+
+    if len(dest.fetch_table(table)) != len(rows):
+        dest.rollback()
+        print(f"Copy of {table} did not verify, left out of the progress file")
+        continue
+
+    dest.commit()
+
+    progress[table] = rows_digest
+    copied += 1
+    rows_copied += len(rows)
+
+    # saved as it goes so an interrupted run resumes
+    if copied % 100 == 0:
+        with open(parsed.progress, "w", encoding="utf-8") as fp:
+            json.dump(progress, fp)
+
+with open(parsed.progress, "w", encoding="utf-8") as fp:
+    json.dump(progress, fp)
+
+print(f"Copied {copied} tables ({rows_copied} rows) into {len(widest)} shared tables, {len(schemas) - copied} were unchanged")
+
+source.close()
+dest.close()
@@ -0,0 +1,57 @@
+import io, time, asyncio, argparse
+
+from contextlib import redirect_stderr
+
+from fake_discord import fake_discord  # pylint: disable=E0401
+
+parser = argparse.ArgumentParser(description="Replays a gateway log recorded with main.py --record-events through the kernel, against a stubbed discord API and a scratch sqlite db")
+parser.add_argument("log", help="gzip gateway log to replay")
+parser.add_argument("--realtime", action="store_true", help="keep the recorded spacing between events instead of replaying as fast as possible")
+parsed = parser.parse_args()
+
+harness = fake_discord()
+
+
+async def replay() -> None:
+
+    await harness.start()
+
+    # Only measure the replay itself
+    harness.reset_metrics()
+
+    fed = 0
+    skipped = 0
+
+    tstart = time.monotonic()
+
+    for offset, name, data in harness.main.read_gateway_log(parsed.log):
+
+        if parsed.realtime and (delay := offset - (time.monotonic() - tstart)) > 0:
+            await asyncio.sleep(delay)
+
+        if harness.feed(name, data):
+            fed += 1
+        else:
+            skipped += 1
+
+        # Let dispatched handlers run between events like they would on a live connection
+        await asyncio.sleep(0)
+
+    await harness.drain()
+
+    tend = time.monotonic()
+
+    print(f"Replayed {fed} events in {(tend-tstart)*1000:.1f}ms ({fed/max(tend-tstart, 1e-9):.0f} events/second)")
+    print(f"Skipped {skipped} unknown events, {sum(harness.parse_errors.values())} events failed to parse")
+    if harness.parse_errors:
+        print("\n".join(f"{k}: {v} failed" for k, v in harness.parse_errors.items()))
+    print(harness.main.metrics.report())
+    if harness.api_calls:
+        print(f"API calls:\n{harness.api_report()}")
+
+
+try:
+    with redirect_stderr(io.StringIO()):
+        asyncio.run(replay())
+finally:
+    harness.close()
@@ -0,0 +1,36 @@
+# Scratch sonnet configs for build tools, so replays and benchmarks never touch the configured database
+# lib_sonnetconfig reloads sonnet_cfg when it is imported, which wipes attributes set on the module beforehand,
+# so overrides are written into a copy of the config that shadows common/sonnet_cfg.py on sys.path instead
+
+import sys, os
+
+from typing import Any
+
+
+def scratch_config(scratch: str, **overrides: Any) -> str:
+    """
+    Writes common/sonnet_cfg.py with overrides appended into the scratch directory and puts it first on sys.path
+    Must be called before lib_sonnetconfig is imported
+
+    :returns: str - The path of the scratch config
+    :raises: RuntimeError - lib_sonnetconfig was already imported, so the overrides would not apply
+    """
+
+    if "lib_sonnetconfig" in sys.modules:
+        raise RuntimeError("lib_sonnetconfig is already imported, scratch config would not apply")
+
+    with open(os.path.join(os.getcwd(), "common", "sonnet_cfg.py"), encoding="utf-8") as fp:
+        source = fp.read()
+
+    path = os.path.join(scratch, "sonnet_cfg.py")
+
+    with open(path, "w", encoding="utf-8") as fp:
+        fp.write(source)
+        fp.write("\n\n# Scratch overrides\n")
+        fp.write("".join(f"{k} = {v!r}\n" for k, v in overrides.items()))
+
+    sys.path.insert(0, scratch)
+    # an earlier import of the real config would otherwise be reloaded in place
+    sys.modules.pop("sonnet_cfg", None)
+
+    return path
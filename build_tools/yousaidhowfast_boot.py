@@ -0,0 +1,51 @@
+import sys, os, subprocess, statistics
+
+# Each boot runs in a fresh interpreter so imports are not cached between runs
+boot_script = """
+import sys, os, io, time
+tstart = time.monotonic()
+
+sys.path.insert(1, os.getcwd())
+
+from contextlib import redirect_stdout, redirect_stderr
+
+with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+    import main
+    main.module_manifest_path = sys.argv[1]
+    main.kernel_load_command_modules()
+
+print(time.monotonic() - tstart)
+"""
+
+manifest = "common/module_manifest.bench.json"
+
+count = 5
+
+
+def boot() -> float:
+    out = subprocess.run([sys.executable, "-c", boot_script, manifest], capture_output=True, check=True, text=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def bench(name: str, cold: bool) -> None:
+
+    times = []
+
+    for _ in range(count):
+        if cold and os.path.isfile(manifest):
+            os.remove(manifest)
+        times.append(boot())
+
+    print(f"{name}:")
+    print(f"  Median boot to modules loaded: {statistics.median(times)*1000:.1f}ms")
+    print(f"  Fastest: {min(times)*1000:.1f}ms")
+
+
+print(f"Boots per run: {count}")
+
+try:
+    bench("Eager (no manifest)", cold=True)
+    bench("Lazy (manifest present)", cold=False)
+finally:
+    if os.path.isfile(manifest):
+        os.remove(manifest)
@@ -0,0 +1,94 @@
+import sys, os, subprocess, tempfile, shutil, json
+
+from typing import Any, Dict, List, Tuple
+
+# Each mode runs in a fresh interpreter with its own scratch config and database, sqlite3 settings are read once at import
+bench_script = """
+import sys, os, time, json
+sys.path.insert(1, os.getcwd() + "/libs")
+sys.path.insert(1, os.getcwd() + "/common")
+sys.path.insert(1, os.getcwd() + "/build_tools")
+
+from scratch_config import scratch_config
+
+settings = json.loads(sys.argv[1])
+scratch_config(sys.argv[3], **settings)
+
+# a mode that silently ran on the configured settings or database would measure nothing
+import lib_sonnetconfig
+for k, v in settings.items():
+    assert getattr(lib_sonnetconfig, k) == v, f"{k}={getattr(lib_sonnetconfig, k)!r}, expected {v!r}"
+
+import lib_sonnetdb
+from lib_db_obfuscator import db_hlapi
+
+lib_sonnetdb.db_connection.cur.execute("PRAGMA journal_mode")
+journal_mode = lib_sonnetdb.db_connection.cur.fetchone()[0]
+lib_sonnetdb.db_connection.cur.execute("PRAGMA synchronous")
+synchronous = ["OFF", "NORMAL", "FULL", "EXTRA"][lib_sonnetdb.db_connection.cur.fetchone()[0]]
+
+guilds = [1000 + i for i in range(10)]
+count = int(sys.argv[2])
+
+for g in guilds:
+    with db_hlapi(g) as db:
+        db.add_config("prefix", "!")
+
+# One db_hlapi per write like the moderation commands, so every infraction is its own commit
+tstart = time.perf_counter()
+for n in range(count):
+    with db_hlapi(guilds[n % len(guilds)]) as db:
+        db.add_infraction(f"{n:016x}", "1", "2", "warn", "benchmark", 0)
+infraction_time = time.perf_counter() - tstart
+
+tstart = time.perf_counter()
+for n in range(count):
+    with db_hlapi(guilds[n % len(guilds)]) as db:
+        db.grab_config("prefix")
+config_time = time.perf_counter() - tstart
+
+print(json.dumps([infraction_time, config_time, journal_mode, synchronous]))
+"""
+
+count = 2000
+
+modes: List[Tuple[str, Dict[str, Any]]] = [
+    ("Baseline (journal DELETE, synchronous FULL)", {
+        "SQLITE3_JOURNAL_MODE": "DELETE",
+        "SQLITE3_SYNCHRONOUS": "FULL",
+        "SQLITE3_CACHE_SIZE": -2000
+        }),
+    ("Tuned, sync commit policy (WAL, synchronous FULL)", {
+        "SQLITE3_COMMIT_POLICY": "sync"
+        }),
+    ("Tuned, group commit policy (WAL, synchronous NORMAL)", {
+        "SQLITE3_COMMIT_POLICY": "group"
+        }),
+    ]
+
+
+def bench(name: str, settings: Dict[str, Any]) -> None:
+
+    scratch = tempfile.mkdtemp(prefix="sonnet-db-bench-")
+    settings = {"DB_TYPE": "sqlite3", "DB_SCHEMA": "per-guild", "SQLITE3_LOCATION": os.path.join(scratch, "sonnetdb.db"), **settings}
+
+    try:
+        out = subprocess.run([sys.executable, "-c", bench_script, json.dumps(settings), str(count), scratch], capture_output=True, text=True)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if out.returncode != 0:
+        raise RuntimeError(f"{name} failed:\n{out.stderr}")
+
+    infraction_time, config_time, journal_mode, synchronous = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print(f"{name}:")
+    print(f"  journal_mode={journal_mode} synchronous={synchronous}")
+    print(f"  add_infraction: {infraction_time/count*1e6:.1f}us/op ({count/infraction_time:.0f} ops/second)")
+    print(f"  grab_config: {config_time/count*1e6:.1f}us/op ({count/config_time:.0f} ops/second)")
+
+
+print(f"Operations per path: {count}")
+
+for mode in modes:
+    bench(*mode)
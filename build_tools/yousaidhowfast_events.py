@@ -0,0 +1,85 @@
+import sys, os, time, io, asyncio
+
+sys.path.insert(1, os.getcwd() + "/libs")
+sys.path.insert(1, os.getcwd() + "/common")
+sys.path.insert(1, os.getcwd())
+
+from contextlib import redirect_stdout, redirect_stderr
+from typing import Any, Optional, Tuple, List
+
+# Reroute stderr and stdout to ignore import warnings from main
+with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+    import main  # pylint: disable=E0401
+
+from lib_lexdpyk_h import ToKernelArgs, KernelArgs
+
+
+async def kwargs_handler(message: Any, **kargs: Any) -> None:
+    kargs["ramfs"]
+
+
+@ToKernelArgs
+async def kargs_handler(message: Any, kargs: KernelArgs) -> None:
+    kargs.ramfs
+
+
+# on-message mirrors a typical sonnet load, one handler per tier and one fanned out tier
+main.dynamiclib_modules_exec_dict = {"on-message": [[kargs_handler], [kwargs_handler], [kwargs_handler, kargs_handler]]}
+main.compile_event_dispatch()
+
+
+# The pre 2.1 dispatcher, kept here to compare against
+async def legacy_do_event_return_error(event: Any, args: Tuple[Any, ...]) -> Optional[Exception]:
+    try:
+        await event(
+            *args,
+            client=main.Client,
+            ramfs=main.ramfs,
+            bot_start=main.bot_start_time,
+            command_modules=[main.command_modules, main.command_modules_dict],
+            dynamiclib_modules=[main.dynamiclib_modules, main.dynamiclib_modules_dict],
+            kernel_version=main.version_info,
+            kernel_ramfs=main.kernel_ramfs
+            )
+        return None
+    except Exception as e:
+        return e
+
+
+async def legacy_event_call(argtype: str, *args: Any) -> None:
+
+    etypes: List[Exception] = []
+
+    for ftable in main.dynamiclib_modules_exec_dict[argtype]:
+        tasks = [asyncio.create_task(legacy_do_event_return_error(func, args)) for func in ftable]
+
+        for i in tasks:
+            if e := (await i):
+                etypes.append(e)
+
+
+count = 100000
+
+
+async def bench(name: str, call: Any) -> None:
+
+    tstart = time.time()
+
+    for _ in range(count):
+        await call("on-message", None)
+
+    tend = time.time()
+
+    print(f"{name}:")
+    print(f"  Total time took: {round(100000*(tend-tstart))/100}ms")
+    print(f"  Time per event: {round((tend-tstart)/count*1000000000)/1000}us")
+    print(f"  Events/second: {round(count/(tend-tstart))}")
+
+
+async def run() -> None:
+    await bench("Legacy dispatcher (before)", legacy_event_call)
+    await bench("Compiled dispatcher (after)", main.event_call)
+
+
+print(f"Events dispatched per run: {count}")
+asyncio.run(run())
@@ -0,0 +1,142 @@
+import io, time, asyncio, argparse, random
+
+from contextlib import redirect_stderr
+from typing import Any, Callable, Dict, List
+
+from fake_discord import fake_discord, user_payload, ready_payload, guild_payload, message_payload, reaction_payload, member_payload  # pylint: disable=E0401
+
+parser = argparse.ArgumentParser(description="Generates synthetic traffic across fake guilds and runs it through the real kernel and modules")
+parser.add_argument("--guilds", type=int, default=20, help="number of synthetic guilds (default 20)")
+parser.add_argument("--members", type=int, default=50, help="members per guild (default 50)")
+parser.add_argument("--channels", type=int, default=3, help="channels per guild (default 3)")
+parser.add_argument("--events", type=int, default=20000, help="traffic events to generate, a spam burst counts as one (default 20000)")
+parser.add_argument("--mix", default="chat=80,spam=4,blacklist=6,reaction=7,join=3", help="relative weights of chat, spam, blacklist, reaction and join traffic")
+parser.add_argument("--rate", type=float, default=None, help="target events per second, default sends as fast as the kernel keeps up")
+parser.add_argument("--seed", type=int, default=0)
+parsed = parser.parse_args()
+
+random.seed(parsed.seed)
+
+blacklisted_word = "loadtestbadword"
+spam_burst = 6
+words = "the quick brown fox jumps over lazy dog sonnet kernel event message guild channel member role".split()
+
+harness = fake_discord()
+
+bot = user_payload(1 << 40, "sonnet", bot=True)
+guilds: List[Dict[str, Any]] = []
+
+for g in range(parsed.guilds):
+    gid = harness.snowflake()
+    members = [user_payload(harness.snowflake(), f"user{g}-{m}") for m in range(parsed.members)]
+    guilds.append({"id": gid, "channels": [harness.snowflake() for _ in range(parsed.channels)], "members": members, "recent": []})
+
+# Every guild blacklists one word and mutes at 4 messages a second, so blacklist and spam traffic reaches automod
+from lib_db_obfuscator import db_hlapi  # pylint: disable=E0401
+
+for guild in guilds:
+    with db_hlapi(guild["id"]) as db:
+        db.add_config("word-blacklist", blacklisted_word)
+        db.add_config("antispam", "4,1")
+
+sent_messages = 0
+
+
+def send_message(guild: Dict[str, Any], channel: int, author: Dict[str, Any], content: str) -> None:
+    global sent_messages
+    message_id = harness.snowflake()
+    harness.feed("MESSAGE_CREATE", message_payload(message_id, channel, guild["id"], author, content))
+    guild["recent"] = (guild["recent"] + [(channel, message_id)])[-50:]
+    sent_messages += 1
+
+
+def chat(guild: Dict[str, Any]) -> None:
+    send_message(guild, random.choice(guild["channels"]), random.choice(guild["members"]), " ".join(random.choices(words, k=random.randint(1, 12))))
+
+
+def spam(guild: Dict[str, Any]) -> None:
+    channel, author = random.choice(guild["channels"]), random.choice(guild["members"])
+    for _ in range(spam_burst):
+        send_message(guild, channel, author, "spam spam spam")
+
+
+def blacklist(guild: Dict[str, Any]) -> None:
+    send_message(guild, random.choice(guild["channels"]), random.choice(guild["members"]), f"this has {blacklisted_word} in it")
+
+
+def reaction(guild: Dict[str, Any]) -> None:
+    if not guild["recent"]:
+        return chat(guild)
+    channel, message_id = random.choice(guild["recent"])
+    harness.feed("MESSAGE_REACTION_ADD", reaction_payload(message_id, channel, guild["id"], random.choice(guild["members"]), "⭐"))
+
+
+def join(guild: Dict[str, Any]) -> None:
+    user = user_payload(harness.snowflake(), f"joiner{len(guild['members'])}")
+    guild["members"].append(user)
+    harness.feed("GUILD_MEMBER_ADD", member_payload(user, guild["id"]))
+
+
+traffic: Dict[str, Callable[[Dict[str, Any]], None]] = {"chat": chat, "spam": spam, "blacklist": blacklist, "reaction": reaction, "join": join}
+
+mix: Dict[str, float] = {}
+for part in parsed.mix.split(","):
+    name, weight = part.split("=")
+    if name not in traffic:
+        raise SystemExit(f"Unknown traffic type {name}, expected one of {', '.join(traffic)}")
+    mix[name] = float(weight)
+
+
+async def run() -> None:
+
+    await harness.start()
+
+    harness.feed("READY", ready_payload(bot, [g["id"] for g in guilds]))
+    for guild in guilds:
+        harness.feed("GUILD_CREATE", guild_payload(guild["id"], guild["members"][0]["id"], guild["channels"], guild["members"]))
+    await harness.drain()
+
+    # Only measure the generated traffic
+    harness.reset_metrics()
+
+    kinds = random.choices(list(mix), weights=list(mix.values()), k=parsed.events)
+
+    tstart = time.monotonic()
+
+    for n, kind in enumerate(kinds):
+
+        if parsed.rate is not None and (delay := n / parsed.rate - (time.monotonic() - tstart)) > 0:
+            await asyncio.sleep(delay)
+
+        traffic[kind](random.choice(guilds))
+
+        # Let dispatched handlers run between events like they would on a live connection
+        await asyncio.sleep(0)
+
+    await harness.drain()
+
+    tend = time.monotonic()
+
+    elapsed = max(tend - tstart, 1e-9)
+
+    print(f"Guilds: {parsed.guilds}, members per guild: {parsed.members}, mix: {parsed.mix}")
+    print(f"Generated {parsed.events} events ({sent_messages} messages) in {elapsed*1000:.1f}ms")
+    print(f"  Sustained messages/second: {sent_messages/elapsed:.0f}")
+    print(f"  Events/second: {parsed.events/elapsed:.0f}")
+
+    if (hist := harness.main.metrics.events.get("on-message")) is not None:
+        print(f"  on-message latency: p50={hist.percentile(50)*1000:.2f}ms p95={hist.percentile(95)*1000:.2f}ms p99={hist.percentile(99)*1000:.2f}ms max={hist.max*1000:.2f}ms")
+
+    print(f"  Messages sent by modules: {sum(len(i) for i in harness.sent.values())}")
+    print(harness.main.metrics.report())
+    if harness.api_calls:
+        print(f"API calls:\n{harness.api_report()}")
+
+
+print(f"Running {parsed.events} synthetic events")
+
+try:
+    with redirect_stderr(io.StringIO()):
+        asyncio.run(run())
+finally:
+    harness.close()
@@ -1,30 +1,12 @@
 # Administration commands.
 # bredo, 2020
 
-import importlib
-
 import discord, os, glob
 import json, gzip, io, time, math
 
-import lib_db_obfuscator
-
-importlib.reload(lib_db_obfuscator)
 import lib_parsers
-
-importlib.reload(lib_parsers)
-import lib_loaders
-
-importlib.reload(lib_loaders)
-import lib_sonnetconfig
-
-importlib.reload(lib_sonnetconfig)
 import lib_sonnetcommands
 
-importlib.reload(lib_sonnetcommands)
-import lib_constants
-
-importlib.reload(lib_constants)
-
 from lib_parsers import parse_boolean_strict, update_log_channel, parse_role, paginate_noexcept
 from lib_loaders import load_embed_color, embed_colors
 from lib_db_obfuscator import db_hlapi
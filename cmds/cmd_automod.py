@@ -4,25 +4,10 @@ import importlib
 
 import json, io, discord, string
 
-import lib_db_obfuscator
-
-importlib.reload(lib_db_obfuscator)
 import lib_parsers
-
-importlib.reload(lib_parsers)
-import lib_sonnetconfig
-
-importlib.reload(lib_sonnetconfig)
-import lib_constants
-
-importlib.reload(lib_constants)
 import lib_goparsers
-
-importlib.reload(lib_goparsers)
 import lib_sonnetcommands
 
-importlib.reload(lib_sonnetcommands)
-
 from lib_goparsers import MustParseDuration
 from lib_db_obfuscator import db_hlapi
 from lib_sonnetconfig import REGEX_VERSION, AUTOMOD_ENABLED
@@ -5,31 +5,9 @@ import importlib
 
 import discord, time, math, io, shlex
 
-import lib_db_obfuscator
-
-importlib.reload(lib_db_obfuscator)
-import lib_loaders
-
-importlib.reload(lib_loaders)
-import lib_parsers
-
-importlib.reload(lib_parsers)
-import lib_constants
-
-importlib.reload(lib_constants)
-import lib_sonnetconfig
-
-importlib.reload(lib_sonnetconfig)
 import lib_sonnetcommands
-
-importlib.reload(lib_sonnetcommands)
 import lib_tparse
 
-importlib.reload(lib_tparse)
-import lib_datetimeplus
-
-importlib.reload(lib_datetimeplus)
-
 from lib_loaders import load_embed_color, embed_colors
 from lib_db_obfuscator import db_hlapi
 from lib_parsers import format_duration, paginate_noexcept
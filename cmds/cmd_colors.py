@@ -1,17 +1,8 @@
 # Set colors of embeds dynamically
 # Ultrabear 2021
 
-import importlib
-
 import discord
 
-import lib_db_obfuscator
-
-importlib.reload(lib_db_obfuscator)
-import lib_loaders
-
-importlib.reload(lib_loaders)
-
 from lib_db_obfuscator import db_hlapi
 from lib_loaders import load_embed_color, embed_colors
 
@@ -9,7 +9,7 @@ import lib_sonnetcommands
 
 from lib_goparsers import ParseDurationSuper
 from lib_loaders import generate_infractionid, load_embed_color, load_message_config, embed_colors, datetime_now
-from lib_db_obfuscator import db_hlapi
+from lib_db_obfuscator import db_hlapi, async_db_hlapi
 from lib_parsers import parse_user_member_noexcept, format_duration, parse_core_permissions, parse_boolean_strict
 from lib_compatibility import user_avatar_url, to_snowflake, GuildMessageable
 from lib_sonnetconfig import BOT_NAME
@@ -76,29 +76,32 @@ async def log_infraction(
     generated_id: str
     log_channel: Optional[discord.TextChannel]
 
-    with db_hlapi(message.guild.id) as db:
+    db = async_db_hlapi(message.guild.id)
 
-        iterations: int = 0
-        iter_limit: Final[int] = 10_000
-        # Infraction id collision test
-        while db.grab_infraction(generated_id := generate_infractionid()):
-            iterations += 1
-            if iterations > iter_limit:
-                raise lib_sonnetcommands.CommandError(
-                    "ERROR: Failed to generate a unique infraction ID after {iter_limit} attempts\n(Do you have too many infractions/too small of a wordlist installed?)"
-                    )
-
-        # Grab log channel
-        try:
-            chan: int = int(db.grab_config("infraction-log") or "0")
-        except ValueError:
-            chan = 0
+    iterations: int = 0
+    iter_limit: Final[int] = 10_000
+
+    # Infraction id collision test, ids are generated here and not on a database worker, generating one may have to build the wordlist cache first
+    generated_id = generate_infractionid()
+    while await db.grab_infraction(generated_id) is not None:
+        iterations += 1
+        if iterations > iter_limit:
+            raise lib_sonnetcommands.CommandError("ERROR: Failed to generate a unique infraction ID after {iter_limit} attempts\n(Do you have too many infractions/too small of a wordlist installed?)")
+        generated_id = generate_infractionid()
 
-        c = client.get_channel(chan)
-        log_channel = c if isinstance(c, discord.TextChannel) else None
+    # Send infraction to the write-behind queue, nothing awaits between the collision test and staging so no other infraction can take the id
+    await db.add_infraction(generated_id, str(user.id), str(moderator.id), i_type, i_reason, int(timestamp.timestamp()))
+
+    infraction_log = await db.grab_config("infraction-log")
+
+    # Grab log channel
+    try:
+        chan: int = int(infraction_log or "0")
+    except ValueError:
+        chan = 0
 
-        # Send infraction to database
-        db.add_infraction(generated_id, str(user.id), str(moderator.id), i_type, i_reason, int(timestamp.timestamp()))
+    c = client.get_channel(chan)
+    log_channel = c if isinstance(c, discord.TextChannel) else None
 
     if log_channel:
 
@@ -788,4 +791,4 @@ commands = {
             }
     }
 
-version_info: str = "2.0.2"
+version_info: str = "2.0.4"
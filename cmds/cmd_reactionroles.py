@@ -1,24 +1,9 @@
 # Reactionroles settings
 # Ultrabear 2021
 
-import importlib
-
 import discord
 import json, io, asyncio
 
-import lib_db_obfuscator
-
-importlib.reload(lib_db_obfuscator)
-import lib_parsers
-
-importlib.reload(lib_parsers)
-import lib_loaders
-
-importlib.reload(lib_loaders)
-import lib_compatibility
-
-importlib.reload(lib_compatibility)
-
 from lib_db_obfuscator import db_hlapi
 from lib_parsers import parse_channel_message_noexcept
 from lib_loaders import load_embed_color, embed_colors
@@ -1,26 +1,10 @@
 # Starboard system
 # Ultrabear 2020
 
-import importlib
-
 import discord
 
-import lib_db_obfuscator
-
-importlib.reload(lib_db_obfuscator)
 import lib_parsers
 
-importlib.reload(lib_parsers)
-import lib_constants
-
-importlib.reload(lib_constants)
-import lib_loaders
-
-importlib.reload(lib_loaders)
-import lib_starboard
-
-importlib.reload(lib_starboard)
-
 from lib_starboard import starboard_cache, build_starboard_embed
 from lib_parsers import parse_boolean_strict, update_log_channel, parse_channel_message
 from lib_loaders import load_message_config
@@ -144,7 +128,7 @@ commands: Dict[str, Dict[str, Any]] = {
             'pretty_name': 'starboard-channel <channel>',
             'description': 'Change Starboard channel',
             'permission': 'administrator',
-            'cache': 'direct:(f)caches/sonnet_starboard',
+            'cache': 'direct:(f)caches/sonnet_starboard;(f)caches/starboard_trigger',
             'execute': starboard_channel_change
             },
     'starboard-emoji':
@@ -152,7 +136,7 @@ commands: Dict[str, Dict[str, Any]] = {
             'pretty_name': 'starboard-emoji <emoji>',
             'description': 'Set the starboard emoji',
             'permission': 'administrator',
-            'cache': 'direct:(f)caches/sonnet_starboard',
+            'cache': 'direct:(f)caches/sonnet_starboard;(f)caches/starboard_trigger',
             'execute': set_starboard_emoji
             },
     'starboard-enabled':
@@ -160,7 +144,7 @@ commands: Dict[str, Dict[str, Any]] = {
             'pretty_name': 'starboard-enabled <bool>',
             'description': 'Toggle starboard on or off',
             'permission': 'administrator',
-            'cache': 'direct:(f)caches/sonnet_starboard',
+            'cache': 'direct:(f)caches/sonnet_starboard;(f)caches/starboard_trigger',
             'execute': set_starboard_use
             },
     'starboard-count':
@@ -168,7 +152,7 @@ commands: Dict[str, Dict[str, Any]] = {
             'pretty_name': 'starboard-count <number>',
             'description': 'Set starboard reaction count threshold',
             'permission': 'administrator',
-            'cache': 'direct:(f)caches/sonnet_starboard',
+            'cache': 'direct:(f)caches/sonnet_starboard;(f)caches/starboard_trigger',
             'execute': set_starboard_count
             },
     'starboard-forceboard':
@@ -181,4 +165,4 @@ commands: Dict[str, Dict[str, Any]] = {
             },
     }
 
-version_info: str = "1.2.14"
+version_info: str = "1.2.15"
@@ -2,7 +2,6 @@
 # Funey, 2020
 
 import asyncio
-import importlib
 import io
 import random
 import time
@@ -10,37 +9,9 @@ import contextlib
 from datetime import datetime
 
 import discord
-import lib_db_obfuscator
-
-importlib.reload(lib_db_obfuscator)
-import lib_parsers
-
-importlib.reload(lib_parsers)
-import lib_loaders
-
-importlib.reload(lib_loaders)
-import lib_constants
-
-importlib.reload(lib_constants)
-import lib_lexdpyk_h
-
-importlib.reload(lib_lexdpyk_h)
-import lib_compatibility
-
-importlib.reload(lib_compatibility)
 import lib_sonnetcommands
-
-importlib.reload(lib_sonnetcommands)
-import lib_sonnetconfig
-
-importlib.reload(lib_sonnetconfig)
 import lib_tparse
 
-importlib.reload(lib_tparse)
-import lib_datetimeplus
-
-importlib.reload(lib_datetimeplus)
-
 from typing import Any, Final, List, Optional, Tuple, Dict, Literal, Union
 
 import lib_constants as constants
@@ -74,7 +45,19 @@ async def ping_function(message: discord.Message, args: List[str], client: disco
     add_timestamp(ping_embed, "Total Process Time", stats["start"], stats["end"])
     add_timestamp(ping_embed, "Config Load Time", stats["start-load-blacklist"], stats["end-load-blacklist"])
     add_timestamp(ping_embed, "Automod Process Time", stats["start-automod"], stats["end-automod"])
-    add_timestamp(ping_embed, "WS Latency", 0, ctime(client.latency))
+
+    if isinstance(client, discord.AutoShardedClient) and (shard := client.get_shard(message.guild.shard_id)) is not None:
+        add_timestamp(ping_embed, f"WS Latency (Shard {shard.id}/{shard.shard_count})", 0, ctime(shard.latency))
+
+        try:
+            shard_stats = kwargs["kernel_ramfs"].read_f("global/shard_summary")().get(shard.id)
+        except FileNotFoundError:
+            shard_stats = None
+
+        if shard_stats is not None and shard_stats["events"]:
+            ping_embed.add_field(name="Shard Events", value=f"{shard_stats['events_per_second']:.2f}/s, p50 {shard_stats['p50']*1000:.2f}ms, p95 {shard_stats['p95']*1000:.2f}ms", inline=False)
+    else:
+        add_timestamp(ping_embed, "WS Latency", 0, ctime(client.latency))
 
     send_start = ctime(time.time())
     sent_message = await message.channel.send(embed=ping_embed)
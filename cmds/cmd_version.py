@@ -1,29 +1,16 @@
 # Version printing tools
 # Ultrabear 2020
 
-import importlib
-
 import discord
 import io
 import platform
 
-import lib_loaders
-
-importlib.reload(lib_loaders)
 import lib_goparsers
 
-importlib.reload(lib_goparsers)
-import lib_lexdpyk_h
-
-importlib.reload(lib_lexdpyk_h)
-import lib_datetimeplus
-
-importlib.reload(lib_datetimeplus)
-
 from lib_loaders import clib_exists, DotHeaders
 from lib_datetimeplus import Time
 
-from typing import List, Any, Union, Final
+from typing import List, Any, Union, Final, Dict
 import lib_lexdpyk_h as lexdpyk
 
 LAST_LOAD: Final = Time.now()
@@ -142,7 +129,20 @@ async def print_stats(message: discord.Message, args: List[str], client: discord
 
     writer.write(f"```py\n{newline.join(prettyprint(outputmap))}\n")
 
-    writer.write(f"\nThis guild has sent {round(1000*(guild_total/global_total))/10}% ({guild_total}/{global_total}) of total processed events since boot```")
+    writer.write(f"\nThis guild has sent {round(1000*(guild_total/global_total))/10}% ({guild_total}/{global_total}) of total processed events since boot")
+
+    try:
+        shards: Dict[int, Dict[str, float]] = kernel_ramfs.read_f("global/shard_summary")()
+    except FileNotFoundError:
+        shards = {}
+
+    if shards:
+        shardmap: List[List[Any]] = [["Shard:", "Events:", "Events/s:", "p95:", "WS Latency:"]]
+        for shard_id, sstats in sorted(shards.items()):
+            shardmap.append([shard_id, sstats.get("events", 0), f"{sstats.get('events_per_second', 0.0):.2f}", f"{sstats.get('p95', 0.0)*1000:.2f}ms", f"{sstats['gateway_latency']*1000:.0f}ms"])
+        writer.write(f"\n\n{newline.join(prettyprint(shardmap))}")
+
+    writer.write("```")
 
     await message.channel.send(writer.getvalue())
 
@@ -2,3 +2,12 @@
 
 # Owner
 BOT_OWNER = ""
+
+# Gateway intents, None derives the set from the events loaded modules handle on top of the low volume intents that keep client caches current
+# or a list of discord.Intents flag names to always use, e.g. ["guilds", "guild_messages", "message_content", "members", "emojis_and_stickers"]
+# without emojis_and_stickers the emoji cache is frozen at startup and reaction roles can not use emoji added later
+GATEWAY_INTENTS = None
+
+# Whether to request every guild's member list at startup, None does so only when a module handles
+# member update or remove events (discord only sends those for cached members)
+CHUNK_GUILDS_AT_STARTUP = None
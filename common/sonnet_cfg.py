@@ -11,8 +11,28 @@ STARBOARD_COUNT = "5"
 
 # chose between using mariadb or sqlite3
 DB_TYPE = "mariadb"
+# "per-guild" keeps each guild in its own tables, "shared" keeps all guilds in a few tables keyed by guild id
+# build_tools/migrate_shared_schema.py moves an existing per-guild database over
+DB_SCHEMA = "per-guild"
 # only needs to be set if using sqlite3 db in sonnet mode, mariadb login is stored in .login-info.txt
 SQLITE3_LOCATION = "datastore/sonnetdb.db"
+# database connections (and worker threads) kept for async database calls
+DB_POOL_SIZE = 4
+# async infraction, config and enum writes are committed in batches every DB_WRITE_BEHIND_MS or once DB_WRITE_BEHIND_BATCH rows are waiting
+# writes are flushed at shutdown, a crash may lose up to one interval of them, 0 commits every write on its own
+DB_WRITE_BEHIND_MS = 50
+DB_WRITE_BEHIND_BATCH = 512
+# sqlite3 tuning, journal mode is one of DELETE/TRUNCATE/PERSIST/MEMORY/WAL/OFF
+SQLITE3_JOURNAL_MODE = "WAL"
+# "sync" makes every commit durable (synchronous=FULL), "group" only syncs on WAL checkpoints (synchronous=NORMAL),
+# a crash may lose the last few commits under "group" but never corrupts the database
+SQLITE3_COMMIT_POLICY = "sync"
+# overrides the synchronous level picked by the commit policy if set
+SQLITE3_SYNCHRONOUS = ""
+# page cache per connection, negative values are KiB
+SQLITE3_CACHE_SIZE = -8000
+# bytes of the database to memory map, 0 disables
+SQLITE3_MMAP_SIZE = 0
 
 # Configure whether to use re2 or re, any public instance must use re2 due to exploits, however re is cross platform and easier to set up
 REGEX_VERSION = "re2"
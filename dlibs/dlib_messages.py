@@ -18,15 +18,18 @@ import lib_lexdpyk_h as lexdpyk
 import lib_sonnetcommands
 import lz4.frame
 from lib_compatibility import user_avatar_url
-from lib_db_obfuscator import db_hlapi
+from lib_db_obfuscator import async_db_hlapi
 from lib_encryption_wrapper import encrypted_writer
-from lib_loaders import (datetime_now, embed_colors, inc_statistics_better, load_embed_color, load_message_config)
+from lib_loaders import (datetime_now, defer_work, embed_colors, inc_statistics_better, load_embed_color, load_message_config)
 from lib_parsers import (generate_reply_field, grab_files, parse_blacklist, parse_boolean_strict, parse_permissions, parse_skip_message)
 from lib_sonnetcommands import (CallCtx, CommandCtx, ExecutableCtxT, SonnetCommand, parse_command_novalidate)
 from lib_sonnetconfig import AUTOMOD_ENABLED
 
 ALLOWED_CHARS: Final = set(string.ascii_letters + string.digits + "-+;:'\"!@#$%^&()/.,?[{}]= ")
 
+# Version of the antispam state kept in ramfs (guild/asam, guild/casam), bump this when its layout changes so kernel reloads drop it
+ramfs_cache_version: Final = 1
+
 
 async def catch_logging_error(channel: discord.TextChannel, contents: discord.Embed, files: Optional[List[discord.File]] = None) -> None:
     try:
@@ -229,7 +232,7 @@ async def on_message_edit(old_message: discord.Message, message: discord.Message
 
             message_embed.set_footer(text=f"Message ID: {message.id}")
             message_embed.timestamp = datetime_now()
-            asyncio.create_task(catch_logging_error(message_log, message_embed, files))
+            defer_work(kernel_ramfs, "edit-log", catch_logging_error(message_log, message_embed, files))
 
     if AUTOMOD_ENABLED:
         # Check against blacklist
@@ -300,11 +303,14 @@ def test_single_antispam(message: discord.Message, scan: FullAntispamMeta, ramfs
     # We add one millisecond so that a lifetime of 0 will drop the current message
     droptime = (round(message.created_at.timestamp() * 1000) - scan["lifetime_millis"]) + 1
 
+    data_handle = ramfs.handle(f"{message.guild.id}/{scan['name']}")
+
     try:
-        data_dir = cast(Dict[int, List[Tuple[int, CharCount]]], ramfs.read_f(f"{message.guild.id}/{scan['name']}"))
+        data_dir = cast(Dict[int, List[Tuple[int, CharCount]]], data_handle.read())
         assert isinstance(data_dir, dict)
     except FileNotFoundError:
-        data_dir = ramfs.create_f(f"{message.guild.id}/{scan['name']}", f_type=dict)
+        data_dir = data_handle.create(f_type=dict)
+        data_handle.tag(__name__, ramfs_cache_version)
 
     user_data = data_dir.get(message.author.id, [])
 
@@ -372,9 +378,12 @@ async def download_file(nfile: discord.Attachment, compression: Any, encryption:
 
 
 async def log_message_files(message: discord.Message, kernel_ramfs: lexdpyk.ram_filesystem) -> None:
-    if not message.guild:
+    if not message.guild or not message.attachments:
         return
 
+    # Backstop for download_file cleanup, if its task is lost (reload, disconnect) the metadata still gets dropped
+    kernel_ramfs.set_ttl(f"{message.guild.id}/files/{message.id}", ttl=60 * 60 + 60)
+
     for i in message.attachments:
 
         fname: bytes = i.filename.encode("utf8")
@@ -470,9 +479,8 @@ async def do_automod_pass(message: discord.Message, client: discord.Client, mcon
 
         if action == "mute":
 
-            with db_hlapi(message.guild.id) as db:
-                if not db.is_muted(userid=message.author.id):
-                    timeout = True
+            if not await async_db_hlapi(message.guild.id).is_muted(userid=message.author.id):
+                timeout = True
 
         elif action == "timeout":
 
@@ -544,7 +552,7 @@ async def on_message(message: discord.Message, kernel_args: lexdpyk.KernelArgs)
 
     # Log files if not deleted
     if not message_deleted:
-        asyncio.create_task(log_message_files(message, kernel_args.kernel_ramfs))
+        defer_work(kernel_args.kernel_ramfs, "attachment-cache", log_message_files(message, kernel_args.kernel_ramfs))
 
     # END blacklist loop
 
@@ -619,4 +627,4 @@ commands: Final[Dict[str, Callable[..., Any]]] = {
     "on-message-delete": on_message_delete,
     }
 
-version_info: Final = "2.0.2"
+version_info: Final = "2.0.3"
@@ -1,29 +1,48 @@
 # Reactionrole dlib for managing logic
 # Ultrabear 2021
 
-import importlib
-
 import discord
 
-import lib_loaders
-
-importlib.reload(lib_loaders)
-import lib_lexdpyk_h
-
-importlib.reload(lib_lexdpyk_h)
-import lib_compatibility
-
-importlib.reload(lib_compatibility)
-
 from lib_loaders import load_message_config, inc_statistics_better
-from lib_lexdpyk_h import ToKernelArgs, KernelArgs
+from lib_lexdpyk_h import ToKernelArgs, KernelArgs, ram_filesystem, dlib_filters_dict
 from lib_compatibility import to_snowflake
+from lib_sonnetconfig import STATELESS
 
 from typing import Dict, Any, Union, Optional, Tuple
 
 reactionrole_types: Dict[Union[int, str], Any] = {0: "sonnet_reactionroles", "json": [["reaction-role-data", {}], ]}
 
 
+def reactionrole_config(guild_id: int, ramfs: ram_filesystem) -> Dict[str, Dict[str, int]]:
+    """
+    Returns the parsed reactionrole config of a guild, cached under the guild caches so config changes drop it
+    The filters and handlers share this, so an event parses the config at most once
+    """
+
+    handle = ramfs.handle(f"{guild_id}/caches/reactionrole_config")
+
+    try:
+        if STATELESS:
+            raise FileNotFoundError
+        rrconf = handle.read()
+        assert isinstance(rrconf, dict)
+        return rrconf
+    except FileNotFoundError:
+        rrconf = load_message_config(guild_id, ramfs, datatypes=reactionrole_types)["reaction-role-data"] or {}
+        if not STATELESS:
+            handle.create(f_type=dict, f_args=[rrconf])
+            handle.tag(__name__)
+        return rrconf
+
+
+def on_reactionrole_message(payload: discord.RawReactionActionEvent, **kargs: Any) -> bool:
+
+    if not payload.guild_id:
+        return False
+
+    return str(payload.message_id) in reactionrole_config(payload.guild_id, kargs["ramfs"])
+
+
 def emojifrompayload(payload: discord.RawReactionActionEvent) -> Tuple[str, Optional[str]]:
     emoji = payload.emoji
     if emoji.is_unicode_emoji():
@@ -67,7 +86,7 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent, kargs: Ke
     inc_statistics_better(payload.guild_id, "on-raw-reaction-add", kargs.kernel_ramfs)
 
     client: discord.Client = kargs.client
-    rrconf: Optional[Dict[str, Dict[str, int]]] = load_message_config(payload.guild_id, kargs.ramfs, datatypes=reactionrole_types)["reaction-role-data"]
+    rrconf = reactionrole_config(payload.guild_id, kargs.ramfs)
 
     if client.user:
         # do not give reactionroles to self
@@ -92,7 +111,7 @@ async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent, kargs:
     inc_statistics_better(payload.guild_id, "on-raw-reaction-remove", kargs.kernel_ramfs)
 
     client: discord.Client = kargs.client
-    rrconf: Optional[Dict[str, Dict[str, int]]] = load_message_config(payload.guild_id, kargs.ramfs, datatypes=reactionrole_types)["reaction-role-data"]
+    rrconf = reactionrole_config(payload.guild_id, kargs.ramfs)
 
     if client.user:
         # do not remove reactionroles from self
@@ -116,4 +135,9 @@ commands = {
     "on-raw-reaction-remove": on_raw_reaction_remove,
     }
 
-version_info = "2.0.0"
+filters: dlib_filters_dict = {
+    "on-raw-reaction-add": on_reactionrole_message,
+    "on-raw-reaction-remove": on_reactionrole_message,
+    }
+
+version_info = "2.1.1"
@@ -1,31 +1,52 @@
 # Handlers for reactions
 # Ultrabear 2021
 
-import importlib
-
 import discord
-import lib_db_obfuscator
-
-importlib.reload(lib_db_obfuscator)
-import lib_loaders
-
-importlib.reload(lib_loaders)
-import lib_starboard
-
-importlib.reload(lib_starboard)
 
 from lib_starboard import starboard_cache, build_starboard_embed
 from lib_db_obfuscator import db_hlapi
 from lib_loaders import load_message_config, inc_statistics_better
+from lib_sonnetconfig import STATELESS
 
-from typing import Any
+from typing import Any, Tuple
 import lib_lexdpyk_h as lexdpyk
 
 
+def starboard_trigger(guild_id: int, ramfs: lexdpyk.ram_filesystem) -> Tuple[Any, ...]:
+    """
+    Returns (emoji, count) if starboard is enabled in a guild or an empty tuple, cached under the guild caches so config changes drop it
+    """
+
+    handle = ramfs.handle(f"{guild_id}/caches/starboard_trigger")
+
+    try:
+        if STATELESS:
+            raise FileNotFoundError
+        trigger = handle.read()
+        assert isinstance(trigger, tuple)
+        return trigger
+    except FileNotFoundError:
+        mconf = load_message_config(guild_id, ramfs, datatypes=starboard_cache)
+        trigger = (mconf["starboard-emoji"], int(mconf["starboard-count"])) if bool(int(mconf["starboard-enabled"])) else ()
+        if not STATELESS:
+            handle.create(f_type=tuple, f_args=[trigger])
+            handle.tag(__name__)
+        return trigger
+
+
+def can_star(reaction: discord.Reaction, user: discord.User, **kargs: Any) -> bool:
+
+    if not (guild := reaction.message.guild):
+        return False
+
+    trigger = starboard_trigger(guild.id, kargs["ramfs"])
+
+    return bool(trigger) and reaction.emoji == trigger[0] and reaction.count >= trigger[1]
+
+
 async def on_reaction_add(reaction: discord.Reaction, user: discord.User, **kargs: Any) -> None:
 
     client: discord.Client = kargs["client"]
-    kernel_ramfs: lexdpyk.ram_filesystem = kargs["kernel_ramfs"]
     ramfs: lexdpyk.ram_filesystem = kargs["ramfs"]
 
     message = reaction.message
@@ -34,11 +55,12 @@ async def on_reaction_add(reaction: discord.Reaction, user: discord.User, **karg
     if not message.guild:
         return
 
-    inc_statistics_better(message.guild.id, "on-reaction-add", kernel_ramfs)
-    mconf = load_message_config(message.guild.id, ramfs, datatypes=starboard_cache)
+    inc_statistics_better(message.guild.id, "on-reaction-add", kargs["kernel_ramfs"])
 
-    if bool(int(mconf["starboard-enabled"])) and reaction.emoji == mconf["starboard-emoji"] and reaction.count >= int(mconf["starboard-count"]):
-        if (channel_id := mconf["starboard-channel"]) and (channel := client.get_channel(int(channel_id))) and isinstance(channel, discord.TextChannel):
+    # same cached trigger the filter checked, rechecked since a filter that raised still lets the handler run
+    if (trigger := starboard_trigger(message.guild.id, ramfs)) and reaction.emoji == trigger[0] and reaction.count >= trigger[1]:
+        channel_id = load_message_config(message.guild.id, ramfs, datatypes=starboard_cache)["starboard-channel"]
+        if channel_id and (channel := client.get_channel(int(channel_id))) and isinstance(channel, discord.TextChannel):
 
             with db_hlapi(message.guild.id) as db:
                 with db.inject_enum_context("starboard", [("messageID", str)]) as starboard:
@@ -59,4 +81,8 @@ commands = {
     "on-reaction-add": on_reaction_add,
     }
 
-version_info: str = "1.2.11"
+filters: lexdpyk.dlib_filters_dict = {
+    "on-reaction-add": can_star,
+    }
+
+version_info: str = "1.3.1"
@@ -1,25 +1,13 @@
 # Handlers for initializing the bot and guilds
 # Ultrabear 2021
 
-import importlib
-
 import discord, time, asyncio
 
-import lib_db_obfuscator
-
-importlib.reload(lib_db_obfuscator)
-import lib_loaders
-
-importlib.reload(lib_loaders)
-import lib_compatibility
-
-importlib.reload(lib_compatibility)
-
-from lib_db_obfuscator import db_hlapi
+from lib_db_obfuscator import db_hlapi, async_db_hlapi
 from lib_loaders import inc_statistics_better, datetime_now
 from lib_compatibility import to_snowflake
 
-from typing import Dict, Callable, Any, List, Tuple
+from typing import Dict, Callable, Any, List, Tuple, Optional, Set
 
 
 async def attempt_unmute(Client: discord.Client, mute_entry: Tuple[str, str, str, int]) -> None:
@@ -36,6 +24,63 @@ async def attempt_unmute(Client: discord.Client, mute_entry: Tuple[str, str, str
                 pass
 
 
+def on_shard(guild_id: int, shard: Optional[Tuple[int, int]]) -> bool:
+    """
+    Checks if a guild belongs to a (shard_id, shard_count) pair, always True when not sharded
+    """
+    return shard is None or (guild_id >> 22) % shard[1] == shard[0]
+
+
+async def recover_mutes(Client: discord.Client, shard: Optional[Tuple[int, int]]) -> None:
+    """
+    Unmutes expired mutes and restarts mute timers, limited to guilds on the given (shard_id, shard_count) if sharded
+    """
+
+    with db_hlapi(None) as db:
+        mutes: List[Tuple[str, str, str, int]] = db.fetch_all_mutes()
+        lost_mutes = sorted((i for i in mutes if on_shard(int(i[0]), shard)), key=lambda a: a[3])
+
+    ts = datetime_now().timestamp()
+
+    lost_mute_timers = [i for i in lost_mutes if 0 != i[3]]
+
+    if lost_mute_timers:
+
+        prefix = "" if shard is None else f"Shard {shard[0]}: "
+
+        print(f"{prefix}Lost mutes: {len(lost_mute_timers)}")
+        for i in lost_mute_timers:
+            if i[3] < ts:
+                await attempt_unmute(Client, i)
+
+        lost_mute_timers = [i for i in lost_mute_timers if i[3] >= ts]
+        if lost_mute_timers:
+            print(f"{prefix}Mute timers to recover: {len(lost_mute_timers)}\nThis process will end in {round(lost_mutes[-1][3]-time.time())} seconds")
+
+            for i in lost_mute_timers:
+                await asyncio.sleep(i[3] - datetime_now().timestamp())
+                with db_hlapi(int(i[0])) as db:
+                    if db.is_muted(infractionid=i[1]):
+                        await attempt_unmute(Client, i)
+
+        print(f"{prefix}Mutes recovered")
+
+
+async def verify_indexes() -> None:
+    """
+    Builds infraction indexes missing from tables made by older versions, on a database worker so the event loop keeps running
+    """
+
+    checked = await async_db_hlapi(None).run(lambda db: db.verify_infraction_indexes())
+
+    if checked:
+        print(f"Infraction indexes verified on {checked} tables")
+
+
+# Kept in module state rather than kernel_ramfs so debug-drop-kramfs does not rerun verification, kept across reloads
+indexes_verified: bool = globals().get("indexes_verified", False)
+
+
 async def on_ready(**kargs: Any) -> None:
 
     inc_statistics_better(0, "on-ready", kargs["kernel_ramfs"])
@@ -47,35 +92,43 @@ async def on_ready(**kargs: Any) -> None:
     if Client.user and not Client.user.bot:
         print("WARNING: The connected account is not a bot, as it is against ToS we do not condone user botting")
 
+    # Ready fires again on reconnects, indexes only need verifying once per process
+    global indexes_verified
+    if not indexes_verified:
+        indexes_verified = True
+        asyncio.create_task(verify_indexes())
+
+    # Sharded clients recover mutes per shard in on-shard-ready
+    if isinstance(Client, discord.AutoShardedClient):
+        return
+
     # bot start time check to not reparse timers on network disconnect
     if kargs["bot_start"] > (time.time() - 10):
+        await recover_mutes(Client, None)
 
-        with db_hlapi(None) as db:
-            mutes: List[Tuple[str, str, str, int]] = db.fetch_all_mutes()
-            lost_mutes = sorted(mutes, key=lambda a: a[3])
 
-        ts = datetime_now().timestamp()
+# Shards that recovered their mutes, kept in module state rather than kernel_ramfs so debug-drop-kramfs does not rerun recovery, kept across reloads
+ready_shards: Set[int] = globals().get("ready_shards", set())
 
-        lost_mute_timers = [i for i in lost_mutes if 0 != i[3]]
 
-        if lost_mute_timers:
+async def on_shard_ready(shard_id: int, **kargs: Any) -> None:
 
-            print(f"Lost mutes: {len(lost_mute_timers)}")
-            for i in lost_mute_timers:
-                if i[3] < ts:
-                    await attempt_unmute(Client, i)
+    inc_statistics_better(0, "on-shard-ready", kargs["kernel_ramfs"])
+
+    Client: discord.Client = kargs["client"]
+
+    if not isinstance(Client, discord.AutoShardedClient) or Client.shard_count is None:
+        return
+
+    # Shards become ready one at a time and can reconnect later, so skip ones that already recovered their mutes
+    if shard_id in ready_shards:
+        return
 
-            lost_mute_timers = [i for i in lost_mute_timers if i[3] >= ts]
-            if lost_mute_timers:
-                print(f"Mute timers to recover: {len(lost_mute_timers)}\nThis process will end in {round(lost_mutes[-1][3]-time.time())} seconds")
+    ready_shards.add(shard_id)
 
-                for i in lost_mute_timers:
-                    await asyncio.sleep(i[3] - datetime_now().timestamp())
-                    with db_hlapi(int(i[0])) as db:
-                        if db.is_muted(infractionid=i[1]):
-                            await attempt_unmute(Client, i)
+    print(f"Shard {shard_id}/{Client.shard_count} is ready")
 
-            print("Mutes recovered")
+    await recover_mutes(Client, (shard_id, Client.shard_count))
 
 
 async def on_guild_join(guild: discord.Guild, **kargs: Any) -> None:
@@ -86,6 +139,6 @@ async def on_guild_join(guild: discord.Guild, **kargs: Any) -> None:
 
 category_info: Dict[str, str] = {'name': 'Initializers'}
 
-commands: Dict[str, Callable[..., Any]] = {"on-ready": on_ready, "on-guild-join": on_guild_join}
+commands: Dict[str, Callable[..., Any]] = {"on-ready": on_ready, "on-shard-ready": on_shard_ready, "on-guild-join": on_guild_join}
 
-version_info: str = "2.0.0"
+version_info: str = "2.2.0"
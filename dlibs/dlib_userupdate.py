@@ -10,8 +10,8 @@ from typing import Any, Dict, List, Optional, Union
 
 import lib_lexdpyk_h as lexdpyk
 from lib_compatibility import (discord_datetime_now, has_default_avatar, user_avatar_url, to_snowflake)
-from lib_db_obfuscator import db_hlapi
-from lib_loaders import (datetime_now, embed_colors, inc_statistics_better, load_embed_color, load_message_config)
+from lib_db_obfuscator import async_db_hlapi
+from lib_loaders import (datetime_now, defer_work, embed_colors, inc_statistics_better, load_embed_color, load_message_config)
 from lib_parsers import parse_boolean_strict
 from lib_sonnetconfig import AUTOMOD_ENABLED
 
@@ -29,6 +29,10 @@ join_leave_user_logs: Dict[Union[str, int], Union[str, List[List[Any]]]] = {
     }
 
 
+def nick_changed(before: discord.Member, after: discord.Member, **kargs: Any) -> bool:
+    return before.nick != after.nick
+
+
 async def on_member_update(before: discord.Member, after: discord.Member, **kargs: Any) -> None:
 
     inc_statistics_better(before.guild.id, "on-member-update", kargs["kernel_ramfs"])
@@ -36,8 +40,6 @@ async def on_member_update(before: discord.Member, after: discord.Member, **karg
     username_log = load_message_config(before.guild.id, kargs["ramfs"], datatypes=join_leave_user_logs)["username-log"]
 
     if username_log and (channel := kargs["client"].get_channel(int(username_log))):
-        if before.nick == after.nick:
-            return
 
         def nick_or_unset(s: Optional[str]) -> str:
             if s is None:
@@ -52,7 +54,7 @@ async def on_member_update(before: discord.Member, after: discord.Member, **karg
         message_embed.timestamp = ts = datetime_now()
         message_embed.set_footer(text=f"unix: {int(ts.timestamp())}")
 
-        await catch_logging_error(channel, message_embed)
+        defer_work(kargs["kernel_ramfs"], "username-log", catch_logging_error(channel, message_embed))
 
 
 def parsedate(indata: Optional[datetime]) -> str:
@@ -85,9 +87,9 @@ async def notify_problem(member: discord.Member, ptype: List[str], log: str, cli
         await catch_logging_error(channel, notify_embed)
 
 
-async def try_mute_on_rejoin(member: discord.Member, db: db_hlapi, client: discord.Client, log: str, ramfs: lexdpyk.ram_filesystem) -> None:
+async def try_mute_on_rejoin(member: discord.Member, db: async_db_hlapi, client: discord.Client, log: str, ramfs: lexdpyk.ram_filesystem) -> None:
 
-    mute_role_id = db.grab_config("mute-role")
+    mute_role_id = await db.grab_config("mute-role")
     if mute_role_id and (mute_role := member.guild.get_role(int(mute_role_id))):
 
         success: bool
@@ -154,11 +156,11 @@ async def on_member_join(member: discord.Member, **kargs: Any) -> None:
         embed.add_field(name="Created", value=parsedate(member.created_at), inline=True)
 
         if isinstance(logging_channel, discord.TextChannel):
-            asyncio.create_task(catch_logging_error(logging_channel, embed))
+            defer_work(kargs["kernel_ramfs"], "join-log", catch_logging_error(logging_channel, embed))
 
-    with db_hlapi(member.guild.id) as db:
-        if db.is_muted(userid=member.id):
-            await try_mute_on_rejoin(member, db, client, notifier_cache["regex-notifier-log"], ramfs)
+    db = async_db_hlapi(member.guild.id)
+    if await db.is_muted(userid=member.id):
+        await try_mute_on_rejoin(member, db, client, notifier_cache["regex-notifier-log"], ramfs)
 
 
 # Handles member leave logging
@@ -185,7 +187,7 @@ async def on_member_remove(member: discord.Member, **kargs: Any) -> None:
             embed.add_field(name="Created", value=parsedate(member.created_at), inline=True)
             embed.add_field(name="Joined", value=parsedate(member.joined_at), inline=True)
 
-            await catch_logging_error(logging_channel, embed)
+            defer_work(kargs["kernel_ramfs"], "leave-log", catch_logging_error(logging_channel, embed))
 
 
 category_info = {'name': 'UserUpdate'}
@@ -196,4 +198,8 @@ commands = {
     "on-member-remove": on_member_remove,
     }
 
-version_info: str = "2.0.1"
+filters: lexdpyk.dlib_filters_dict = {
+    "on-member-update": nick_changed,
+    }
+
+version_info: str = "2.1.2"
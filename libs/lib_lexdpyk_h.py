@@ -9,8 +9,43 @@ from typing import Optional, List, Any, Tuple, Dict, Callable, Coroutine, TypeVa
 Obj = TypeVar("Obj")
 
 
+# Define ramfs handle headers
+class ram_filesystem_handle(Protocol):
+    def read(self) -> object:
+        ...
+
+    # pytype: disable=not-callable
+    @overload
+    def create(self) -> io.BytesIO:
+        ...
+
+    @overload
+    def create(self, f_type: Optional[Callable[[Any], Obj]] = None, f_args: Optional[List[Any]] = None) -> Obj:
+        ...
+
+    @overload
+    def create(self, f_type: Optional[Callable[[], Obj]] = None) -> Obj:
+        ...
+
+    # pytype: enable=not-callable
+    def remove(self) -> None:
+        ...
+
+    def tag(self, producer: str, version: object = None) -> None:
+        ...
+
+    def directory(self) -> "ram_filesystem":
+        ...
+
+    def ls(self) -> Tuple[List[str], List[str]]:
+        ...
+
+
 # Define ramfs headers
 class ram_filesystem(Protocol):
+    def handle(self, dirstr: Optional[str] = None, dirlist: Optional[List[str]] = None) -> ram_filesystem_handle:
+        ...
+
     def mkdir(self, dirstr: Optional[str] = None, dirlist: Optional[List[str]] = None) -> "ram_filesystem":
         ...
 
@@ -43,6 +78,39 @@ class ram_filesystem(Protocol):
     def tree(self, dirstr: Optional[str] = None, dirlist: Optional[List[str]] = None) -> Tuple[List[str], Dict[str, Tuple[Any]]]:
         ...
 
+    def tag(self, dirstr: Optional[str] = None, dirlist: Optional[List[str]] = None, producer: str = "", version: object = None) -> None:
+        ...
+
+    def invalidate(self, stale: Callable[[str, object], bool]) -> int:
+        ...
+
+    def set_ttl(self, dirstr: Optional[str] = None, dirlist: Optional[List[str]] = None, ttl: Optional[float] = None) -> None:
+        ...
+
+    def expire(self) -> int:
+        ...
+
+    def du(self) -> int:
+        ...
+
+    def usage_by_entry(self) -> Dict[str, int]:
+        ...
+
+    def evict_lru(self, budget: int) -> List[str]:
+        ...
+
+
+# Define load shedder headers
+class load_shedder(Protocol):
+    """
+    Published at global/load_shedder, work is critical unless routed through it
+    """
+    def shed(self, name: str) -> bool:
+        ...
+
+    def defer(self, name: str, work: Coroutine[Any, Any, Any]) -> None:
+        ...
+
 
 class cmd_module(Protocol):
     __name__: str
@@ -63,11 +131,17 @@ class dlib_module(Protocol):
 
 dlib_modules_dict = Dict[str, Callable[..., Coroutine[Any, Any, None]]]
 
+# Type of the optional filters dict of a dlib, keyed like commands
+# a filter gets the event args and kernel kwargs, and returning False skips the handler for that event
+# filters should only read cached state, the kernel counts skipped events and statistics are left to the handler
+dlib_filters_dict = Dict[str, Callable[..., bool]]
 
-@dataclass
+
+@dataclass(frozen=True)
 class KernelArgs:
     """
     A wrapper around a kernels passed kwargs
+    The kernel may share one instance across every call, so it is immutable
     """
     __slots__ = "kernel_version", "bot_start", "client", "ramfs", "kernel_ramfs", "command_modules", "dynamiclib_modules"
     kernel_version: str
@@ -90,6 +164,9 @@ def ToKernelArgs(f: _FuncType) -> _FuncType:
         nargs = (*args, KernelArgs(**kwargs))
         return f(*nargs)
 
+    # Lets a kernel that supports it skip the kwargs conversion and pass a shared KernelArgs directly
+    setattr(newfunc, "__lexdpyk_kernel_args__", (f, KernelArgs))
+
     return newfunc
 
 
@@ -5,7 +5,8 @@ from __future__ import annotations
 
 import discord
 
-import random, ctypes, time, io, json, pickle, threading, warnings
+import random, ctypes, time, io, json, pickle, threading, warnings, zlib
+import asyncio
 import datetime
 import subprocess
 
@@ -14,7 +15,7 @@ from lib_db_obfuscator import db_hlapi
 from lib_sonnetconfig import CLIB_LOAD, GLOBAL_PREFIX, BLACKLIST_ACTION, STATELESS
 from lib_datetimeplus import Time
 
-from typing import Any, Tuple, Optional, Union, cast, Type, Dict, Protocol, Final, Literal
+from typing import Any, Tuple, Optional, Union, cast, Type, Dict, Protocol, Final, Literal, Coroutine
 import lib_lexdpyk_h as lexdpyk
 
 
@@ -71,6 +72,32 @@ defaultcache: dict[Union[str, int], Any] = {
     0: "sonnet_default"
     }
 
+# Version of the config cache encoding, bump this when the cache format changes so kernel reloads drop old caches
+ramfs_cache_version: Final = 1
+
+# Layout digests of datatypes dicts by id, the dict is held so its id is not reused
+_layout_digests: Dict[int, Tuple[Dict[Union[str, int], Any], bytes]] = {}
+
+
+def _layout_digest(datatypes: Dict[Union[str, int], Any]) -> bytes:
+    """
+    Returns a digest of the config fields of a datatypes dict, written ahead of its cache so a cache built from an older layout is never decoded
+    """
+
+    try:
+        held, digest = _layout_digests[id(datatypes)]
+        if held is datatypes:
+            return digest
+    except KeyError:
+        pass
+
+    layout = json.dumps([datatypes[0]] + [[i[0] for i in datatypes.get(t, [])] for t in ("csv", "text", "json")])
+    digest = zlib.crc32(layout.encode("utf8")).to_bytes(4, "little")
+
+    _layout_digests[id(datatypes)] = (datatypes, digest)
+
+    return digest
+
 
 class Reader(Protocol):
     def read(self, size: int = -1, /) -> bytes:
@@ -100,12 +127,17 @@ def _get_cached_config(guild_id: int, ramfs: lexdpyk.ram_filesystem, datatypes:
     """
     try:
         # Loads fileio object
-        blacklist_cache = ramfs.read_f(dirlist=[str(guild_id), "caches", str(datatypes[0])])
+        blacklist_cache = ramfs.handle(f"{guild_id}/caches/{datatypes[0]}").read()
     except FileNotFoundError:
         raise
 
     assert isinstance(blacklist_cache, io.BytesIO)
     blacklist_cache.seek(0)
+
+    # Cache was built for a different set of fields (the module defining them was reloaded), treat as missing
+    if blacklist_cache.read(4) != _layout_digest(datatypes):
+        raise FileNotFoundError("Cache layout mismatch")
+
     message_config: Dict[str, Any] = {}
 
     # Imports csv style data
@@ -180,7 +212,10 @@ def load_message_config(guild_id: int, ramfs: lexdpyk.ram_filesystem, datatypes:
                 message_config[i[0]] = v.lower().split(",")
 
         # Generate SNOWFLAKE DBCACHE
-        blacklist_cache = ramfs.create_f(dirlist=[str(guild_id), "caches", str(datatypes[0])])
+        cache_handle = ramfs.handle(f"{guild_id}/caches/{datatypes[0]}")
+        blacklist_cache = cache_handle.create()
+        cache_handle.tag(__name__, ramfs_cache_version)
+        blacklist_cache.write(_layout_digest(datatypes))
         # Add csv based configs
         for i in datatypes["csv"]:
             if message_config[i[0]]:
@@ -250,19 +285,53 @@ def generate_infractionid() -> str:
         raise RuntimeError("RecursionError on trying to get an infraction id, check filepath names")
 
 
+def defer_work(kernel_ramfs: lexdpyk.ram_filesystem, name: str, work: Coroutine[Any, Any, Any]) -> None:
+    """
+    Runs non critical work such as logging in the background, an overloaded kernel may delay or drop it
+    """
+
+    try:
+        shedder = cast(lexdpyk.load_shedder, kernel_ramfs.read_f("global/load_shedder"))
+    except FileNotFoundError:
+        # kernel without load shedding
+        asyncio.create_task(work)
+        return
+
+    shedder.defer(name, work)
+
+
+def shed_work(kernel_ramfs: lexdpyk.ram_filesystem, name: str) -> bool:
+    """
+    Returns True if an overloaded kernel wants cheap non critical work skipped
+    """
+
+    try:
+        return cast(lexdpyk.load_shedder, kernel_ramfs.read_f("global/load_shedder")).shed(name)
+    except FileNotFoundError:
+        return False
+
+
 def inc_statistics_better(guild: int, inctype: str, kernel_ramfs: lexdpyk.ram_filesystem) -> None:
 
+    # statistics are the first thing to go under load
+    if shed_work(kernel_ramfs, "statistics"):
+        return
+
+    stats_handle = kernel_ramfs.handle(f"{guild}/stats")
+
     try:
-        statistics = kernel_ramfs.read_f(dirlist=[str(guild), "stats"])
+        statistics = stats_handle.read()
         assert isinstance(statistics, dict)
     except FileNotFoundError:
-        statistics = kernel_ramfs.create_f(dirlist=[str(guild), "stats"], f_type=cast(Type[Dict[str, int]], dict))
+        statistics = stats_handle.create(f_type=cast(Type[Dict[str, int]], dict))
+
+    global_stats_handle = kernel_ramfs.handle("global/stats")
 
     try:
-        global_statistics = kernel_ramfs.read_f(dirlist=["global", "stats"])
+        global_statistics = global_stats_handle.read()
         assert isinstance(global_statistics, dict)
     except FileNotFoundError:
-        global_statistics = kernel_ramfs.create_f(dirlist=["global", "stats"], f_type=cast(Type[Dict[str, int]], dict))
+        global_statistics = global_stats_handle.create(f_type=cast(Type[Dict[str, int]], dict))
 
     if inctype in statistics:
         statistics[inctype] += 1
@@ -13,6 +13,14 @@ class db_error:  # DB error codes
     InterfaceError = mariadb.InterfaceError
     Error = mariadb.OperationalError
 
+    @staticmethod
+    def transient(err: BaseException) -> bool:
+        """
+        Returns True for errors that clear up on their own, a lost connection, a lock wait timeout or a deadlock
+        """
+        # 1205 lock wait timeout, 1213 deadlock, 2006 server gone away, 2013 connection lost during query
+        return isinstance(err, mariadb.InterfaceError) or getattr(err, "errno", None) in (1205, 1213, 2006, 2013)
+
 
 class db_handler:  # Im sorry I OOP'd it :c -ultrabear
 
@@ -73,14 +81,18 @@ class db_handler:  # Im sorry I OOP'd it :c -ultrabear
         # Add table addition
         db_inputBuilder.write(f'CREATE TABLE IF NOT EXISTS {tablename} (')
 
-        # Parse through table items, item with 3 entries is primary key
+        # Parse through table items, item with 3 entries is primary key, several make a composite key
+        primary = [i[0] for i in data if len(i) >= 3 and i[2] == 1]
         inlist = []
         for i in data:
-            if len(i) >= 3 and i[2] == 1:
+            if len(primary) == 1 and len(i) >= 3 and i[2] == 1:
                 inlist.append(f"{i[0]} {datamap[i[1]]} PRIMARY KEY")
             else:
                 inlist.append(f"{i[0]} {datamap[i[1]]}")
 
+        if len(primary) > 1:
+            inlist.append(f"PRIMARY KEY ({', '.join(primary)})")
+
         # Add parsed inputs to inputStr
         db_inputBuilder.write(", ".join(inlist))
         db_inputBuilder.write(")")
@@ -107,6 +119,10 @@ class db_handler:  # Im sorry I OOP'd it :c -ultrabear
 
         self.cur.execute(db_inputBuilder.getvalue(), tuple(db_inputList))
 
+    def add_many_to_table(self, table: str, columns: Tuple[str, ...], rows: List[Tuple[Any, ...]]) -> None:
+
+        self.cur.executemany(f"REPLACE INTO {table} ({', '.join(columns)})\nVALUES ({', '.join('?' for _ in columns)})\n", rows)
+
     def multicount_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> int:
 
         db_inputBuilder = io.StringIO()
@@ -160,6 +176,12 @@ class db_handler:  # Im sorry I OOP'd it :c -ultrabear
         # Execute
         self.cur.execute(db_inputStr, tuple(db_inputList))
 
+    def multidelete_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> None:
+
+        conditions = " AND ".join(f"({i[0]} {i[2] if len(i) > 2 else '='} ?)" for i in searchparms)
+
+        self.cur.execute(f"DELETE FROM {table} WHERE {conditions}", tuple(i[1] for i in searchparms))
+
     def delete_table(self, table: str) -> None:
 
         self.cur.execute(f"DROP TABLE IF EXISTS {table};")
@@ -186,6 +208,9 @@ class db_handler:  # Im sorry I OOP'd it :c -ultrabear
     def commit(self) -> None:  # Commits data to db
         self.con.commit()
 
+    def rollback(self) -> None:  # Drops uncommitted data
+        self.con.rollback()
+
     def close(self) -> None:
         self.con.commit()
         self.con.close()
@@ -16,7 +16,7 @@ from lib_encryption_wrapper import encrypted_reader
 import lib_constants as constants
 from lib_compatibility import is_guild_messageable, GuildMessageable
 
-from typing import Callable, Iterable, Optional, Any, Tuple, Dict, Union, List, TypeVar, Literal, overload, cast
+from typing import Callable, Iterable, Optional, Any, Tuple, Dict, Union, List, TypeVar, Literal, Final, overload, cast
 import lib_lexdpyk_h as lexdpyk
 
 # Import re here to trick type checker into using re stubs even if importlib grabs re2, they (should) have the same stubs
@@ -25,6 +25,9 @@ import re
 # Place this in the globals scope by hand to avoid pyflakes saying its a redefinition
 globals()["re"] = importlib.import_module(REGEX_VERSION)
 
+# Version of the compiled regex cache (guild/regex), bump this when its layout changes so kernel reloads drop old caches
+ramfs_cache_version: Final = 1
+
 
 class errors:
     class log_channel_update_error(RuntimeError):
@@ -93,7 +96,7 @@ def parse_blacklist(indata: _parse_blacklist_inputs, client_user: Optional[disco
 
     # Compilecheck regex
     try:
-        ramfs.ls(f"{message.guild.id}/regex")
+        ramfs.handle(f"{message.guild.id}/regex").directory()
     except FileNotFoundError:
         # Compiles regex blacklists if they are not precompiled
 
@@ -118,10 +121,13 @@ def parse_blacklist(indata: _parse_blacklist_inputs, client_user: Optional[disco
         else:
             ramfs.create_f(f"{message.guild.id}/regex/url", f_type=returnsNone)
 
+        ramfs.tag(f"{message.guild.id}/regex", producer=__name__, version=ramfs_cache_version)
+
     # Load blacklist from ramfs cache into temp conf_cache
-    blacklist["regex-blacklist"] = [ramfs.read_f(f"{message.guild.id}/regex/regex-blacklist/{i}") for i in ramfs.ls(f"{message.guild.id}/regex/regex-blacklist")[0]]
-    blacklist["regex-notifier"] = [ramfs.read_f(f"{message.guild.id}/regex/regex-notifier/{i}") for i in ramfs.ls(f"{message.guild.id}/regex/regex-notifier")[0]]
-    blacklist["url-blacklist_regex"] = ramfs.read_f(f"{message.guild.id}/regex/url")
+    for regex_type in ["regex-blacklist", "regex-notifier"]:
+        regex_dir = ramfs.handle(f"{message.guild.id}/regex/{regex_type}").directory()
+        blacklist[regex_type] = [regex_dir.read_f(dirlist=[i]) for i in regex_dir.ls(dirlist=[])[0]]
+    blacklist["url-blacklist_regex"] = ramfs.handle(f"{message.guild.id}/regex/url").read()
 
     # Check that member is still part of guild (yes this is a race cond that happens)
     if not isinstance(message.author, discord.Member):
@@ -0,0 +1,190 @@
+# Shared schema database layer, stores every guild in a few shared tables keyed by guild id
+# Wraps a db_handler and maps the per guild table names db_hlapi uses ({guild}_{name}) onto shared tables (shared_{name})
+
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+__all__ = ["shared_schema_handler", "wrap_handler", "split_table", "SHARED_PREFIX", "GUILD_COLUMN"]
+
+SHARED_PREFIX = "shared_"
+GUILD_COLUMN = "guild_id"
+
+
+def split_table(table: str) -> Optional[Tuple[int, str]]:
+    """
+    Splits a per guild table name into its guild and table name, db_hlapi names guildless tables None_{name} and they are stored as guild 0
+
+    :returns: Optional[Tuple[int, str]] - The guild and table name, None for global tables such as version_info
+    """
+
+    guild, sep, name = table.partition("_")
+
+    if not sep or not name:
+        return None
+    elif guild == "None":
+        return 0, name
+    elif guild.isdigit():
+        return int(guild), name
+
+    return None
+
+
+def _guild_prefix(guild_id: int) -> str:
+    return "None" if guild_id == 0 else str(guild_id)
+
+
+class shared_schema_handler:
+    """
+    A db_handler that keeps db_hlapi's per guild tables in shared tables, with the guild id as the first column and part of the primary key
+    Global tables are passed through unchanged
+    """
+    __slots__ = "_db", "closed"
+
+    def __init__(self, backend: Any) -> None:
+        self._db = backend
+        self.closed = False
+
+    @property
+    def TEXT_KEY(self) -> bool:
+        return bool(self._db.TEXT_KEY)
+
+    def __enter__(self) -> "shared_schema_handler":
+        return self
+
+    def _route(self, table: str) -> Tuple[str, List[List[Any]]]:
+        # shared table name and the search that limits it to the guild, or the table itself with no search
+        if (split := split_table(table)) is None:
+            return table, []
+        return SHARED_PREFIX + split[1], [[GUILD_COLUMN, split[0]]]
+
+    def make_new_index(self, tablename: str, indexname: str, columns: List[str]) -> None:
+
+        table, guild = self._route(tablename)
+        if not guild:
+            self._db.make_new_index(tablename, indexname, columns)
+            return
+
+        # one index serves every guild, led by the guild column
+        index = SHARED_PREFIX + split[1] if (split := split_table(indexname)) is not None else indexname
+        self._db.make_new_index(table, index, [GUILD_COLUMN] + columns)
+
+    def make_new_table(self, tablename: str, data: Union[List[Any], Tuple[Any, ...]]) -> None:
+
+        table, guild = self._route(tablename)
+        if not guild:
+            self._db.make_new_table(tablename, data)
+            return
+
+        keyed = any(len(i) >= 3 and i[2] == 1 for i in data)
+
+        # the guild joins the primary key, tables without one get an index on the guild instead
+        self._db.make_new_table(table, [(GUILD_COLUMN, int(64), 1) if keyed else (GUILD_COLUMN, int(64))] + list(data))
+        if not keyed:
+            self._db.make_new_index(table, f"{table}_guild", [GUILD_COLUMN])
+
+    def add_to_table(self, table: str, data: Union[List[Any], Tuple[Any, ...]]) -> None:
+
+        shared, guild = self._route(table)
+        self._db.add_to_table(shared, guild + list(data))
+
+    def add_many_to_table(self, table: str, columns: Tuple[str, ...], rows: List[Tuple[Any, ...]]) -> None:
+
+        shared, guild = self._route(table)
+        if not guild:
+            self._db.add_many_to_table(table, columns, rows)
+            return
+
+        guild_id = guild[0][1]
+        self._db.add_many_to_table(shared, (GUILD_COLUMN, ) + tuple(columns), [(guild_id, ) + tuple(i) for i in rows])
+
+    def multicount_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> int:
+
+        shared, guild = self._route(table)
+        return int(self._db.multicount_rows_from_table(shared, guild + searchparms))
+
+    def fetch_rows_from_table(self, table: str, search: List[Any]) -> Tuple[Any, ...]:
+
+        shared, guild = self._route(table)
+        if not guild:
+            return tuple(self._db.fetch_rows_from_table(table, search))
+
+        return tuple(i[1:] for i in self._db.multifetch_rows_from_table(shared, guild + [search]))
+
+    def multifetch_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> Tuple[Any, ...]:
+
+        shared, guild = self._route(table)
+        if not guild:
+            return tuple(self._db.multifetch_rows_from_table(table, searchparms))
+
+        return tuple(i[1:] for i in self._db.multifetch_rows_from_table(shared, guild + searchparms))
+
+    def delete_rows_from_table(self, table: str, column_search: List[Any]) -> None:
+
+        shared, guild = self._route(table)
+        self._db.multidelete_rows_from_table(shared, guild + [column_search])
+
+    def multidelete_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> None:
+
+        shared, guild = self._route(table)
+        self._db.multidelete_rows_from_table(shared, guild + searchparms)
+
+    def delete_table(self, table: str) -> None:
+
+        # deleting a guilds table deletes its rows, the shared table stays
+        shared, guild = self._route(table)
+        if not guild:
+            self._db.delete_table(table)
+            return
+
+        self._db.multidelete_rows_from_table(shared, guild)
+
+    def fetch_table(self, table: str) -> Tuple[Any, ...]:
+
+        shared, guild = self._route(table)
+        if not guild:
+            return tuple(self._db.fetch_table(table))
+
+        return tuple(i[1:] for i in self._db.multifetch_rows_from_table(shared, guild))
+
+    def fetch_all_guilds(self, name: str) -> Tuple[Tuple[Any, ...], ...]:
+        """
+        Fetches a table for every guild in one query, each row starts with the guild prefix its per guild table would have
+
+        :returns: Tuple[Tuple[Any, ...], ...] - The rows of every guild
+        """
+        return tuple((_guild_prefix(i[0]), ) + tuple(i[1:]) for i in self._db.fetch_table(SHARED_PREFIX + name))
+
+    def list_tables(self, searchterm: str) -> Tuple[Tuple[str], ...]:
+
+        # db_hlapi searches %_{name} for every guilds table of a kind, those are the guilds with rows in the shared table
+        if not searchterm.startswith("%_"):
+            return tuple(self._db.list_tables(searchterm))
+
+        name = searchterm[2:]
+        if not self._db.list_tables(SHARED_PREFIX + name):
+            return ()
+
+        guilds = sorted({i[0] for i in self._db.fetch_table(SHARED_PREFIX + name)})
+        return tuple((f"{_guild_prefix(i)}_{name}", ) for i in guilds)
+
+    def ping(self) -> None:
+        self._db.ping()
+
+    def commit(self) -> None:
+        self._db.commit()
+
+    def rollback(self) -> None:
+        self._db.rollback()
+
+    def close(self) -> None:
+        self._db.close()
+        self.closed = True
+
+    def __exit__(self, err_type: Any, err_value: Any, err_traceback: Any) -> None:
+        self._db.__exit__(err_type, err_value, err_traceback)
+
+
+def wrap_handler(handler: Callable[[Any], Any]) -> Callable[[Any], shared_schema_handler]:
+    """
+    Returns a db_handler constructor that connects with handler and stores guilds in shared tables
+    """
+    return lambda connection_parameters: shared_schema_handler(handler(connection_parameters))
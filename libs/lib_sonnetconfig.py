@@ -17,7 +17,16 @@ __all__ = [
     "STARBOARD_EMOJI",
     "STARBOARD_COUNT",
     "DB_TYPE",
+    "DB_SCHEMA",
     "SQLITE3_LOCATION",
+    "DB_POOL_SIZE",
+    "SQLITE3_JOURNAL_MODE",
+    "SQLITE3_SYNCHRONOUS",
+    "SQLITE3_CACHE_SIZE",
+    "SQLITE3_MMAP_SIZE",
+    "SQLITE3_COMMIT_POLICY",
+    "DB_WRITE_BEHIND_MS",
+    "DB_WRITE_BEHIND_BATCH",
     "REGEX_VERSION",
     "CLIB_LOAD",
     "GOLIB_LOAD",
@@ -59,7 +68,16 @@ BLACKLIST_ACTION = _load_cfg("BLACKLIST_ACTION", "warn", str, lambda s: s in {"w
 STARBOARD_EMOJI = _load_cfg("STARBOARD_EMOJI", "⭐", str)
 STARBOARD_COUNT = _load_cfg("STARBOARD_COUNT", "5", str, lambda s: s.isdigit(), "Starboard Count is not digit")
 DB_TYPE = _load_cfg("DB_TYPE", "mariadb", str, lambda s: s in {"mariadb", "sqlite3"}, "Database type not valid")
+DB_SCHEMA = _load_cfg("DB_SCHEMA", "per-guild", str, lambda s: s in {"per-guild", "shared"}, "Database schema not valid")
 SQLITE3_LOCATION = _load_cfg("SQLITE3_LOCATION", "datastore/sonnetdb.db", str)
+DB_POOL_SIZE = _load_cfg("DB_POOL_SIZE", 4, int, lambda i: i > 0, "Database pool size must be at least 1")
+SQLITE3_JOURNAL_MODE = _load_cfg("SQLITE3_JOURNAL_MODE", "WAL", str, lambda s: s.upper() in {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}, "sqlite3 journal mode not valid")
+SQLITE3_SYNCHRONOUS = _load_cfg("SQLITE3_SYNCHRONOUS", "", str, lambda s: s.upper() in {"", "OFF", "NORMAL", "FULL", "EXTRA"}, "sqlite3 synchronous mode not valid")
+SQLITE3_CACHE_SIZE = _load_cfg("SQLITE3_CACHE_SIZE", -8000, int)
+SQLITE3_MMAP_SIZE = _load_cfg("SQLITE3_MMAP_SIZE", 0, int, lambda i: i >= 0, "sqlite3 mmap size is negative")
+DB_WRITE_BEHIND_MS = _load_cfg("DB_WRITE_BEHIND_MS", 50, int, lambda i: i >= 0, "Database write-behind interval is negative")
+DB_WRITE_BEHIND_BATCH = _load_cfg("DB_WRITE_BEHIND_BATCH", 512, int, lambda i: i > 0, "Database write-behind batch size must be at least 1")
+SQLITE3_COMMIT_POLICY = _load_cfg("SQLITE3_COMMIT_POLICY", "sync", str, lambda s: s in {"sync", "group"}, "sqlite3 commit policy not valid")
 REGEX_VERSION = _load_cfg("REGEX_VERSION", "re2", str, _assertre2, "RegEx ver is not re or re2")
 CLIB_LOAD = _load_cfg("CLIB_LOAD", True, bool)
 GOLIB_LOAD = _load_cfg("GOLIB_LOAD", True, bool)
@@ -3,13 +3,18 @@
 
 import importlib
 
+import asyncio
+import concurrent.futures
+import queue
 import threading
 import warnings
 import io
+import time
+import logging
 
-from lib_sonnetconfig import DB_TYPE, SQLITE3_LOCATION
+from lib_sonnetconfig import DB_TYPE, DB_SCHEMA, SQLITE3_LOCATION, DB_POOL_SIZE, DB_WRITE_BEHIND_MS, DB_WRITE_BEHIND_BATCH
 
-from typing import Union, Dict, List, Tuple, Optional, Any, Type, Protocol, cast
+from typing import Union, Dict, List, Tuple, Optional, Any, Type, Protocol, Callable, Iterable, Set, TypeVar, cast
 
 db_handler: Type["_DataBaseHandler"]
 
@@ -31,6 +36,12 @@ elif DB_TYPE == "sqlite3":
 else:
     raise RuntimeError("Could not load database backend (non valid specifier)")
 
+# The shared schema layer keeps the backend but stores guilds in shared tables instead of tables per guild
+if DB_SCHEMA == "shared":
+    import lib_shared_schema
+    importlib.reload(lib_shared_schema)
+    db_handler = cast(Type["_DataBaseHandler"], lib_shared_schema.wrap_handler(db_handler))
+
 
 class _DataBaseHandler(Protocol):
     @property
@@ -52,6 +63,9 @@ class _DataBaseHandler(Protocol):
     def add_to_table(self, table: str, data: Union[List[Any], Tuple[Any, ...]], /) -> None:
         ...
 
+    def add_many_to_table(self, table: str, columns: Tuple[str, ...], rows: List[Tuple[Any, ...]], /) -> None:
+        ...
+
     def multicount_rows_from_table(self, table: str, searchparms: List[List[Any]], /) -> int:
         ...
 
@@ -64,6 +78,9 @@ class _DataBaseHandler(Protocol):
     def delete_rows_from_table(self, table: str, column_search: List[Any], /) -> None:
         ...
 
+    def multidelete_rows_from_table(self, table: str, searchparms: List[List[Any]], /) -> None:
+        ...
+
     def delete_table(self, table: str, /) -> None:
         ...
 
@@ -79,6 +96,9 @@ class _DataBaseHandler(Protocol):
     def commit(self, /) -> None:
         ...
 
+    def rollback(self, /) -> None:
+        ...
+
     def close(self, /) -> None:
         ...
 
@@ -114,21 +134,155 @@ def db_grab_connection() -> _DataBaseHandler:  # pytype: disable=invalid-annotat
             raise DATABASE_FATAL_CONNECTION_LOSS("Database connection failure")
 
 
+class guild_db_cost:
+    __slots__ = "queries", "seconds"
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# Query counts and time per guild (None for global tables), read by the kernel for debug-guild-cost
+guild_query_stats: Dict[Optional[int], guild_db_cost] = {}
+
+
+def _guild_cost(guild_id: Optional[int]) -> guild_db_cost:
+    try:
+        return guild_query_stats[guild_id]
+    except KeyError:
+        cost = guild_query_stats[guild_id] = guild_db_cost()
+        return cost
+
+
+class _counted_connection:
+    """
+    Forwards to a database handler, charging the count and time of every call to a guild
+    """
+    __slots__ = "_db", "_cost"
+
+    def __init__(self, db: _DataBaseHandler, cost: guild_db_cost) -> None:
+        self._db = db
+        self._cost = cost
+
+    def __getattr__(self, name: str) -> Any:
+
+        attr = getattr(self._db, name)
+
+        if not callable(attr):
+            return attr
+
+        cost = self._cost
+
+        def counted(*args: Any) -> Any:
+            tstart = time.perf_counter()
+            try:
+                return attr(*args)
+            finally:
+                cost.queries += 1
+                cost.seconds += time.perf_counter() - tstart
+
+        return counted
+
+
 # Define base infraction type
 InfractionT = Tuple[str, str, str, str, str, int]
 # Unused currently, will roll into new apis as DBV1.1 rolls out
 TaggedInfractionT = Tuple[str, str, str, str, str, int, int]
 
-__all__ = ["db_hlapi", "DATABASE_FATAL_CONNECTION_LOSS"]
+__all__ = ["db_hlapi", "async_db_hlapi", "DATABASE_FATAL_CONNECTION_LOSS"]
+
+T = TypeVar("T")
+
+EnumSchemaT = List[Tuple[str, Type[Union[str, int]]]]
+
+# Tables every guild has
+_builtin_enums: Dict[str, EnumSchemaT] = {
+    "config": [("property", str), ("value", str)],
+    "infractions": [("infractionID", str), ("userID", str), ("moderatorID", str), ("type", str), ("reason", str), ("timestamp", int)],
+    "mutes": [("infractionID", str), ("userID", str), ("endMute", int)],
+    }
+
+
+def _validate_enum(schema: EnumSchemaT) -> bool:
+    for i in schema:
+        if not isinstance(i[0], str) or i[1] not in [str, int]:
+            return False
+    return True
+
+
+def _enum_row(name: str, schema: EnumSchemaT, cpush: List[Union[str, int]]) -> Tuple[Tuple[str, ...], Tuple[Union[str, int], ...]]:
+    """
+    Checks a row against an enum schema
+
+    :returns: Tuple[Tuple[str, ...], Tuple[Union[str, int], ...]] - The column names and values of the row
+    :raises: TypeError - The row does not match the schema
+    """
+
+    if len(cpush) != len(schema):
+        raise TypeError(f"Length of table does not match length of input ({len(cpush)} != {len(schema)})")
+
+    for index, i in enumerate(cpush):
+        if not isinstance(i, schema[index][1]):
+            errtuple = schema[index]
+            errbuilder = io.StringIO()
+            errbuilder.write(f"Improper type passed based on enum registry, index: {index} name: {errtuple[0]}\n")
+            errbuilder.write(f"(given type '{type(i).__name__}' is not type '{errtuple[1].__name__}')")
+            raise TypeError(errbuilder.getvalue())
+
+    return tuple(i[0] for i in schema), tuple(cpush)
+
+
+# Indexes every infractions table gets, by name suffix, covering the user, moderator and type filters of grab_filter_infractions
+# the users and moderators indexes lead with timestamp after the filtered column so sorting by time stays on the index
+_infraction_indexes: Dict[str, List[str]] = {
+    "users_time": ["userID", "timestamp"],
+    "moderators_time": ["moderatorID", "timestamp"],
+    "types": ["type"],
+    }
+
+# Infractions tables that have their indexes, so index DDL runs once per table and never on reads
+# filled from database workers as well, it only grows and set.add is atomic, kept across reloads
+_indexed_tables: Set[str] = globals().get("_indexed_tables", set())
+
+
+def _infraction_matches(row: Tuple[Any, ...], search: List[List[str]]) -> bool:
+    """
+    Applies a grab_filter_infractions search to an infraction row in memory
+    """
+
+    columns = [i[0] for i in _builtin_enums["infractions"]]
+
+    for column, value, *op in search:
+        field = str(row[columns.index(column)])
+        # only prefix patterns are used, LIKE is case insensitive
+        if op and op[0] == "LIKE":
+            if not field.upper().startswith(value[:-1].upper()):
+                return False
+        elif op and op[0] == "NOT LIKE":
+            if field.upper().startswith(value[:-1].upper()):
+                return False
+        elif field != value:
+            return False
+
+    return True
 
 
 # Because being lazy writes good code
 class db_hlapi:
 
-    __slots__ = "_db", "database", "guild", "hlapi_version", "_sonnet_db_version", "__enum_input", "__enum_pool"
+    __slots__ = "_db", "database", "guild", "hlapi_version", "_sonnet_db_version", "__enum_input", "__enum_pool", "_staged_reads"
+
+    def __init__(self, guild_id: Optional[int], lock: Optional[threading.Lock] = None, *, connection: Optional[_DataBaseHandler] = None) -> None:
+
+        # async_db_hlapi passes its pooled connection and charges the guild itself, from the event loop
+        if connection is not None:
+            self._db = connection
+        else:
+            self._db = cast(_DataBaseHandler, _counted_connection(db_grab_connection(), _guild_cost(guild_id)))
+
+        # Pooled connections are used from database workers, which must not touch the write-behind queue
+        self._staged_reads = connection is None
 
-    def __init__(self, guild_id: Optional[int], lock: Optional[threading.Lock] = None) -> None:
-        self._db = db_grab_connection()
         self.database = self._db  # Deprecated name
         self.guild: Optional[int] = guild_id
 
@@ -141,9 +295,8 @@ class db_hlapi:
         self.__enum_input: Dict[str, List[Tuple[str, Type[Union[str, int]]]]] = {}
         self.__enum_pool: Dict[str, List[Tuple[Any, ...]]] = {}
 
-        self.inject_enum("config", [("property", str), ("value", str)])
-        self.inject_enum("infractions", [("infractionID", str), ("userID", str), ("moderatorID", str), ("type", str), ("reason", str), ("timestamp", int)])
-        self.inject_enum("mutes", [("infractionID", str), ("userID", str), ("endMute", int)])
+        for name, schema in _builtin_enums.items():
+            self.inject_enum(name, schema)
 
     def __enter__(self) -> "db_hlapi":
         return self
@@ -163,10 +316,29 @@ class db_hlapi:
             return (1, 0, 0)
 
     def _validate_enum(self, schema: List[Tuple[str, Type[Union[str, int]]]]) -> bool:
-        for i in schema:
-            if not isinstance(i[0], str) or i[1] not in [str, int]:
-                return False
-        return True
+        return _validate_enum(schema)
+
+    def _staged(self, name: str, key: Union[str, int]) -> Any:
+        """
+        Returns the row staged for key in the write-behind queue, None if a delete is staged, or _unstaged
+        """
+        return _write_behind.lookup(self.guild, name, key) if self._staged_reads else _unstaged
+
+    def _merge_staged(self, name: str, rows: Iterable[Tuple[Any, ...]], keep: Callable[[Tuple[Any, ...]], bool] = lambda row: True) -> List[Tuple[Any, ...]]:
+        """
+        Applies rows staged in the write-behind queue over rows read from the database, keyed by primary key
+        keep filters the staged rows, rows from the database are expected to already be filtered
+        """
+
+        if not self._staged_reads or not (staged := _write_behind.staged(self.guild, name)):
+            return list(rows)
+
+        return [i for i in rows if i[0] not in staged] + [i for i in staged.values() if i is not None and keep(i)]
+
+    def _supersede(self, name: str, key: Union[str, int], row: "_StagedRow") -> None:
+        # a direct write must not be overwritten when an older staged write to the same row commits
+        if self._staged_reads:
+            _write_behind.supersede(self.guild, name, key, row)
 
     def inject_enum(self, enumname: str, schema: List[Tuple[str, Type[Union[str, int]]]], *, use_primary: bool = True) -> None:
         """
@@ -221,6 +393,9 @@ class db_hlapi:
         if not isinstance(cname, self.__enum_input[name][0][1]):
             raise TypeError("grab type does not match enum PK signature")
 
+        if (staged := self._staged(name, cname)) is not _unstaged:
+            return cast(Optional[List[Union[str, int]]], staged)
+
         try:
             data = self._db.fetch_rows_from_table(f"{self.guild}_{name}", [self.__enum_input[name][0][0], cname])
         except db_error.OperationalError:
@@ -240,18 +415,8 @@ class db_hlapi:
         if name not in self.__enum_pool:
             raise TypeError(f"Trying to set to table that is not registered ({name})")
 
-        if len(cpush) != len(self.__enum_input[name]):
-            raise TypeError(f"Length of table does not match length of input ({len(cpush)} != {len(self.__enum_input[name])})")
-
-        for index, i in enumerate(cpush):
-            if not isinstance(i, self.__enum_input[name][index][1]):
-                errtuple = self.__enum_input[name][index]
-                errbuilder = io.StringIO()
-                errbuilder.write(f"Improper type passed based on enum registry, index: {index} name: {errtuple[0]}\n")
-                errbuilder.write(f"(given type '{type(i).__name__}' is not type '{errtuple[1].__name__}')")
-                raise TypeError(errbuilder.getvalue())
-
-        push = tuple(zip(map(lambda i: i[0], self.__enum_input[name]), cpush))
+        columns, values = _enum_row(name, self.__enum_input[name], cpush)
+        push = tuple(zip(columns, values))
 
         try:
             self._db.add_to_table(f"{self.guild}_{name}", push)
@@ -259,6 +424,8 @@ class db_hlapi:
             self.create_guild_db()
             self._db.add_to_table(f"{self.guild}_{name}", push)
 
+        self._supersede(name, values[0], (columns, values))
+
     def delete_enum(self, enumname: str, key: Union[str, int]) -> None:
         """
         Deletes a row in an enums table based on primary key
@@ -279,6 +446,8 @@ class db_hlapi:
         except db_error.OperationalError:
             pass
 
+        self._supersede(enumname, key, None)
+
     def list_enum(self, enumName: str) -> List[Union[str, int]]:
         """
         Returns a list of an enums primary keys, fetched from the db
@@ -289,9 +458,11 @@ class db_hlapi:
             raise TypeError(f"Trying to list from table that is not registered ({enumName} not registered)")
 
         try:
-            return cast(List[Union[str, int]], [i[0] for i in self._db.fetch_table(f"{self.guild}_{enumName}")])
+            rows: Tuple[Any, ...] = self._db.fetch_table(f"{self.guild}_{enumName}")
         except db_error.OperationalError:
-            return []
+            rows = ()
+
+        return [i[0] for i in self._merge_staged(enumName, rows)]
 
     def enum_context(self, enumName: str) -> "_enum_context":
         """
@@ -318,6 +489,40 @@ class db_hlapi:
         for i in self.__enum_pool:
             self._db.make_new_table(f"{self.guild}_{i}", self.__enum_pool[i])
 
+        self._index_infractions(f"{self.guild}_infractions")
+
+    def _index_infractions(self, table: str) -> None:
+
+        # mariadb can not index TEXT columns
+        if not self._db.TEXT_KEY:
+            return
+
+        for suffix, columns in _infraction_indexes.items():
+            self._db.make_new_index(table, f"{table}_{suffix}", columns)
+
+        _indexed_tables.add(table)
+
+    def verify_infraction_indexes(self) -> int:
+        """
+        Creates missing infraction indexes for every guild, committing after each table so schema locks are held briefly
+        Tables already indexed by this process are skipped
+        Not meant to be used in guild scope commands, only by startup routines
+
+        :returns: int - The number of tables that were checked
+        """
+
+        checked = 0
+
+        for (table, ) in self._db.list_tables("%_infractions"):
+            if table in _indexed_tables:
+                continue
+
+            self._index_infractions(table)
+            self._db.commit()
+            checked += 1
+
+        return checked
+
     def grab_config(self, config: str) -> Optional[str]:
         """
         Grabs a config from the guilds config table
@@ -325,6 +530,9 @@ class db_hlapi:
         :returns: Optional[str] - The configuration value
         """
 
+        if (staged := self._staged("config", config)) is not _unstaged:
+            return None if staged is None else cast(str, staged[1])
+
         try:
             data: Optional[Tuple[List[Any], ...]] = self._db.fetch_rows_from_table(f"{self.guild}_config", ["property", config])
         except db_error.OperationalError:
@@ -343,6 +551,8 @@ class db_hlapi:
             self.create_guild_db()
             self._db.add_to_table(f"{self.guild}_config", [["property", config], ["value", value]])
 
+        self._supersede("config", config, (("property", "value"), (config, value)))
+
     def delete_config(self, config: str) -> None:
 
         try:
@@ -350,6 +560,8 @@ class db_hlapi:
         except db_error.OperationalError:
             pass
 
+        self._supersede("config", config, None)
+
     # Grab infractions of a user
     def grab_user_infractions(self, userid: Union[int, str]) -> Tuple[List[Union[str, int]], ...]:
         """
@@ -398,16 +610,21 @@ class db_hlapi:
         elif automod is True:
             schm.append(["reason", "[AUTOMOD]%", "LIKE"])
 
+        # staged infractions are merged in python, so counting them means fetching the rows
+        staged = self._staged_reads and bool(_write_behind.staged(self.guild, "infractions"))
+
         try:
-            if self._db.TEXT_KEY:
-                self._db.make_new_index(f"{self.guild}_infractions", f"{self.guild}_infractions_users", ["userID"])
-                self._db.make_new_index(f"{self.guild}_infractions", f"{self.guild}_infractions_moderators", ["moderatorID"])
-            if count:
+            if count and not staged:
                 return self._db.multicount_rows_from_table(f"{self.guild}_infractions", schm)
-            else:
-                return cast(List[InfractionT], list(self._db.multifetch_rows_from_table(f"{self.guild}_infractions", schm)))
+            rows: Tuple[Any, ...] = self._db.multifetch_rows_from_table(f"{self.guild}_infractions", schm)
         except db_error.OperationalError:
-            return 0 if count else list()
+            if not staged:
+                return 0 if count else list()
+            rows = ()
+
+        infractions = self._merge_staged("infractions", rows, lambda row: _infraction_matches(row, schm))
+
+        return len(infractions) if count else cast(List[InfractionT], infractions)
 
     # Check if a message is on the starboard already
     def in_starboard(self, message_id: int) -> bool:
@@ -435,6 +652,9 @@ class db_hlapi:
 
     def grab_infraction(self, infractionID: str) -> Optional[InfractionT]:
 
+        if (staged := self._staged("infractions", infractionID)) is not _unstaged:
+            return cast(Optional[InfractionT], staged)
+
         try:
             infraction: Any = self._db.fetch_rows_from_table(f"{self.guild}_infractions", ["infractionID", infractionID])
         except db_error.OperationalError:
@@ -449,6 +669,8 @@ class db_hlapi:
         except db_error.OperationalError:
             pass
 
+        self._supersede("infractions", infraction_id, None)
+
     def mute_user(self, user: int, endtime: int, infractionID: str) -> None:
 
         try:
@@ -486,9 +708,10 @@ class db_hlapi:
 
         for i in ["config", "infractions", "starboard", "mutes"]:
             try:
-                dbdict[i].extend(self._db.fetch_table(f"{self.guild}_{i}"))
+                rows: Tuple[Any, ...] = self._db.fetch_table(f"{self.guild}_{i}")
             except db_error.OperationalError:
-                pass
+                rows = ()
+            dbdict[i].extend(cast(List[List[Union[str, int]]], self._merge_staged(i, rows)))
 
         return dbdict
 
@@ -533,11 +756,15 @@ class db_hlapi:
                     self._db.add_to_table(f"{self.guild}_{i}", tuple(zip(reimport[i][0], row)))
                 except db_error.OperationalError:
                     return False
+                self._supersede(i, row[0], (tuple(reimport[i][0]), tuple(row)))
 
         return True
 
     def delete_guild_db(self) -> None:
 
+        if self._staged_reads:
+            _write_behind.discard(self.guild)
+
         for i in ["config", "infractions", "starboard", "mutes"]:
             try:
                 self._db.delete_table(f"{self.guild}_{i}")
@@ -563,6 +790,8 @@ class db_hlapi:
             self.create_guild_db()
             self._db.add_to_table(table_name, quer)
 
+        self._supersede("infractions", infraction_id, (tuple(i[0] for i in quer), tuple(i[1] for i in quer)))
+
     def fetch_all_mutes(self) -> List[Tuple[str, str, str, int]]:
         """
         Fetches all mutes across all guilds
@@ -571,6 +800,10 @@ class db_hlapi:
         :returns: List[Tuple[str, str, str, int]] - Guild, InfractionID, UserId, Time to be unmuted
         """
 
+        # The shared schema keeps every guilds mutes in one table
+        if (fetch_all_guilds := getattr(self._db, "fetch_all_guilds", None)) is not None:
+            return [(str(row[0]), str(row[1]), str(row[2]), int(row[3])) for row in fetch_all_guilds("mutes")]
+
         # Grab list of tables
         guild_list: Tuple[Tuple[str], ...] = self._db.list_tables("%_mutes")
 
@@ -615,6 +848,33 @@ class db_hlapi:
 
         return mutetable
 
+    def _write_staged(self, rows: Dict["_StagedKey", "_StagedRow"]) -> None:
+        """
+        Writes rows from the write-behind queue, with one executemany per table and column set
+        Does not commit, the queue commits a whole batch at once
+        """
+
+        groups: Dict[Tuple[str, Tuple[str, ...]], List[Tuple[Any, ...]]] = {}
+
+        for (name, key), row in rows.items():
+            if row is None:
+                self.delete_enum(name, key)
+                continue
+
+            columns, values = row
+            # databases older than 1.1.0 have no infraction flags column
+            if name == "infractions" and self._sonnet_db_version < (1, 1, 0):
+                columns, values = columns[:6], values[:6]
+
+            groups.setdefault((name, columns), []).append(values)
+
+        for (name, columns), batch in groups.items():
+            try:
+                self._db.add_many_to_table(f"{self.guild}_{name}", columns, batch)
+            except db_error.OperationalError:
+                self.create_guild_db()
+                self._db.add_many_to_table(f"{self.guild}_{name}", columns, batch)
+
     def close(self) -> None:
         self._db.commit()
 
@@ -655,3 +915,592 @@ class _enum_context:
         self._hlapi.list_enum.__doc__
 
         return self._hlapi.list_enum(self._name)
+
+
+# Async database access
+# db_hlapi does blocking I/O, so async_db_hlapi runs it on worker threads owned by a concurrent.futures executor
+# workers only ever touch their own pooled connection and never asyncio or discord state, results come back through run_in_executor
+
+
+class _connection_pool:
+    """
+    Idle database connections for the executor, a connection is only ever used by one worker at a time
+    """
+    __slots__ = "size", "_idle"
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._idle: "queue.SimpleQueue[_DataBaseHandler]" = queue.SimpleQueue()
+
+    def _connect(self) -> _DataBaseHandler:
+        try:
+            return db_handler(db_connection_parameters)
+        except db_error.Error:
+            raise DATABASE_FATAL_CONNECTION_LOSS("Database connection failure")
+
+    def acquire(self) -> _DataBaseHandler:
+
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+        try:
+            connection.ping()
+            return connection
+        except (db_error.Error, db_error.InterfaceError):
+            return self._connect()
+
+    def release(self, connection: _DataBaseHandler) -> None:
+        if self._idle.qsize() < self.size:
+            self._idle.put(connection)
+        else:
+            connection.close()
+
+
+# A reload keeps the pool and executor, replacing them would leave the old worker threads and idle connections open
+_pool: _connection_pool = globals().get("_pool") or _connection_pool(DB_POOL_SIZE)
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = globals().get("_executor")
+
+
+def _db_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="sonnet-db")
+    return _executor
+
+
+def _run_pooled(guild_id: Optional[int], enums: Dict[str, Tuple[EnumSchemaT, bool]], func: Callable[[db_hlapi], T]) -> T:
+
+    connection = _pool.acquire()
+
+    try:
+        with db_hlapi(guild_id, connection=connection) as db:
+            for name, (schema, use_primary) in enums.items():
+                db.inject_enum(name, schema, use_primary=use_primary)
+            return func(db)
+    finally:
+        _pool.release(connection)
+
+
+# (enum name, primary key) of a staged row
+_StagedKey = Tuple[str, Union[str, int]]
+# columns and values of a staged row, None stages a delete
+_StagedRow = Optional[Tuple[Tuple[str, ...], Tuple[Any, ...]]]
+# rows and custom enums of one guild in a write-behind batch
+_StagedGuild = Tuple[Dict[_StagedKey, _StagedRow], Dict[str, Tuple[EnumSchemaT, bool]]]
+
+# staged rows of a guild that were not written, with the error they failed on
+_FailedRows = Tuple[Optional[int], Dict[_StagedKey, _StagedRow], BaseException]
+
+# returned by lookups for rows that are not staged
+_unstaged: Any = object()
+
+# Write-behind failures go to the kernel error log
+_log = logging.getLogger("lexdpyk.errors")
+
+
+def _transient(err: BaseException) -> bool:
+    # lost connections and lock contention clear up on their own, anything else fails the same way on every retry
+    if isinstance(err, DATABASE_FATAL_CONNECTION_LOSS):
+        return True
+    return isinstance(err, (db_error.Error, db_error.OperationalError)) and db_error.transient(err)
+
+
+def _write_guilds(connection: _DataBaseHandler, batch: Dict[Optional[int], _StagedGuild]) -> None:
+
+    try:
+        for guild_id, (rows, enums) in batch.items():
+            db = db_hlapi(guild_id, connection=connection)
+            for name, (schema, use_primary) in enums.items():
+                db.inject_enum(name, schema, use_primary=use_primary)
+            db._write_staged(rows)
+
+        connection.commit()
+    except (db_error.Error, db_error.OperationalError):
+        connection.rollback()
+        raise
+
+
+def _write_batch(batch: Dict[Optional[int], _StagedGuild]) -> List[_FailedRows]:
+    """
+    Writes a write-behind batch on one pooled connection as a single transaction
+    If that fails every guild is written in its own transaction, and the rows of a guild that still fails one at a time,
+    so a bad row only holds back itself, errors that clear up on their own are not split further
+
+    :returns: List[_FailedRows] - Rows that were not written and the error each failed on
+    """
+
+    connection = _pool.acquire()
+
+    try:
+        try:
+            _write_guilds(connection, batch)
+            return []
+        except (db_error.Error, db_error.OperationalError) as err:
+            if _transient(err):
+                return [(guild_id, rows, err) for guild_id, (rows, _) in batch.items()]
+
+        failed: List[_FailedRows] = []
+
+        for guild_id, (rows, enums) in batch.items():
+            try:
+                _write_guilds(connection, {guild_id: (rows, enums)})
+                continue
+            except (db_error.Error, db_error.OperationalError) as err:
+                if _transient(err) or len(rows) == 1:
+                    failed.append((guild_id, rows, err))
+                    continue
+
+            for key, row in rows.items():
+                try:
+                    _write_guilds(connection, {guild_id: ({key: row}, enums)})
+                except (db_error.Error, db_error.OperationalError) as err:
+                    failed.append((guild_id, {key: row}, err))
+
+        return failed
+    finally:
+        _pool.release(connection)
+
+
+class _write_behind_queue:
+    """
+    Buffers writes from async_db_hlapi and commits them in batches, once interval seconds pass or batch_size rows are staged
+    Staged rows stay readable through lookup() until their batch commits, only one batch is written at a time so batches commit in order
+    Rows that fail on a lost connection or a locked database are retried with backoff, rows that fail on anything else are dropped and logged
+    Only used from the event loop, except drain() which runs after the loop has stopped
+    """
+    __slots__ = "interval", "batch_size", "pending", "flushing", "enums", "size", "flushes", "rows_flushed", "rows_dropped", "_retries", "_timer", "_inflight", "_cfuture", "_tstart"
+
+    def __init__(self, interval: float, batch_size: int) -> None:
+        self.interval = interval
+        self.batch_size = batch_size
+        # rows waiting for the next batch and rows in the batch being written, per guild
+        self.pending: Dict[Optional[int], Dict[_StagedKey, _StagedRow]] = {}
+        self.flushing: Dict[Optional[int], Dict[_StagedKey, _StagedRow]] = {}
+        # custom enums a guilds rows may need tables for
+        self.enums: Dict[Optional[int], Dict[str, Tuple[EnumSchemaT, bool]]] = {}
+        self.size = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.rows_dropped = 0
+        # batches in a row that had rows to retry, for backoff
+        self._retries = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: Optional["asyncio.Future[List[_FailedRows]]"] = None
+        self._cfuture: Optional["concurrent.futures.Future[List[_FailedRows]]"] = None
+        self._tstart = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def lookup(self, guild_id: Optional[int], name: str, key: Union[str, int]) -> Any:
+        """
+        Returns the staged values for a row, None if a delete is staged, or _unstaged
+        """
+
+        for rows in (self.pending.get(guild_id), self.flushing.get(guild_id)):
+            if rows is not None and (row := rows.get((name, key), _unstaged)) is not _unstaged:
+                return None if row is None else row[1]
+
+        return _unstaged
+
+    def staged(self, guild_id: Optional[int], name: str) -> Dict[Union[str, int], Optional[Tuple[Any, ...]]]:
+        """
+        Returns the staged values of every row in a table by primary key, None where a delete is staged
+        """
+
+        out: Dict[Union[str, int], Optional[Tuple[Any, ...]]] = {}
+
+        # pending rows are newer than the batch being written
+        for rows in (self.flushing.get(guild_id), self.pending.get(guild_id)):
+            if rows:
+                out.update((key, None if row is None else row[1]) for (table, key), row in rows.items() if table == name)
+
+        return out
+
+    def stage(self, guild_id: Optional[int], name: str, key: Union[str, int], row: _StagedRow, enums: Optional[Dict[str, Tuple[EnumSchemaT, bool]]] = None) -> None:
+
+        rows = self.pending.setdefault(guild_id, {})
+        if (name, key) not in rows:
+            self.size += 1
+        rows[(name, key)] = row
+
+        if enums:
+            self.enums.setdefault(guild_id, {}).update(enums)
+
+        self._schedule()
+
+    def supersede(self, guild_id: Optional[int], name: str, key: Union[str, int], row: _StagedRow) -> None:
+        """
+        Restages a row that was written directly if an older write to it is still staged
+        """
+        if self.lookup(guild_id, name, key) is not _unstaged:
+            self.stage(guild_id, name, key, row)
+
+    def discard(self, guild_id: Optional[int]) -> None:
+        """
+        Drops rows staged for a guild that have not started writing
+        """
+        self.size -= len(self.pending.pop(guild_id, {}))
+
+    def adopt(self, other: Any) -> None:
+        """
+        Takes over rows another queue has not started writing, used when this module is reloaded
+        """
+
+        for guild_id, rows in other.pending.items():
+            self._requeue(guild_id, rows)
+            self.enums.setdefault(guild_id, {}).update(other.enums.get(guild_id, {}))
+
+        other.pending = {}
+        other.size = 0
+
+        if self.pending:
+            self._schedule()
+
+    async def settle(self, guild_id: Optional[int]) -> None:
+        """
+        Waits until every write staged for a guild has committed
+
+        :raises: db_error.Error - Writes of the guild failed, they stay staged if the error clears up on its own and are dropped otherwise
+        :raises: DATABASE_FATAL_CONNECTION_LOSS - The batch could not get a connection, the writes stay staged
+        """
+
+        while guild_id in self.pending or guild_id in self.flushing:
+            # no-op if a batch is already being written
+            self._start()
+            if self._inflight is not None:
+                # other guilds failures in the same batch are not this guilds to raise
+                for failed_guild, _, err in await asyncio.shield(self._inflight):
+                    if failed_guild == guild_id:
+                        raise err
+
+    async def backpressure(self) -> None:
+        # stop producers from outrunning the database, the batch being written is waited on rather than starting more
+        if self.size >= self.batch_size * 4 and self._inflight is not None:
+            await asyncio.wait([self._inflight])
+
+    def drain(self) -> None:
+        """
+        Writes out every staged row from the calling thread, for use once the event loop has stopped
+        """
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        # a batch handed to the executor finishes even after the loop stops, but its done callback never runs
+        if self._cfuture is not None:
+            try:
+                failed = self._cfuture.result()
+            except (db_error.Error, db_error.OperationalError, DATABASE_FATAL_CONNECTION_LOSS) as err:
+                failed = [(guild_id, rows, err) for guild_id, rows in self.flushing.items()]
+            # retried once more below, whatever the error was
+            for guild_id, rows, _ in failed:
+                self._requeue(guild_id, rows)
+            self.flushing = {}
+            self._cfuture = self._inflight = None
+
+        if self.pending:
+            batch = self._take()
+            self.flushing = {}
+            try:
+                failed = _write_batch(batch)
+            except (db_error.Error, db_error.OperationalError, DATABASE_FATAL_CONNECTION_LOSS) as err:
+                failed = [(guild_id, rows, err) for guild_id, (rows, _) in batch.items()]
+
+            for guild_id, rows, error in failed:
+                self.rows_dropped += len(rows)
+                _log.error(f"Write-behind lost {len(rows)} rows of guild {guild_id} at shutdown: {type(error).__name__}: {error}", exc_info=error)
+
+    def _schedule(self) -> None:
+
+        # the done callback of the batch being written schedules the next one
+        if self._inflight is not None:
+            return
+
+        if self.size >= self.batch_size:
+            self._start()
+        elif self._timer is None:
+            try:
+                self._timer = asyncio.get_running_loop().call_later(self.interval, self._start)
+            except RuntimeError:
+                # no loop to write on, drain() picks the rows up
+                return
+
+    def _take(self) -> Dict[Optional[int], _StagedGuild]:
+
+        batch = {guild_id: (rows, dict(self.enums.get(guild_id, {}))) for guild_id, rows in self.pending.items()}
+
+        self.flushing = self.pending
+        self.pending = {}
+        self.size = 0
+
+        return batch
+
+    def _start(self) -> None:
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if self._inflight is not None or not self.pending:
+            return
+
+        batch = self._take()
+
+        self._tstart = time.perf_counter()
+        # submitted directly instead of through run_in_executor, drain() needs the executor future once the loop is gone
+        self._cfuture = _db_executor().submit(_write_batch, batch)
+        self._inflight = asyncio.wrap_future(self._cfuture)
+        self._inflight.add_done_callback(self._done)
+
+    def _requeue(self, guild_id: Optional[int], rows: Dict[_StagedKey, _StagedRow]) -> None:
+
+        target = self.pending.setdefault(guild_id, {})
+
+        # rows staged since are newer
+        for key, row in rows.items():
+            if key not in target:
+                target[key] = row
+                self.size += 1
+
+    def _done(self, future: "asyncio.Future[List[_FailedRows]]") -> None:
+
+        batch = self.flushing
+        self.flushing = {}
+        self._inflight = self._cfuture = None
+
+        elapsed = time.perf_counter() - self._tstart
+
+        failed: List[_FailedRows]
+        retry: List[_FailedRows] = []
+
+        if future.cancelled():
+            retry = [(guild_id, rows, asyncio.CancelledError()) for guild_id, rows in batch.items()]
+            failed = []
+        elif (err := future.exception()) is not None:
+            # the batch did not get far enough to split, a lost connection or a bug
+            failed = [(guild_id, rows, err) for guild_id, rows in batch.items()]
+        else:
+            failed = future.result()
+
+        for guild_id, rows, err in failed:
+            if _transient(err):
+                retry.append((guild_id, rows, err))
+            else:
+                self.rows_dropped += len(rows)
+                _log.error(f"Write-behind dropped {len(rows)} rows of guild {guild_id}: {type(err).__name__}: {err}", exc_info=err)
+
+        self.flushes += 1
+        self.rows_flushed += sum(len(i) for i in batch.values()) - sum(len(rows) for _, rows, _ in failed)
+
+        # every guild in the batch is charged one query and an even share of its time
+        for guild_id in batch:
+            cost = _guild_cost(guild_id)
+            cost.queries += 1
+            cost.seconds += elapsed / len(batch)
+
+        if retry:
+            # the rows stay readable meanwhile, retries back off while the database stays unavailable
+            for guild_id, rows, _ in retry:
+                self._requeue(guild_id, rows)
+            self._retries += 1
+            delay = min(self.interval * 2**self._retries, 10.0)
+            _log.warning(f"Write-behind retrying {sum(len(rows) for _, rows, _ in retry)} rows in {delay:.2f}s: {type(retry[0][2]).__name__}: {retry[0][2]}")
+            self._timer = asyncio.get_running_loop().call_later(delay, self._start)
+            return
+
+        self._retries = 0
+
+        if self.pending:
+            self._schedule()
+
+
+# A reload replaces the queue, rows the old one has not started writing move to the new one so reads keep seeing them
+_previous_write_behind: Any = globals().get("_write_behind")
+_write_behind = _write_behind_queue(DB_WRITE_BEHIND_MS / 1000, DB_WRITE_BEHIND_BATCH)
+if _previous_write_behind is not None:
+    _write_behind.adopt(_previous_write_behind)
+
+
+def flush_write_behind() -> None:
+    """
+    Commits every write still staged in the write-behind queue, the kernel calls this at shutdown after the event loop has stopped
+    """
+    _write_behind.drain()
+
+
+class async_db_hlapi:
+    """
+    An awaitable db_hlapi, calls run on pooled connections in the database executor so slow queries do not stall the event loop
+    Config, enum and infraction writes and deletes are staged in the write-behind queue and committed in batches,
+    reads see staged writes, other calls are their own transaction, use run() to batch several calls into one
+    """
+    __slots__ = "guild", "_enums"
+
+    def __init__(self, guild_id: Optional[int]) -> None:
+        self.guild: Optional[int] = guild_id
+        self._enums: Dict[str, Tuple[EnumSchemaT, bool]] = {}
+
+    async def __aenter__(self) -> "async_db_hlapi":
+        return self
+
+    async def __aexit__(self, err_type: Optional[Type[Exception]], err_value: Optional[str], err_traceback: Any) -> None:
+        return
+
+    async def run(self, func: Callable[[db_hlapi], T]) -> T:
+        """
+        Runs func on a worker with a db_hlapi for this guild, with any injected enums, and commits after it returns
+        Writes staged for this guild are committed first so func sees them
+
+        :returns: T - The return value of func
+        """
+
+        await _write_behind.settle(self.guild)
+
+        return await self._run(func)
+
+    async def _run(self, func: Callable[[db_hlapi], T]) -> T:
+
+        cost = _guild_cost(self.guild)
+
+        tstart = time.perf_counter()
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(_db_executor(), _run_pooled, self.guild, dict(self._enums), func)
+        finally:
+            # includes time spent waiting for a free worker
+            cost.queries += 1
+            cost.seconds += time.perf_counter() - tstart
+
+    async def _read_through(self, name: str, key: Union[str, int], func: Callable[[db_hlapi], T], staged: Callable[[Optional[Tuple[Any, ...]]], T]) -> T:
+        """
+        Returns staged(row) if a write to the row is staged, otherwise func's result from the database
+        The queue is checked again after the read since the row may have been staged while it ran
+        """
+
+        if (row := _write_behind.lookup(self.guild, name, key)) is not _unstaged:
+            return staged(row)
+
+        result = await self._run(func)
+
+        if (row := _write_behind.lookup(self.guild, name, key)) is not _unstaged:
+            return staged(row)
+
+        return result
+
+    async def _write(self, name: str, key: Union[str, int], row: _StagedRow, direct: Callable[[db_hlapi], None]) -> None:
+
+        if not _write_behind.enabled:
+            return await self.run(direct)
+
+        _write_behind.stage(self.guild, name, key, row, self._enums)
+        await _write_behind.backpressure()
+
+    def _schema(self, name: str) -> EnumSchemaT:
+        if name in self._enums:
+            return self._enums[name][0]
+        elif name in _builtin_enums:
+            return _builtin_enums[name]
+        raise TypeError(f"Trying to access table that is not registered ({name} not registered)")
+
+    def inject_enum(self, enumname: str, schema: EnumSchemaT, *, use_primary: bool = True) -> None:
+        """
+        Registers a custom table schema for later enum calls
+
+        :raises: TypeError - The schema passed is not valid
+        """
+        if not _validate_enum(schema):
+            raise TypeError("Invalid schema passed")
+
+        self._enums[enumname] = (schema, use_primary)
+
+    def enum_context(self, enumName: str) -> "_async_enum_context":
+        return _async_enum_context(self, enumName)
+
+    def inject_enum_context(self, enumName: str, schema: EnumSchemaT, *, use_primary: bool = True) -> "_async_enum_context":
+        self.inject_enum(enumName, schema, use_primary=use_primary)
+        return _async_enum_context(self, enumName)
+
+    async def grab_enum(self, name: str, cname: Union[str, int]) -> Optional[List[Union[str, int]]]:
+        return await self._read_through(name, cname, lambda db: db.grab_enum(name, cname), lambda row: cast(Optional[List[Union[str, int]]], row))
+
+    async def set_enum(self, name: str, cpush: List[Union[str, int]]) -> None:
+        columns, values = _enum_row(name, self._schema(name), cpush)
+        return await self._write(name, values[0], (columns, values), lambda db: db.set_enum(name, cpush))
+
+    async def delete_enum(self, enumname: str, key: Union[str, int]) -> None:
+        if not isinstance(key, self._schema(enumname)[0][1]):
+            raise TypeError("delete type does not match enum PK signature")
+        return await self._write(enumname, key, None, lambda db: db.delete_enum(enumname, key))
+
+    async def list_enum(self, enumName: str) -> List[Union[str, int]]:
+        return await self.run(lambda db: db.list_enum(enumName))
+
+    async def grab_config(self, config: str) -> Optional[str]:
+        return await self._read_through("config", config, lambda db: db.grab_config(config), lambda row: None if row is None else cast(str, row[1]))
+
+    async def add_config(self, config: str, value: str) -> None:
+        return await self._write("config", config, (("property", "value"), (config, value)), lambda db: db.add_config(config, value))
+
+    async def delete_config(self, config: str) -> None:
+        return await self._write("config", config, None, lambda db: db.delete_config(config))
+
+    async def grab_filter_infractions(self,
+                                      user: Optional[int] = None,
+                                      moderator: Optional[int] = None,
+                                      itype: Optional[str] = None,
+                                      automod: Optional[bool] = None,
+                                      count: bool = False) -> Union[List[InfractionT], int]:
+        return await self.run(lambda db: db.grab_filter_infractions(user=user, moderator=moderator, itype=itype, automod=automod, count=count))
+
+    async def grab_infraction(self, infractionID: str) -> Optional[InfractionT]:
+        return await self._read_through("infractions", infractionID, lambda db: db.grab_infraction(infractionID), lambda row: cast(Optional[InfractionT], row))
+
+    async def add_infraction(self, infraction_id: str, user_id: str, moderator_id: str, itype: str, reason: str, timestamp: int, automod: bool = False) -> None:
+        # the flags column is dropped when the batch is written to a database older than 1.1.0
+        row = (("infractionID", "userID", "moderatorID", "type", "reason", "timestamp", "flags"), (infraction_id, user_id, moderator_id, itype, reason, timestamp, int(automod)))
+        return await self._write("infractions", infraction_id, row, lambda db: db.add_infraction(infraction_id, user_id, moderator_id, itype, reason, timestamp, automod))
+
+    async def delete_infraction(self, infraction_id: str) -> None:
+        return await self._write("infractions", infraction_id, None, lambda db: db.delete_infraction(infraction_id))
+
+    # mutes are not staged
+    async def mute_user(self, user: int, endtime: int, infractionID: str) -> None:
+        return await self._run(lambda db: db.mute_user(user, endtime, infractionID))
+
+    async def unmute_user(self, infractionid: Optional[str] = None, userid: Optional[int] = None) -> None:
+        return await self._run(lambda db: db.unmute_user(infractionid=infractionid, userid=userid))
+
+    async def is_muted(self, userid: Optional[int] = None, infractionid: Optional[str] = None) -> bool:
+        return await self._run(lambda db: db.is_muted(userid=userid, infractionid=infractionid))
+
+
+class _async_enum_context:
+    __slots__ = "_hlapi", "_name"
+
+    def __init__(self, hlapi: async_db_hlapi, enum_name: str) -> None:
+
+        self._hlapi: async_db_hlapi = hlapi
+        self._name: str = enum_name
+
+    async def __aenter__(self) -> "_async_enum_context":
+        return self
+
+    async def __aexit__(self, err_type: Optional[Type[Exception]], err_value: Optional[str], err_traceback: Any) -> None:
+        return
+
+    async def grab(self, name: Union[str, int]) -> Optional[List[Union[str, int]]]:
+        return await self._hlapi.grab_enum(self._name, name)
+
+    async def set(self, cpush: List[Union[str, int]]) -> None:
+        return await self._hlapi.set_enum(self._name, cpush)
+
+    async def delete(self, name: Union[str, int]) -> None:
+        return await self._hlapi.delete_enum(self._name, name)
+
+    async def list(self) -> List[Union[str, int]]:
+        return await self._hlapi.list_enum(self._name)
@@ -3,14 +3,63 @@
 
 import sqlite3
 import io
+import functools
 from typing import List, Tuple, Any, Union
 
+from lib_sonnetconfig import SQLITE3_JOURNAL_MODE, SQLITE3_SYNCHRONOUS, SQLITE3_CACHE_SIZE, SQLITE3_MMAP_SIZE, SQLITE3_COMMIT_POLICY
+
 
 class db_error:  # DB error codes
     OperationalError = sqlite3.OperationalError
     InterfaceError = sqlite3.InterfaceError
     Error = sqlite3.Error
 
+    @staticmethod
+    def transient(err: BaseException) -> bool:
+        """
+        Returns True for errors that clear up on their own, a database busy or locked by another writer
+        """
+        # SQLITE_BUSY and SQLITE_LOCKED, extended codes keep the primary code in the low byte
+        if (code := getattr(err, "sqlite_errorcode", None)) is not None:
+            return (code & 0xFF) in (5, 6)
+        return isinstance(err, sqlite3.OperationalError) and "locked" in str(err)
+
+
+def _check_name(name: str) -> None:
+    # Test for attack
+    if "\\" in name or "'" in name:
+        raise db_error.OperationalError("Detected SQL injection attack")
+
+
+# SQL text is memoized per statement shape (table, columns, operators), so repeated queries skip rebuilding it
+# table names are checked when a shape is first built, failures are not cached so they raise every time
+@functools.lru_cache(maxsize=4096)
+def _insert_sql(table: str, columns: Tuple[str, ...]) -> str:
+    _check_name(table)
+    return f"REPLACE INTO '{table}' ({', '.join(columns)})\nVALUES ({', '.join('?' for _ in columns)})\n"
+
+
+@functools.lru_cache(maxsize=4096)
+def _where_sql(prefix: str, table: str, search: Tuple[Tuple[str, str], ...]) -> str:
+    _check_name(table)
+    return f"{prefix} FROM '{table}' WHERE {' AND '.join(f'({column} {op} ?)' for column, op in search)}"
+
+
+@functools.lru_cache(maxsize=4096)
+def _select_sql(table: str, column: str, op: str) -> str:
+    _check_name(table)
+    return f"SELECT * FROM '{table}' WHERE {column} {op} ?"
+
+
+@functools.lru_cache(maxsize=4096)
+def _delete_sql(table: str, column: str) -> str:
+    _check_name(table)
+    return f"DELETE FROM '{table}' WHERE {column}=?"
+
+
+def _search_shape(searchparms: List[List[Any]]) -> Tuple[Tuple[str, str], ...]:
+    return tuple((i[0], i[2] if len(i) > 2 else '=') for i in searchparms)
+
 
 class db_handler:
 
@@ -19,10 +68,17 @@ class db_handler:
     TEXT_KEY = True
 
     def __init__(self, db_location: str) -> None:
-        self.con = sqlite3.connect(db_location)
+        # pooled connections move between database executor workers, the pool only hands each to one worker at a time
+        self.con = sqlite3.connect(db_location, check_same_thread=False)
         self.cur = self.con.cursor()
         self.closed: bool = False
 
+        # journal_mode is persistent in the database file, the rest apply per connection
+        self.cur.execute(f"PRAGMA journal_mode={SQLITE3_JOURNAL_MODE}")
+        self.cur.execute(f"PRAGMA synchronous={SQLITE3_SYNCHRONOUS or ('NORMAL' if SQLITE3_COMMIT_POLICY == 'group' else 'FULL')}")
+        self.cur.execute(f"PRAGMA cache_size={SQLITE3_CACHE_SIZE}")
+        self.cur.execute(f"PRAGMA mmap_size={SQLITE3_MMAP_SIZE}")
+
     def __enter__(self) -> "db_handler":
         return self
 
@@ -73,14 +129,18 @@ class db_handler:
         db_inputBuilder = io.StringIO()
         db_inputBuilder.write(f"CREATE TABLE IF NOT EXISTS '{tablename}' (")
 
-        # Parse through table items, item with 3 entries is primary key
+        # Parse through table items, item with 3 entries is primary key, several make a composite key
+        primary = [i[0] for i in data if len(i) >= 3 and i[2] == 1]
         inlist = []
         for i in data:
-            if len(i) >= 3 and i[2] == 1:
+            if len(primary) == 1 and len(i) >= 3 and i[2] == 1:
                 inlist.append(f"{i[0]} {datamap[i[1]]} PRIMARY KEY")
             else:
                 inlist.append(f"{i[0]} {datamap[i[1]]}")
 
+        if len(primary) > 1:
+            inlist.append(f"PRIMARY KEY ({', '.join(primary)})")
+
         # Add parsed inputs to inputStr
         db_inputBuilder.write(", ".join(inlist))
         db_inputBuilder.write(")")
@@ -90,95 +150,39 @@ class db_handler:
 
     def add_to_table(self, table: str, data: Union[List[Any], Tuple[Any, ...]]) -> None:
 
-        # Test for attack
-        if "\\" in table or "'" in table:
-            raise db_error.OperationalError("Detected SQL injection attack")
-
-        db_inputBuilder = io.StringIO()
-
-        # Add insert data and generate base tables
-        db_inputBuilder.write(f"REPLACE INTO '{table}' (")
-        db_inputList = []
+        self.cur.execute(_insert_sql(table, tuple(i[0] for i in data)), tuple(i[1] for i in data))
 
-        db_inputBuilder.write(", ".join(i[0] for i in data))
-        db_inputBuilder.write(")\n")
+    def add_many_to_table(self, table: str, columns: Tuple[str, ...], rows: List[Tuple[Any, ...]]) -> None:
 
-        # Insert values data
-        db_inputBuilder.write("VALUES (")
-        db_inputBuilder.write(", ".join("?" for _ in data))
-        db_inputBuilder.write(")\n")
-
-        db_inputList.extend([i[1] for i in data])
-
-        self.cur.execute(db_inputBuilder.getvalue(), tuple(db_inputList))
+        self.cur.executemany(_insert_sql(table, columns), rows)
 
     def multicount_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> int:
 
-        # Test for attack
-        if "\\" in table or "'" in table:
-            raise db_error.OperationalError("Detected SQL injection attack")
-
-        db_inputBuilder = io.StringIO()
-
-        # Add SELECT data
-        db_inputBuilder.write(f"SELECT COUNT(*) FROM '{table}' WHERE ")
-
-        db_inputBuilder.write(" AND ".join(f"({i[0]} {i[2] if len(i) > 2 else '='} ?)" for i in searchparms))
-        db_inputList = [i[1] for i in searchparms]
-
-        # Execute
-        self.cur.execute(db_inputBuilder.getvalue(), tuple(db_inputList))
+        self.cur.execute(_where_sql("SELECT COUNT(*)", table, _search_shape(searchparms)), tuple(i[1] for i in searchparms))
 
         retval: int = tuple(self.cur.fetchall())[0][0]
         return retval
 
     def fetch_rows_from_table(self, table: str, search: List[Any]) -> Tuple[Any, ...]:
 
-        # Test for attack
-        if "\\" in table or "'" in table:
-            raise db_error.OperationalError("Detected SQL injection attack")
-
-        # Add SELECT data
-        db_inputStr = f"SELECT * FROM '{table}' WHERE {search[0]} {search[2] if len(search) > 2 else '='} ?"
-        db_inputList = [search[1]]
-
-        # Execute
-        self.cur.execute(db_inputStr, tuple(db_inputList))
+        self.cur.execute(_select_sql(table, search[0], search[2] if len(search) > 2 else '='), (search[1], ))
 
         return tuple(self.cur.fetchall())
 
     def multifetch_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> Tuple[Any, ...]:
 
-        # Test for attack
-        if "\\" in table or "'" in table:
-            raise db_error.OperationalError("Detected SQL injection attack")
-
-        db_inputBuilder = io.StringIO()
-
-        # Add SELECT data
-        db_inputBuilder.write(f"SELECT * FROM '{table}' WHERE ")
-
-        db_inputBuilder.write(" AND ".join(f"({i[0]} {i[2] if len(i) > 2 else '='} ?)" for i in searchparms))
-        db_inputList = [i[1] for i in searchparms]
-
-        # Execute
-        self.cur.execute(db_inputBuilder.getvalue(), tuple(db_inputList))
+        self.cur.execute(_where_sql("SELECT *", table, _search_shape(searchparms)), tuple(i[1] for i in searchparms))
 
         return tuple(self.cur.fetchall())
 
     # deletes rows from table where column i[0] has value i[1]
     def delete_rows_from_table(self, table: str, column_search: List[Any]) -> None:
 
-        # Test for attack
-        if "\\" in table or "'" in table:
-            raise db_error.OperationalError("Detected SQL injection attack")
+        self.cur.execute(_delete_sql(table, column_search[0]), (column_search[1], ))
 
-        # Do deletion setup
-        db_inputStr = f"DELETE FROM '{table}' WHERE {column_search[0]}=?"
-        db_inputList = [column_search[1]]
+    def multidelete_rows_from_table(self, table: str, searchparms: List[List[Any]]) -> None:
 
-        # Execute
-        self.cur.execute(db_inputStr, tuple(db_inputList))
+        self.cur.execute(_where_sql("DELETE", table, _search_shape(searchparms)), tuple(i[1] for i in searchparms))
 
     def delete_table(self, table: str) -> None:  # drops the table specified
 
@@ -212,6 +216,9 @@ class db_handler:
     def commit(self) -> None:  # Commits data to db
         self.con.commit()
 
+    def rollback(self) -> None:  # Drops uncommitted data
+        self.con.rollback()
+
     def close(self) -> None:
         self.con.commit()
         self.con.close()
@@ -12,13 +12,14 @@ kernel_start = time.monotonic()
 print("Booting LeXdPyK")
 
 # Import core systems
-import os, importlib, sys, io, traceback
+import os, importlib, sys, io, traceback, functools, inspect, ast, types, signal, tracemalloc
 
 # Import sub dependencies
-import glob, json, hashlib, logging, getpass, datetime, argparse, random
+import glob, json, hashlib, logging, getpass, datetime, argparse, random, bisect, collections, queue, atexit, gzip
+import logging.handlers
 
 # Import typing support
-from typing import List, Optional, Any, Tuple, Dict, Union, Type, Protocol, TypeVar
+from typing import List, Optional, Any, Tuple, Dict, Union, Type, Protocol, TypeVar, Set, Callable, Iterator, Coroutine, Generator
 
 # Start Discord.py
 import discord, asyncio
@@ -29,10 +30,27 @@ if sys.version_info.minor < 10:
     warnings.warn("In the near future, Sonnet will no longer support Python 3.8 or 3.9, please upgrade to at least Python 3.10", DeprecationWarning)
 
 # Initialize logger
+# records are queued and written to disk by the logging module's QueueListener thread,
+# so a burst of errors never blocks the event loop on file I/O
+log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+
 logger = logging.getLogger('discord')
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
 handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
 handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-logger.addHandler(handler)
+handler.addFilter(logging.Filter('discord'))
+
+# Tracebacks of errors caught by the kernel, err.log is reopened if it is moved or deleted
+error_logger = logging.getLogger('lexdpyk.errors')
+error_logger.propagate = False
+error_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+error_handler = logging.handlers.WatchedFileHandler(filename='err.log', encoding='utf-8', delay=True)
+error_handler.addFilter(logging.Filter('lexdpyk.errors'))
+
+log_listener = logging.handlers.QueueListener(log_queue, handler, error_handler)
+log_listener.start()
+# Flush queued records on any exit path
+atexit.register(log_listener.stop)
 
 # Initialize kernel workspace
 sys.path.insert(1, os.getcwd() + '/cmds')
@@ -40,6 +58,7 @@ sys.path.insert(1, os.getcwd() + '/common')
 sys.path.insert(1, os.getcwd() + '/libs')
 sys.path.insert(1, os.getcwd() + '/dlibs')
 
+# Intents used until modules are loaded, main narrows them to what loaded modules need before connecting
 intents = discord.Intents.default()
 intents.typing = False
 intents.presences = True
@@ -48,8 +67,111 @@ intents.members = True
 intents.reactions = True
 intents.message_content = True
 
+# Options the Client is constructed with, rebuild_client keeps them across rebuilds
+client_options: Dict[str, Any] = {"status": discord.Status.online, "intents": intents}
+
 # Initialize Discord Client.
-Client = discord.Client(status=discord.Status.online, intents=intents)
+Client: discord.Client = discord.Client(**client_options)
+
+# Set by main when running with an AutoShardedClient, enables per shard metrics
+sharded = False
+
+
+def rebuild_client(use_sharded: bool, **options: Any) -> None:
+    """
+    Replaces the Client with a new (AutoSharded)Client built with the updated options, moving over every registered event
+    Must be called before connecting, and followed by compile_event_dispatch so modules get the new Client
+    """
+    global Client, sharded
+
+    client_options.update(options)
+
+    new_client: discord.Client
+    if use_sharded:
+        new_client = discord.AutoShardedClient(**client_options)
+    else:
+        new_client = discord.Client(**client_options)
+
+    for name, coro in list(vars(Client).items()):
+        if name.startswith("on_") and asyncio.iscoroutinefunction(coro):
+            new_client.event(coro)
+
+    Client = new_client
+    sharded = use_sharded
+
+
+# LeXdPyK 2.1: gateway intents derived from loaded modules
+# guilds backs the guild cache, message events and content are needed for debug commands
+# the rest are low volume default intents that keep client caches current, command modules read those caches directly
+# (reactionroles validates custom emoji with client.get_emoji) so they can not be derived from dlib event keys
+kernel_intents: Tuple[str, ...] = ("guilds", "guild_messages", "dm_messages", "message_content", "emojis_and_stickers", "voice_states", "guild_scheduled_events", "integrations", "invites", "webhooks")
+
+_reaction_intents = ("guild_reactions", "dm_reactions")
+_member_intents = ("members", )
+
+# Intents each module event needs on top of kernel_intents
+event_intents: Dict[str, Tuple[str, ...]] = {
+    "on-message-edit": ("guild_messages", "dm_messages", "message_content"),
+    "on-raw-message-edit": ("guild_messages", "dm_messages", "message_content"),
+    "on-reaction-add": _reaction_intents,
+    "on-raw-reaction-add": _reaction_intents,
+    "on-reaction-remove": _reaction_intents,
+    "on-raw-reaction-remove": _reaction_intents,
+    "on-reaction-clear": _reaction_intents,
+    "on-raw-reaction-clear": _reaction_intents,
+    "on-reaction-clear-emoji": _reaction_intents,
+    "on-raw-reaction-clear-emoji": _reaction_intents,
+    "on-member-join": _member_intents,
+    "on-member-remove": _member_intents,
+    "on-member-update": _member_intents,
+    "on-raw-member-remove": _member_intents,
+    "on-presence-update": ("presences", ),
+    "on-member-ban": ("moderation", ),
+    "on-member-unban": ("moderation", ),
+    "on-automod-rule-create": ("auto_moderation_configuration", ),
+    "on-automod-rule-update": ("auto_moderation_configuration", ),
+    "on-automod-rule-delete": ("auto_moderation_configuration", ),
+    "on-automod-action": ("auto_moderation_execution", ),
+    }
+
+# discord.py only dispatches these for members already in cache, so guilds have to be chunked at startup to see them for every member
+member_cache_events: Set[str] = {"on-member-update", "on-member-remove", "on-presence-update"}
+
+
+def gateway_policy(events: Set[str]) -> Tuple[discord.Intents, discord.MemberCacheFlags, bool]:
+    """
+    Computes the minimal intents, member cache flags and startup chunking for a set of module events
+    GATEWAY_INTENTS and CHUNK_GUILDS_AT_STARTUP in LeXdPyK_conf override the derived values
+    raises TypeError on an unknown intent name in GATEWAY_INTENTS
+    """
+
+    if GATEWAY_INTENTS is not None:
+        policy_intents = discord.Intents(**{name: True for name in GATEWAY_INTENTS})
+    else:
+        policy_intents = discord.Intents(**{name: True for name in kernel_intents})
+        for event in events:
+            for name in event_intents.get(event, ()):
+                setattr(policy_intents, name, True)
+
+    if CHUNK_GUILDS_AT_STARTUP is not None:
+        chunk = bool(CHUNK_GUILDS_AT_STARTUP) and policy_intents.members
+    else:
+        chunk = policy_intents.members and bool(member_cache_events & events)
+
+    return policy_intents, discord.MemberCacheFlags.from_intents(policy_intents), chunk
+
+
+def warn_missing_intents() -> None:
+    """
+    Logs intents that loaded module events need but the current Client was not started with, as they only apply on restart
+    """
+
+    current = Client.intents
+    missing = sorted({name for event in dynamiclib_modules_exec_dict for name in event_intents.get(event, ()) if not getattr(current, name)})
+
+    if missing:
+        log_kernel_info(f"Loaded modules handle events that need gateway intents this client was started without ({', '.join(missing)}), restart to enable them")
+
 
 # Define development mode flag
 DEVELOPMENT_MODE = False
@@ -107,13 +229,160 @@ class miniflip:
             return None
 
 
+# Define ramfs handles
+class ram_filesystem_handle:
+    """
+    A path into a ram_filesystem that resolves its parent directory once and reuses it
+    If the directory is removed the handle transparently resolves it again on next use
+    """
+    __slots__ = "_root", "_dirlist", "_name", "_node", "group"
+
+    def __init__(self, root: "ram_filesystem", path: List[str]) -> None:
+
+        if not path:
+            raise FileNotFoundError("No file parameter passed")
+
+        self._root = root
+        self._dirlist = path[:-1]
+        self._name = path[-1]
+        self._node: Optional["ram_filesystem"] = None
+        # Top level directory this handle points into, used for lru tracking
+        self.group = path[0]
+
+    def _parent(self, create: bool = False) -> "ram_filesystem":
+
+        node = self._node
+
+        if node is None or node.detached:
+            node = self._root.mkdir(dirlist=self._dirlist) if create else self._root._get_directory(self._dirlist)
+            self._node = node
+
+        return node
+
+    def read(self) -> Any:
+        try:
+            return self._parent().data_table[self._name]
+        except KeyError:
+            raise FileNotFoundError(f"No such filepath: {'/'.join(self._dirlist + [self._name])}")
+
+    def create(self, f_type: Optional[Type[Any]] = None, f_args: Optional[List[Any]] = None) -> Any:
+
+        if f_type is None:
+            f_type = io.BytesIO
+
+        f = self._parent(create=True).data_table[self._name] = f_type(*([] if f_args is None else f_args))
+        return f
+
+    def remove(self) -> None:
+        try:
+            del self._parent().data_table[self._name]
+        except KeyError:
+            raise FileNotFoundError(f"No such file: {'/'.join(self._dirlist + [self._name])}")
+
+    def tag(self, producer: str, version: object = None) -> None:
+        """
+        Tags the file or directory this handle points to with the module that produced it and its cache version
+        """
+        self._parent()._tag_entry(self._name, producer, version)
+
+    def directory(self) -> "ram_filesystem":
+        """
+        Returns the directory this handle points to, or raises FileNotFoundError
+        """
+        try:
+            return self._parent().directory_table[self._name]
+        except KeyError:
+            raise FileNotFoundError(f"No such folder: {'/'.join(self._dirlist + [self._name])}")
+
+    def ls(self) -> Tuple[List[str], List[str]]:
+        return self.directory().ls(dirlist=[])
+
+
+def _approx_sizeof(obj: object, depth: int = 3) -> int:
+    """
+    Approximates the memory used by an object, following containers up to depth levels
+    """
+
+    size = sys.getsizeof(obj)
+
+    if depth:
+        if isinstance(obj, dict):
+            size += sum(_approx_sizeof(k, depth - 1) + _approx_sizeof(v, depth - 1) for k, v in obj.items())
+        elif isinstance(obj, (list, tuple, set)):
+            size += sum(_approx_sizeof(i, depth - 1) for i in obj)
+
+    return size
+
+
+class _ram_filesystem_index:
+    """
+    Bookkeeping kept only on directories that are used as a root
+    """
+    __slots__ = "handles", "groups", "lru"
+
+    def __init__(self) -> None:
+        # Memoized handles, and their keys grouped by top level directory so removing it drops its handles too
+        self.handles: Dict[Union[str, Tuple[str, ...]], ram_filesystem_handle] = {}
+        self.groups: Dict[str, List[Union[str, Tuple[str, ...]]]] = {}
+        # Top level entries ordered from least to most recently used
+        self.lru: "collections.OrderedDict[str, None]" = collections.OrderedDict()
+
+
 # Define ramfs
 class ram_filesystem:
-    __slots__ = "data_table", "directory_table"
+    __slots__ = "data_table", "directory_table", "detached", "expires", "tags", "_index"
 
     def __init__(self) -> None:
         self.directory_table: Dict[str, "ram_filesystem"] = {}
         self.data_table: Dict[str, object] = {}
+        # Set when this directory is removed from its parent, invalidates handles pointing into it
+        self.detached = False
+        # time.monotonic() deadline after which expire() removes this directory
+        self.expires: Optional[float] = None
+        # (producer module, cache version) of entries in this directory, see invalidate()
+        self.tags: Optional[Dict[str, Tuple[str, object]]] = None
+        self._index: Optional[_ram_filesystem_index] = None
+
+    def _get_index(self) -> _ram_filesystem_index:
+        if self._index is None:
+            self._index = _ram_filesystem_index()
+        return self._index
+
+    def _touch(self, name: str) -> None:
+        lru = self._get_index().lru
+        try:
+            lru.move_to_end(name)
+        except KeyError:
+            lru[name] = None
+
+    def handle(self, dirstr: Optional[str] = None, dirlist: Optional[List[str]] = None) -> ram_filesystem_handle:
+        """
+        Returns a memoized handle to a path, repeated lookups of the same dirstr cost one dict lookup
+        """
+
+        index = self._get_index()
+
+        key: Union[str, Tuple[str, ...]] = dirstr if dirstr is not None else tuple(self._parsedirlist(dirstr, dirlist))
+
+        try:
+            h = index.handles[key]
+            self._touch(h.group)
+            return h
+        except KeyError:
+            pass
+
+        path = self._parsedirlist(dirstr, dirlist)
+
+        h = index.handles[key] = ram_filesystem_handle(self, path)
+
+        try:
+            index.groups[h.group].append(key)
+        except KeyError:
+            index.groups[h.group] = [key]
+
+        self._touch(h.group)
+
+        return h
 
     def __enter__(self) -> "ram_filesystem":
         return self
@@ -151,6 +420,9 @@ class ram_filesystem:
         # Make fs list
         make_dir = self._parsedirlist(dirstr, dirlist)
 
+        if make_dir:
+            self._touch(make_dir[0])
+
         path: "ram_filesystem" = self
 
         for item in make_dir:
@@ -176,6 +448,9 @@ class ram_filesystem:
                 del path.data_table[remove_item[-1]]
             except KeyError:
                 raise FileNotFoundError(f"No such file: {'/'.join(remove_item)}")
+
+            if path.tags is not None:
+                path.tags.pop(remove_item[-1], None)
         else:
             raise FileNotFoundError("No file parameter passed")
 
@@ -204,6 +479,9 @@ class ram_filesystem:
 
         file_to_write = self._parsedirlist(dirstr, dirlist)
 
+        if file_to_write:
+            self._touch(file_to_write[0])
+
         path: "ram_filesystem" = self
 
         for i, item in enumerate(file_to_write):
@@ -217,21 +495,176 @@ class ram_filesystem:
                 f = path.data_table[item] = f_type(*f_args)
                 return f
 
+    def _remove_directory(self, parent: "ram_filesystem", name: str) -> None:
+        """
+        Removes a directory from parent and marks its subtree detached, raises KeyError if it does not exist
+        """
+
+        removed = parent.directory_table.pop(name)
+
+        if parent.tags is not None:
+            parent.tags.pop(name, None)
+
+        if parent is self and self._index is not None:
+            self._index.lru.pop(name, None)
+            for key in self._index.groups.pop(name, []):
+                del self._index.handles[key]
+
+        # Mark removed subtree so cached handles do not read from it
+        stack = [removed]
+        while stack:
+            node = stack.pop()
+            node.detached = True
+            stack.extend(node.directory_table.values())
+
     def rmdir(self, dirstr: Optional[str] = None, dirlist: Optional[List[str]] = None) -> None:
 
         directory_to_delete = self._parsedirlist(dirstr, dirlist)
 
-        path: "ram_filesystem" = self
+        if not directory_to_delete:
+            return
 
-        for i, item in enumerate(directory_to_delete):
+        try:
+            self._remove_directory(self._get_directory(directory_to_delete[:-1]), directory_to_delete[-1])
+        except (KeyError, FileNotFoundError):
+            raise FileNotFoundError(f"No such filepath: {'/'.join(directory_to_delete)}")
 
-            try:
-                if i < len(directory_to_delete) - 1:
-                    path = path.directory_table[item]
+    def set_ttl(self, dirstr: Optional[str] = None, dirlist: Optional[List[str]] = None, ttl: Optional[float] = None) -> None:
+        """
+        Sets a directory (creating it if needed) to be removed ttl seconds from now by expire(), None clears the ttl
+        """
+
+        self.mkdir(dirstr, dirlist).expires = None if ttl is None else time.monotonic() + ttl
+
+    def expire(self) -> int:
+        """
+        Removes every directory whose ttl has passed
+
+        :returns: int - The amount of directories removed
+        """
+
+        now = time.monotonic()
+        removed = 0
+
+        stack: List["ram_filesystem"] = [self]
+
+        while stack:
+            node = stack.pop()
+
+            for name, child in list(node.directory_table.items()):
+                if child.expires is not None and child.expires <= now:
+                    self._remove_directory(node, name)
+                    removed += 1
                 else:
-                    del path.directory_table[item]
-            except KeyError:
-                raise FileNotFoundError(f"No such filepath: {'/'.join(directory_to_delete)}")
+                    stack.append(child)
+
+        return removed
+
+    def _tag_entry(self, name: str, producer: str, version: object) -> None:
+
+        if name not in self.data_table and name not in self.directory_table:
+            raise FileNotFoundError(f"No such file or folder: {name}")
+
+        if self.tags is None:
+            self.tags = {}
+
+        self.tags[name] = (producer, version)
+
+    def tag(self, dirstr: Optional[str] = None, dirlist: Optional[List[str]] = None, producer: str = "", version: object = None) -> None:
+        """
+        Tags a file or directory with the module that produced it and the cache version it was produced with
+        A tagged directory is treated as a single cache entry by invalidate()
+        """
+
+        path = self._parsedirlist(dirstr, dirlist)
+
+        if not path:
+            raise FileNotFoundError("No file parameter passed")
+
+        self._get_directory(path[:-1])._tag_entry(path[-1], producer, version)
+
+    def invalidate(self, stale: Callable[[str, object], bool]) -> int:
+        """
+        Removes every tagged entry for which stale(producer, version) is true, and every untagged file since its producer is unknown
+        Untagged directories are searched recursively
+
+        :returns: int - The amount of entries removed
+        """
+
+        removed = 0
+
+        stack: List["ram_filesystem"] = [self]
+
+        while stack:
+            node = stack.pop()
+            tags = node.tags or {}
+
+            for name in list(node.data_table):
+                if (tag := tags.get(name)) is None or stale(*tag):
+                    del node.data_table[name]
+                    tags.pop(name, None)
+                    removed += 1
+
+            for name, child in list(node.directory_table.items()):
+                if (tag := tags.get(name)) is None:
+                    stack.append(child)
+                elif stale(*tag):
+                    self._remove_directory(node, name)
+                    removed += 1
+
+        return removed
+
+    def du(self) -> int:
+        """
+        Returns the approximate amount of bytes used by this directory and its contents
+        """
+
+        return sum(self.usage_by_entry().values())
+
+    def usage_by_entry(self) -> Dict[str, int]:
+        """
+        Returns the approximate amount of bytes used by each file and directory directly inside this directory
+        """
+
+        usage: Dict[str, int] = {}
+
+        for name, data in self.data_table.items():
+            usage[name] = sys.getsizeof(name) + _approx_sizeof(data)
+
+        for name, child in self.directory_table.items():
+            usage[name] = sys.getsizeof(name) + child.du()
+
+        return usage
+
+    def evict_lru(self, budget: int) -> List[str]:
+        """
+        Removes least recently used guild directories (top level directories with numeric names) until the approximate size fits in budget bytes
+
+        :returns: List[str] - The names of the directories evicted
+        """
+
+        usage = self.usage_by_entry()
+        total = sum(usage.values())
+
+        if total <= budget:
+            return []
+
+        lru = self._get_index().lru
+        # directories that were never touched are considered the oldest
+        order = [name for name in self.directory_table if name not in lru] + list(lru)
+
+        evicted: List[str] = []
+
+        for name in order:
+            if total <= budget:
+                break
+
+            if name.isdigit() and name in self.directory_table:
+                self._remove_directory(self, name)
+                total -= usage[name]
+                evicted.append(name)
+
+        return evicted
 
     def ls(self, dirstr: Optional[str] = None, dirlist: Optional[List[str]] = None) -> Tuple[List[str], List[str]]:
 
@@ -276,134 +709,576 @@ class ram_filesystem:
             raise FileNotFoundError("Filepath does not exist")
 
 
-# Import blacklist
-try:
-    with open("common/blacklist.json", "r", encoding="utf-8") as blacklist_file:
-        blacklist = json.load(blacklist_file)
+# Define kernel blacklist
+class blacklist_store:
+    """
+    Set indexed store of blacklisted guild and user ids
+    Changes are appended to a journal file and folded into the json snapshot on compaction
+    """
+    __slots__ = "guild", "user", "_snapshot", "_journal", "_journal_entries"
 
-    # Ensures blacklist properly init
-    assert isinstance(blacklist["guild"], list)
-    assert isinstance(blacklist["user"], list)
+    # Amount of journal entries to allow before compacting into the snapshot
+    compact_threshold = 1024
 
-except FileNotFoundError:
-    blacklist = {"guild": [], "user": []}
-    with open("common/blacklist.json", "w", encoding="utf-8") as blacklist_file:
-        json.dump(blacklist, blacklist_file)
+    def __init__(self, snapshot: str, journal: str) -> None:
+        self.guild: Set[int] = set()
+        self.user: Set[int] = set()
+        self._snapshot = snapshot
+        self._journal = journal
+        self._journal_entries = 0
 
-# Define debug commands
-command_modules: List[Any] = []
-command_modules_dict: Dict[str, Any] = {}
-dynamiclib_modules: List[Any] = []
-dynamiclib_modules_dict: Dict[str, Any] = {}
-# LeXdPyK 1.5: undefined exec order feature
-# on-message is now Dict[on-message: [[on-message items], [on-message-0 items], [on-message-1 items]]
-# this feature means you can have multiple on-message calls that will exec in an undefined order, but on-message-0 will always
-#  exec after on-message and on-message-1 after that etc
-#  this allows flexibility with multiple modules that just "must run after command processor init"
-dynamiclib_modules_exec_dict: Dict[str, List[List[Any]]] = {}
+        self._load()
 
-# LeXdPyK 2.0: optional lib reloads
-# lexdpyk 2.0 ships with the new feature of not needing to reload library modules in sonnet,
-# as the kernel handles reloading them at module load and reload time
-# this comes with the side effect of all library modules being init by the kernel
-loaded_libraries: List[Any] = []
+    def _table(self, kind: str) -> Set[int]:
+        if kind == "guild":
+            return self.guild
+        elif kind == "user":
+            return self.user
 
+        raise KeyError(f"No such blacklist: {kind}")
 
-def add_module_to_exec_dict(module_dlibs: Dict[str, Any]) -> None:
+    def _replay(self, line: str) -> None:
 
-    global dynamiclib_modules_exec_dict
+        try:
+            op, kind, value = line.split()
+            table = self._table(kind)
+            snowflake = int(value)
+        except (ValueError, KeyError):
+            # Do not trust the filesystem will not be corrupt, a torn write only loses its own entry
+            return
 
-    for k, v in module_dlibs.items():
+        if op == "+":
+            table.add(snowflake)
+        elif op == "-":
+            table.discard(snowflake)
 
-        if (maybe_num := k.split("-")[-1]).isnumeric():
-            true_key = "-".join(k.split("-")[:-1])
-            idx = int(maybe_num) + 1
+    def _load(self) -> None:
 
-        else:
-            true_key = k
-            idx = 0
+        try:
+            with open(self._snapshot, "r", encoding="utf-8") as snapshot_file:
+                data = json.load(snapshot_file)
 
-        if idx >= 2048:
-            raise RuntimeError("Command execution order request exceeds 2048 (oom safety limit reached)")
+            # Ensures blacklist properly init
+            assert isinstance(data["guild"], list)
+            assert isinstance(data["user"], list)
+
+            self.guild = set(map(int, data["guild"]))
+            self.user = set(map(int, data["user"]))
+        except FileNotFoundError:
+            pass
 
         try:
-            data_list = dynamiclib_modules_exec_dict[true_key]
-        except KeyError:
-            data_list = dynamiclib_modules_exec_dict[true_key] = []
+            with open(self._journal, "r", encoding="utf-8") as journal_file:
+                for line in journal_file:
+                    self._replay(line)
+        except FileNotFoundError:
+            pass
 
-        if len(data_list) < (idx + 1):
-            data_list.extend([] for _ in range((idx + 1) - len(data_list)))
+        # Start every boot with an empty journal
+        self.compact()
 
-        data_list[idx].append(v)
+    def _append(self, op: str, kind: str, value: int) -> None:
 
+        with open(self._journal, "a", encoding="utf-8") as journal_file:
+            journal_file.write(f"{op} {kind} {value}\n")
 
-def compress_exec_dict() -> None:
+        self._journal_entries += 1
 
-    global dynamiclib_modules_exec_dict
+        if self._journal_entries >= self.compact_threshold:
+            self.compact()
 
-    for k in dynamiclib_modules_exec_dict:
+    def add(self, kind: str, value: int) -> bool:
+        """
+        Adds an id to the guild or user blacklist
 
-        dynamiclib_modules_exec_dict[k] = [i for i in dynamiclib_modules_exec_dict[k] if i]
+        :returns: bool - False if the id was already blacklisted
+        :raises: KeyError - kind is not guild or user
+        """
 
-        # randomize inner ordering to prevent people relying on it
-        for unordered in dynamiclib_modules_exec_dict[k]:
-            random.shuffle(unordered)
+        table = self._table(kind)
 
+        if value in table:
+            return False
 
-# Initialize ramfs, kernel ramfs
-ramfs = ram_filesystem()
-kernel_ramfs = ram_filesystem()
+        table.add(value)
+        self._append("+", kind, value)
 
+        return True
 
-# Define kernel syntax error
-class KernelSyntaxError(SyntaxError):
-    pass
+    def remove(self, kind: str, value: int) -> bool:
+        """
+        Removes an id from the guild or user blacklist
 
+        :returns: bool - False if the id was not blacklisted
+        :raises: KeyError - kind is not guild or user
+        """
 
-# Import configs
-from LeXdPyK_conf import BOT_OWNER as KNOWN_OWNER
+        table = self._table(kind)
 
-UNKNOWN_OWNER: Any = KNOWN_OWNER
-BOT_OWNER: List[int]
+        if value not in table:
+            return False
 
-if isinstance(UNKNOWN_OWNER, (str, int)):
-    BOT_OWNER = [int(UNKNOWN_OWNER)] if UNKNOWN_OWNER else []
-elif isinstance(UNKNOWN_OWNER, (list, tuple)):
-    BOT_OWNER = [int(i) for i in UNKNOWN_OWNER]
-else:
-    BOT_OWNER = []
+        table.remove(value)
+        self._append("-", kind, value)
 
+        return True
 
-def log_kernel_info(s: object) -> None:
-    """
-    Logs kernel messages to stdout and the info logger
-    """
+    def compact(self) -> None:
+        """
+        Writes the full blacklist to the snapshot file and truncates the journal
+        """
 
-    now_t = datetime.datetime.now(datetime.timezone.utc).isoformat()
-    print(f"{now_t}: {s}")
+        with open(f"{self._snapshot}.tmp", "w", encoding="utf-8") as snapshot_file:
+            json.dump({"guild": sorted(self.guild), "user": sorted(self.user)}, snapshot_file)
 
-    logger.info(f"{version_info}: {s}")
+        os.replace(f"{self._snapshot}.tmp", self._snapshot)
 
+        # Replaying a journal over a snapshot that already contains it is idempotent,
+        # so dying between the replace and the truncate loses nothing
+        with open(self._journal, "w", encoding="utf-8"):
+            pass
 
-def reload_libraries() -> List[Tuple[Exception, str]]:
-    """
-    Reloads all lib_ libraries
-    """
-    global loaded_libraries
-    loaded_libraries = []
+        self._journal_entries = 0
 
-    err = []
 
-    # import libraries
-    for f in filter(lambda f: f.startswith("lib_") and f.endswith(".py"), os.listdir('./libs')):
-        try:
-            loaded_libraries.append(importlib.import_module(f[:-3]))
-        except Exception as e:
-            err.append((e, f[:-3]), )
+# Import blacklist
+blacklist = blacklist_store("common/blacklist.json", "common/blacklist.journal")
 
-    # this circumvents errors where a new item is defined in a library but it has not been reloaded
-    # and other libraries try and fail to import it
-    retry = []
+
+# Define kernel metrics
+class latency_histogram:
+    """
+    Fixed bucket latency histogram, observations are O(log buckets) and percentiles are bucket upper bounds
+    """
+    __slots__ = "buckets", "count", "total", "max"
+
+    # Bucket upper bounds in seconds, the final implicit bucket is +Inf
+    bounds: Tuple[float, ...] = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self) -> None:
+        self.buckets: List[int] = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.buckets[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p: float) -> float:
+        """
+        Returns the upper bound of the bucket holding the pth percentile (0-100), or the max observed if it overflowed
+        """
+
+        rank = self.count * p / 100
+        seen = 0
+
+        for bound, amount in zip(self.bounds, self.buckets):
+            seen += amount
+            if seen >= rank and seen:
+                return min(bound, self.max)
+
+        return self.max
+
+
+def _prometheus_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class guild_cost:
+    __slots__ = "events", "wall", "cpu"
+
+    def __init__(self) -> None:
+        self.events = 0
+        # seconds from event start to all handlers finishing, and CPU seconds spent running its handlers
+        self.wall = 0.0
+        self.cpu = 0.0
+
+
+def _guild_db_stats() -> Dict[Optional[int], Any]:
+    """
+    Returns db_hlapi query counts and time per guild, empty until a module loads lib_sonnetdb
+    """
+    # read through sys.modules so the kernel keeps not importing libs
+    return getattr(sys.modules.get("lib_sonnetdb"), "guild_query_stats", {})
+
+
+class kernel_metrics:
+    """
+    Kernel level event metrics, recorded by event_call and exported through debug-metrics and the prometheus textfile
+    """
+    __slots__ = "events", "handlers", "shards", "handler_errors", "counters", "loop_lag", "queue_wait", "guilds", "start"
+
+    def __init__(self) -> None:
+        self.events: Dict[str, latency_histogram] = {}
+        self.handlers: Dict[str, latency_histogram] = {}
+        # Only recorded in sharded mode, guild events keyed by the shard id of their guild
+        self.shards: Dict[str, latency_histogram] = {}
+        self.handler_errors: Dict[str, int] = {}
+        # Generic named counters, keyed by metric name then label value
+        self.counters: Dict[str, Dict[str, int]] = {}
+        # How late the loop lag monitor woke up, recorded once it is running
+        self.loop_lag = latency_histogram()
+        # How long guild events waited in the fair scheduler, only events that had to queue are recorded
+        self.queue_wait = latency_histogram()
+        # Cost of events per guild, for debug-guild-cost
+        self.guilds: Dict[int, guild_cost] = {}
+        self.start = time.monotonic()
+
+    def _histogram(self, table: Dict[str, latency_histogram], name: str) -> latency_histogram:
+        try:
+            return table[name]
+        except KeyError:
+            hist = table[name] = latency_histogram()
+            return hist
+
+    def observe_event(self, argtype: str, seconds: float) -> None:
+        self._histogram(self.events, argtype).observe(seconds)
+
+    def observe_shard(self, shard_id: int, seconds: float) -> None:
+        self._histogram(self.shards, str(shard_id)).observe(seconds)
+
+    def observe_handler(self, name: str, seconds: float, failed: bool) -> None:
+        self._histogram(self.handlers, name).observe(seconds)
+        if failed:
+            self.handler_errors[name] = self.handler_errors.get(name, 0) + 1
+
+    def guild(self, guild_id: int) -> guild_cost:
+        try:
+            return self.guilds[guild_id]
+        except KeyError:
+            cost = self.guilds[guild_id] = guild_cost()
+            return cost
+
+    def top_guilds(self, top: int, key: str = "cpu") -> List[Tuple[int, guild_cost, int, float]]:
+        """
+        Returns (guild id, cost, db queries, db seconds) of the top guilds by cpu, wall, events or db query time
+        """
+
+        db = _guild_db_stats()
+
+        def entry(guild_id: int, cost: guild_cost) -> Tuple[int, guild_cost, int, float]:
+            dbcost = db.get(guild_id)
+            return guild_id, cost, dbcost.queries if dbcost else 0, dbcost.seconds if dbcost else 0.0
+
+        # guilds with only db activity (such as from tasks outliving their event) still show up
+        guilds = dict(self.guilds)
+        for guild_id in db:
+            if guild_id is not None and guild_id not in guilds:
+                guilds[guild_id] = guild_cost()
+
+        sortkey: Dict[str, Callable[[Tuple[int, guild_cost, int, float]], float]] = {
+            "cpu": lambda i: i[1].cpu,
+            "wall": lambda i: i[1].wall,
+            "events": lambda i: i[1].events,
+            "db": lambda i: i[3],
+            }
+
+        return sorted((entry(k, v) for k, v in guilds.items()), key=sortkey[key], reverse=True)[:top]
+
+    def inc(self, metric: str, label: str, amount: int = 1) -> None:
+        try:
+            table = self.counters[metric]
+        except KeyError:
+            table = self.counters[metric] = {}
+
+        table[label] = table.get(label, 0) + amount
+
+    def report(self) -> str:
+        """
+        Returns a human readable summary sorted by total time spent
+        """
+
+        uptime = max(time.monotonic() - self.start, 1e-9)
+
+        def fmt(name: str, hist: latency_histogram, errors: Optional[int] = None) -> str:
+            errstr = f" err={errors}" if errors is not None else ""
+            return (
+                f"{name}: n={hist.count} ({hist.count/uptime:.2f}/s){errstr} p50={hist.percentile(50)*1000:.2f}ms "
+                f"p95={hist.percentile(95)*1000:.2f}ms p99={hist.percentile(99)*1000:.2f}ms max={hist.max*1000:.2f}ms"
+                )
+
+        buf = io.StringIO()
+        buf.write(f"Metrics over {uptime:.0f}s\nEvents:\n")
+        buf.write("\n".join(fmt(k, v) for k, v in sorted(self.events.items(), key=lambda i: -i[1].total)))
+        buf.write("\nHandlers:\n")
+        buf.write("\n".join(fmt(k, v, self.handler_errors.get(k, 0)) for k, v in sorted(self.handlers.items(), key=lambda i: -i[1].total)))
+
+        if self.shards:
+            buf.write("\nShards:\n")
+            buf.write("\n".join(fmt(f"shard {k}", v) for k, v in sorted(self.shards.items(), key=lambda i: int(i[0]))))
+
+        if self.loop_lag.count:
+            buf.write(f"\nLoop lag:\n{fmt('lag', self.loop_lag)}")
+
+        if self.queue_wait.count:
+            buf.write(f"\nScheduler queue wait:\n{fmt('wait', self.queue_wait)}")
+
+        if top := self.top_guilds(5):
+            buf.write("\nTop guilds by CPU:\n")
+            buf.write("\n".join(f"{gid}: n={cost.events} cpu={cost.cpu*1000:.1f}ms wall={cost.wall*1000:.1f}ms db={queries}/{dbtime*1000:.1f}ms" for gid, cost, queries, dbtime in top))
+
+        for metric, table in self.counters.items():
+            buf.write(f"\n{metric}:\n")
+            buf.write("\n".join(f"{k}: {v}" for k, v in sorted(table.items(), key=lambda i: -i[1])))
+
+        return buf.getvalue()
+
+    def prometheus(self) -> str:
+        """
+        Returns metrics in the prometheus text exposition format
+        """
+
+        buf = io.StringIO()
+
+        def write_histograms(metric: str, label: str, table: Dict[str, latency_histogram]) -> None:
+            buf.write(f"# TYPE {metric} histogram\n")
+            for name, hist in table.items():
+                lv = f'{label}="{_prometheus_escape(name)}"'
+                cumulative = 0
+                for bound, amount in zip(hist.bounds, hist.buckets):
+                    cumulative += amount
+                    buf.write(f'{metric}_bucket{{{lv},le="{bound}"}} {cumulative}\n')
+                buf.write(f'{metric}_bucket{{{lv},le="+Inf"}} {hist.count}\n')
+                buf.write(f"{metric}_sum{{{lv}}} {hist.total}\n")
+                buf.write(f"{metric}_count{{{lv}}} {hist.count}\n")
+
+        buf.write(f"# TYPE lexdpyk_uptime_seconds gauge\nlexdpyk_uptime_seconds {time.monotonic() - self.start}\n")
+
+        write_histograms("lexdpyk_event_duration_seconds", "event", self.events)
+        write_histograms("lexdpyk_handler_duration_seconds", "handler", self.handlers)
+        write_histograms("lexdpyk_shard_event_duration_seconds", "shard", self.shards)
+        write_histograms("lexdpyk_loop_lag_seconds", "loop", {"asyncio": self.loop_lag})
+        write_histograms("lexdpyk_scheduler_wait_seconds", "scheduler", {"guild": self.queue_wait})
+
+        # only the top guilds are exported to keep label cardinality bounded
+        top = self.top_guilds(guild_export_count)
+        guild_columns: Dict[str, List[float]] = {
+            "lexdpyk_guild_events_total": [cost.events for _, cost, _, _ in top],
+            "lexdpyk_guild_cpu_seconds_total": [cost.cpu for _, cost, _, _ in top],
+            "lexdpyk_guild_wall_seconds_total": [cost.wall for _, cost, _, _ in top],
+            "lexdpyk_guild_db_queries_total": [queries for _, _, queries, _ in top],
+            "lexdpyk_guild_db_seconds_total": [dbtime for _, _, _, dbtime in top],
+            }
+        for metric, column in guild_columns.items():
+            buf.write(f"# TYPE {metric} counter\n")
+            for (gid, _, _, _), value in zip(top, column):
+                buf.write(f'{metric}{{guild="{gid}"}} {value}\n')
+
+        buf.write("# TYPE lexdpyk_handler_errors_total counter\n")
+        for name, errors in self.handler_errors.items():
+            buf.write(f'lexdpyk_handler_errors_total{{handler="{_prometheus_escape(name)}"}} {errors}\n')
+
+        for metric, table in self.counters.items():
+            buf.write(f"# TYPE lexdpyk_{metric}_total counter\n")
+            for k, v in table.items():
+                buf.write(f'lexdpyk_{metric}_total{{name="{_prometheus_escape(k)}"}} {v}\n')
+
+        return buf.getvalue()
+
+
+# Guilds exported per metric in the prometheus textfile
+guild_export_count = 20
+
+metrics = kernel_metrics()
+
+# Prometheus textfile export location and interval, set by main
+metrics_textfile: Optional[str] = None
+metrics_interval: float = 15.0
+
+# Approximate ramfs memory budgets in bytes (None disables eviction) and how often they are enforced, set by main
+ramfs_budget: Optional[int] = None
+kernel_ramfs_budget: Optional[int] = None
+ramfs_maintenance_interval: float = 60.0
+
+# Define debug commands
+command_modules: List[Any] = []
+command_modules_dict: Dict[str, Any] = {}
+dynamiclib_modules: List[Any] = []
+dynamiclib_modules_dict: Dict[str, Any] = {}
+# LeXdPyK 1.5: undefined exec order feature
+# on-message is now Dict[on-message: [[on-message items], [on-message-0 items], [on-message-1 items]]
+# this feature means you can have multiple on-message calls that will exec in an undefined order, but on-message-0 will always
+#  exec after on-message and on-message-1 after that etc
+#  this allows flexibility with multiple modules that just "must run after command processor init"
+dynamiclib_modules_exec_dict: Dict[str, List[List[Any]]] = {}
+
+# LeXdPyK 2.1: precompiled event dispatch
+# the exec dict is compiled into tiers of handlers that are already bound to the kernel args,
+# this is rebuilt whenever modules or ramfs change instead of building kwargs on every event
+# each handler is (name, bound handler, bound filter or None)
+# dlibs may declare a filters dict next to commands, mapping the same keys to sync predicates that take the event args and kernel kwargs,
+#  a handler whose filter returns False is skipped before any task is created and counted in filtered_events
+#  filters should only read cached state and have no side effects, statistics belong in the handler
+dynamiclib_modules_dispatch: Dict[str, Tuple[Tuple[Any, ...], ...]] = {}
+
+# LeXdPyK 2.0: optional lib reloads
+# lexdpyk 2.0 ships with the new feature of not needing to reload library modules in sonnet,
+# as the kernel handles reloading them at module load and reload time
+# this comes with the side effect of all library modules being init by the kernel
+loaded_libraries: List[Any] = []
+
+
+class filtered_handler:
+    """
+    An event handler paired with the filter its dlib declared for it, the filter runs first and the handler is skipped if it returns False
+    """
+    __slots__ = "handler", "predicate"
+
+    def __init__(self, handler: Any, predicate: Callable[..., bool]) -> None:
+        self.handler = handler
+        self.predicate = predicate
+
+
+def add_module_to_exec_dict(module_dlibs: Dict[str, Any], filters: Dict[str, Callable[..., bool]] = {}) -> None:
+
+    global dynamiclib_modules_exec_dict
+
+    for k, v in module_dlibs.items():
+
+        if (maybe_num := k.split("-")[-1]).isnumeric():
+            true_key = "-".join(k.split("-")[:-1])
+            idx = int(maybe_num) + 1
+
+        else:
+            true_key = k
+            idx = 0
+
+        if idx >= 2048:
+            raise RuntimeError("Command execution order request exceeds 2048 (oom safety limit reached)")
+
+        try:
+            data_list = dynamiclib_modules_exec_dict[true_key]
+        except KeyError:
+            data_list = dynamiclib_modules_exec_dict[true_key] = []
+
+        if len(data_list) < (idx + 1):
+            data_list.extend([] for _ in range((idx + 1) - len(data_list)))
+
+        data_list[idx].append(filtered_handler(v, predicate) if (predicate := filters.get(k)) is not None else v)
+
+
+def compress_exec_dict() -> None:
+
+    global dynamiclib_modules_exec_dict
+
+    for k in dynamiclib_modules_exec_dict:
+
+        dynamiclib_modules_exec_dict[k] = [i for i in dynamiclib_modules_exec_dict[k] if i]
+
+        # randomize inner ordering to prevent people relying on it
+        for unordered in dynamiclib_modules_exec_dict[k]:
+            random.shuffle(unordered)
+
+
+def _bind_event_handler(func: Any, kwargs: Dict[str, Any], kargs_cache: Dict[Any, Any]) -> Tuple[str, Any]:
+    """
+    Binds kernel args to an event handler, returning its name and a callable that only takes the event args
+    """
+
+    try:
+        raw, kargs_type = func.__lexdpyk_kernel_args__
+    except AttributeError:
+        return f"{func.__module__}.{func.__qualname__}", functools.partial(func, **kwargs)
+
+    # ToKernelArgs handlers get one shared KernelArgs per header version instead of one per call
+    try:
+        kargs = kargs_cache[kargs_type]
+    except KeyError:
+        kargs = kargs_cache[kargs_type] = kargs_type(**kwargs)
+
+    def bound(*args: Any) -> Any:
+        return raw(*args, kargs)
+
+    return f"{raw.__module__}.{raw.__qualname__}", bound
+
+
+def compile_event_dispatch() -> None:
+    """
+    Rebuilds the dispatch table from the exec dict and current kernel state
+    """
+
+    global dynamiclib_modules_dispatch
+
+    kwargs: Dict[str, Any] = {
+        "client": Client,
+        "ramfs": ramfs,
+        "bot_start": bot_start_time,
+        "command_modules": (command_modules, command_modules_dict),
+        "dynamiclib_modules": (dynamiclib_modules, dynamiclib_modules_dict),
+        "kernel_version": version_info,
+        "kernel_ramfs": kernel_ramfs,
+        }
+
+    kargs_cache: Dict[Any, Any] = {}
+
+    def bind(func: Any) -> Tuple[str, Any, Any]:
+        if isinstance(func, filtered_handler):
+            return (*_bind_event_handler(func.handler, kwargs, kargs_cache), functools.partial(func.predicate, **kwargs))
+        return (*_bind_event_handler(func, kwargs, kargs_cache), None)
+
+    dynamiclib_modules_dispatch = {k: tuple(tuple(bind(func) for func in ftable) for ftable in v) for k, v in dynamiclib_modules_exec_dict.items()}
+
+
+# Initialize ramfs, kernel ramfs
+ramfs = ram_filesystem()
+kernel_ramfs = ram_filesystem()
+
+
+# Define kernel syntax error
+class KernelSyntaxError(SyntaxError):
+    pass
+
+
+# Import configs
+import LeXdPyK_conf
+from LeXdPyK_conf import BOT_OWNER as KNOWN_OWNER
+
+# Optional gateway overrides, older configs do not define them
+GATEWAY_INTENTS: Optional[List[str]] = getattr(LeXdPyK_conf, "GATEWAY_INTENTS", None)
+CHUNK_GUILDS_AT_STARTUP: Optional[bool] = getattr(LeXdPyK_conf, "CHUNK_GUILDS_AT_STARTUP", None)
+
+UNKNOWN_OWNER: Any = KNOWN_OWNER
+BOT_OWNER: List[int]
+
+if isinstance(UNKNOWN_OWNER, (str, int)):
+    BOT_OWNER = [int(UNKNOWN_OWNER)] if UNKNOWN_OWNER else []
+elif isinstance(UNKNOWN_OWNER, (list, tuple)):
+    BOT_OWNER = [int(i) for i in UNKNOWN_OWNER]
+else:
+    BOT_OWNER = []
+
+
+def log_kernel_info(s: object) -> None:
+    """
+    Logs kernel messages to stdout and the info logger
+    """
+
+    now_t = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    print(f"{now_t}: {s}")
+
+    logger.info(f"{version_info}: {s}")
+
+
+def reload_libraries() -> List[Tuple[Exception, str]]:
+    """
+    Reloads all lib_ libraries that have been imported, libraries that have not been imported yet are loaded fresh by their first importer
+    """
+    global loaded_libraries
+    loaded_libraries = []
+
+    err = []
+
+    for f in filter(lambda f: f.startswith("lib_") and f.endswith(".py"), os.listdir('./libs')):
+        if (library := sys.modules.get(f[:-3])) is not None:
+            loaded_libraries.append(library)
+
+    # this circumvents errors where a new item is defined in a library but it has not been reloaded
+    # and other libraries try and fail to import it
+    retry = []
 
     for i in range(len(loaded_libraries)):
         try:
@@ -420,320 +1295,1684 @@ def reload_libraries() -> List[Tuple[Exception, str]]:
     return err
 
 
-def kernel_load_command_modules(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
-    log_kernel_info("Loading Kernel Modules")
-    start_load_modules = time.monotonic()
-    # Globalize variables
-    global command_modules, command_modules_dict, dynamiclib_modules, dynamiclib_modules_dict, dynamiclib_modules_exec_dict
-    command_modules = []
-    command_modules_dict = {}
-    dynamiclib_modules = []
-    dynamiclib_modules_dict = {}
-    dynamiclib_modules_exec_dict = {}
-    importlib.invalidate_caches()
+# LeXdPyK 2.1: lazy command modules
+# command metadata (names, aliases, permissions, category info) is kept in a manifest keyed by source file signature,
+# so unchanged cmd_ modules are registered without being imported and are only imported the first time one of their commands runs
+module_manifest_path = "common/module_manifest.json"
 
-    # Init return state
-    err: List[Tuple[Exception, str]] = []
 
-    err.extend(reload_libraries())
+def _source_signature(path: str) -> List[int]:
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
 
-    # Init imports
-    for f in filter(lambda f: f.startswith("cmd_") and f.endswith(".py"), os.listdir('./cmds')):
-        print(f)
-        try:
-            command_modules.append(importlib.import_module(f[:-3]))
-        except Exception as e:
-            err.append((e, f[:-3]), )
-    for f in filter(lambda f: f.startswith("dlib_") and f.endswith(".py"), os.listdir("./dlibs")):
-        print(f)
-        try:
-            dynamiclib_modules.append(importlib.import_module(f[:-3]))
-        except Exception as e:
-            err.append((e, f[:-3]), )
 
-    # Update hashmaps
-    for module in command_modules:
-        try:
-            command_modules_dict.update(module.commands)
-        except AttributeError:
-            err.append((KernelSyntaxError("Missing commands"), module.__name__), )
-    for module in dynamiclib_modules:
-        try:
-            add_module_to_exec_dict(module.commands)
-            dynamiclib_modules_dict.update(module.commands)
-        except AttributeError:
-            err.append((KernelSyntaxError("Missing commands"), module.__name__), )
+def read_module_manifest() -> Dict[str, Dict[str, Any]]:
+
+    try:
+        with open(module_manifest_path, "r", encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def write_module_manifest(manifest: Dict[str, Dict[str, Any]]) -> None:
+
+    try:
+        with open(f"{module_manifest_path}.tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+        os.replace(f"{module_manifest_path}.tmp", module_manifest_path)
+    except OSError as e:
+        log_kernel_info(f"Failed to write module manifest: {e}")
+
+
+def _command_manifest_entry(module: Any, signature: List[int]) -> Dict[str, Any]:
+    """
+    Builds the manifest entry of an imported cmd_ module, modules that cannot be described in json are marked to always be imported
+    """
+
+    entry: Dict[str, Any] = {"source": signature}
+
+    try:
+        commands: Dict[str, Dict[str, Any]] = {}
+
+        for name, command in module.commands.items():
+            commands[name] = {k: v for k, v in command.items() if k != "execute"}
+            if "execute" in command:
+                # lazy commands are called through a stub with the same calling convention as the real function
+                commands[name]["execute"] = "ctx" if len(inspect.getfullargspec(command["execute"]).args) == 4 else "kwargs"
+
+        described = {"category_info": module.category_info, "commands": commands}
+
+        if isinstance(version := getattr(module, "version_info", None), str):
+            described["version_info"] = version
+
+        json.dumps(described)
+        entry.update(described)
+
+    except (AttributeError, TypeError, ValueError):
+        pass
+
+    return entry
+
+
+def _lazy_execute(module: "lazy_command_module", command: str, convention: str) -> Any:
+
+    if convention == "ctx":
+
+        async def execute_ctx(message: Any, args: List[str], client: Any, ctx: Any) -> Any:
+            return await module.load().commands[command]["execute"](message, args, client, ctx)
+
+        return execute_ctx
+
+    async def execute_kwargs(message: Any, args: List[str], client: Any, **kwargs: Any) -> Any:
+        return await module.load().commands[command]["execute"](message, args, client, **kwargs)
+
+    return execute_kwargs
+
+
+class lazy_command_module:
+    """
+    Stands in for a cmd_ module described by the manifest, any attribute not in the manifest imports the real module
+    """
+    def __init__(self, name: str, entry: Dict[str, Any]) -> None:
+
+        self.module: Optional[Any] = None
+        self.__name__ = name
+        self.category_info: Dict[str, str] = entry["category_info"]
+
+        self.commands: Dict[str, Dict[str, Any]] = {}
+        for cname, meta in entry["commands"].items():
+            command = self.commands[cname] = dict(meta)
+            if "execute" in command:
+                command["execute"] = _lazy_execute(self, cname, meta["execute"])
+
+        if "version_info" in entry:
+            self.version_info: str = entry["version_info"]
+
+    def load(self) -> Any:
+
+        if self.module is not None:
+            return self.module
+
+        log_kernel_info(f"Importing {self.__name__} on first use")
+        module = self.module = importlib.import_module(self.__name__)
+
+        # swap the real module in so later calls skip the stubs, unless a reload has already replaced this one
+        if any(i is self for i in command_modules):
+            command_modules[:] = [module if i is self else i for i in command_modules]
+            for cname, command in module.commands.items():
+                if command_modules_dict.get(cname) is self.commands.get(cname):
+                    command_modules_dict[cname] = command
+
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.load(), attr)
+
+
+def _load_command_module(name: str, manifest: Dict[str, Dict[str, Any]], new_manifest: Dict[str, Dict[str, Any]], reload: bool) -> Any:
+    """
+    Returns a lazy_command_module if the manifest entry for name is current, otherwise imports (or reloads) it and updates new_manifest
+    """
+
+    signature = _source_signature(f"./cmds/{name}.py")
+
+    entry = manifest.get(name)
+
+    if name not in sys.modules and entry is not None and entry.get("source") == signature and "commands" in entry:
+        new_manifest[name] = entry
+        return lazy_command_module(name, entry)
+
+    print(f"{name}.py")
+
+    if reload and name in sys.modules:
+        module = importlib.reload(sys.modules[name])
+    else:
+        module = importlib.import_module(name)
+
+    new_manifest[name] = _command_manifest_entry(module, signature)
+
+    return module
+
+
+def _record_dlib_manifest(module: Any, new_manifest: Dict[str, Dict[str, Any]]) -> None:
+    try:
+        new_manifest[module.__name__] = {"source": _source_signature(f"./dlibs/{module.__name__}.py"), "events": sorted(module.commands)}
+    except (AttributeError, OSError):
+        pass
+
+
+# LeXdPyK 2.1: incremental reloads
+# source hashes of every lib_, cmd_ and dlib_ module as of the last load, used to find what changed since
+module_source_hashes: Dict[str, str] = {}
+# parsed imports of each module keyed by source hash, so unchanged files are not parsed again
+module_import_cache: Dict[str, Tuple[str, Set[str]]] = {}
+
+
+def _module_source_paths() -> Dict[str, str]:
+
+    paths: Dict[str, str] = {}
+
+    for directory, prefix in (("./libs", "lib_"), ("./cmds", "cmd_"), ("./dlibs", "dlib_")):
+        for f in os.listdir(directory):
+            if f.startswith(prefix) and f.endswith(".py"):
+                paths[f[:-3]] = f"{directory}/{f}"
+
+    return paths
+
+
+def _hash_sources(paths: Dict[str, str]) -> Dict[str, str]:
+
+    hashes: Dict[str, str] = {}
+
+    for name, path in paths.items():
+        try:
+            with open(path, "rb") as source:
+                hashes[name] = hashlib.sha256(source.read()).hexdigest()
+        except OSError:
+            pass
+
+    return hashes
+
+
+def _module_imports(path: str, known: Set[str]) -> Set[str]:
+    """
+    Returns the known modules imported anywhere in the source at path, including conditional imports
+    """
+
+    with open(path, "rb") as source:
+        tree = ast.parse(source.read(), path)
+
+    imports: Set[str] = set()
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            imports.add(node.module)
+
+    return imports & known
+
+
+def _reload_order(dirty: Set[str], graph: Dict[str, Set[str]]) -> List[str]:
+    """
+    Orders dirty modules so every module comes after the dirty modules it imports
+    """
+
+    order: List[str] = []
+    visited: Set[str] = set()
+
+    def visit(name: str) -> None:
+        if name in visited:
+            return
+        visited.add(name)
+        for dep in sorted(graph.get(name, set()) & dirty):
+            visit(dep)
+        order.append(name)
+
+    for name in sorted(dirty):
+        visit(name)
+
+    return order
+
+
+def kernel_load_command_modules(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    log_kernel_info("Loading Kernel Modules")
+    start_load_modules = time.monotonic()
+    # Globalize variables
+    global command_modules, command_modules_dict, dynamiclib_modules, dynamiclib_modules_dict, dynamiclib_modules_exec_dict
+    command_modules = []
+    command_modules_dict = {}
+    dynamiclib_modules = []
+    dynamiclib_modules_dict = {}
+    dynamiclib_modules_exec_dict = {}
+    importlib.invalidate_caches()
+
+    # Init return state
+    err: List[Tuple[Exception, str]] = []
+
+    err.extend(reload_libraries())
+
+    manifest = read_module_manifest()
+    new_manifest: Dict[str, Dict[str, Any]] = {}
+
+    # Init imports
+    for f in sorted(filter(lambda f: f.startswith("cmd_") and f.endswith(".py"), os.listdir('./cmds'))):
+        try:
+            command_modules.append(_load_command_module(f[:-3], manifest, new_manifest, reload=False))
+        except Exception as e:
+            err.append((e, f[:-3]), )
+    for f in filter(lambda f: f.startswith("dlib_") and f.endswith(".py"), os.listdir("./dlibs")):
+        print(f)
+        try:
+            dynamiclib_modules.append(importlib.import_module(f[:-3]))
+        except Exception as e:
+            err.append((e, f[:-3]), )
+
+    # Update hashmaps
+    for module in command_modules:
+        try:
+            command_modules_dict.update(module.commands)
+        except AttributeError:
+            err.append((KernelSyntaxError("Missing commands"), module.__name__), )
+    for module in dynamiclib_modules:
+        try:
+            add_module_to_exec_dict(module.commands, getattr(module, "filters", {}))
+            dynamiclib_modules_dict.update(module.commands)
+        except AttributeError:
+            err.append((KernelSyntaxError("Missing commands"), module.__name__), )
+        _record_dlib_manifest(module, new_manifest)
+
+    compress_exec_dict()
+    compile_event_dispatch()
+    warn_missing_intents()
+
+    if new_manifest != manifest:
+        write_module_manifest(new_manifest)
+
+    global module_source_hashes
+    module_source_hashes = _hash_sources(_module_source_paths())
+
+    lazy = sum(isinstance(i, lazy_command_module) for i in command_modules)
+    log_kernel_info(f"Loaded Kernel Modules in {(time.monotonic()-start_load_modules)*1000:.1f}ms ({lazy}/{len(command_modules)} command modules deferred)")
+
+    if err: return ("\n".join([f"Error importing {i[1]}: {type(i[0]).__name__}: {i[0]}" for i in err]), [i[0] for i in err])
+    else: return None
+
+
+def regenerate_ramfs(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    log_kernel_info("Regenerating ramfs")
+    global ramfs
+    ramfs = ram_filesystem()
+    compile_event_dispatch()
+    return None
+
+
+def publish_kernel_info() -> None:
+    """
+    Exposes kernel callables to modules through kernel_ramfs
+    """
+    kernel_ramfs.mkdir("global").data_table["shard_summary"] = shard_summary
+    kernel_ramfs.mkdir("global").data_table["load_shedder"] = shedder
+
+
+def regenerate_kernel_ramfs(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    log_kernel_info("Regenerating kernel ramfs")
+    global kernel_ramfs
+    kernel_ramfs = ram_filesystem()
+    publish_kernel_info()
+    compile_event_dispatch()
+    return None
+
+
+def invalidate_ramfs(reloaded: Set[str]) -> int:
+    """
+    Drops ramfs entries produced by a reloaded module whose ramfs_cache_version changed, everything else stays warm
+    Producers that do not declare a ramfs_cache_version have their entries dropped on every reload
+    """
+    def stale(producer: str, version: object) -> bool:
+        return producer in reloaded and (version is None or getattr(sys.modules.get(producer), "ramfs_cache_version", None) != version)
+
+    removed = ramfs.invalidate(stale)
+
+    log_kernel_info(f"Invalidated {removed} ramfs entries")
+
+    return removed
+
+
+def kernel_reload_command_modules(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    log_kernel_info("Reloading Kernel Modules")
+    # Init vars
+    global command_modules, command_modules_dict, dynamiclib_modules, dynamiclib_modules_dict, dynamiclib_modules_exec_dict
+    command_modules_dict = {}
+    dynamiclib_modules_dict = {}
+    dynamiclib_modules_exec_dict = {}
+
+    start_reload_modules = time.monotonic()
+
+    # Init ret state
+    err = []
+
+    err.extend(reload_libraries())
+
+    manifest = read_module_manifest()
+    new_manifest: Dict[str, Dict[str, Any]] = {}
+
+    # Update set, command modules that were never imported stay lazy if their source is unchanged
+    for i in range(len(command_modules)):
+        try:
+            command_modules[i] = _load_command_module(command_modules[i].__name__, manifest, new_manifest, reload=True)
+        except Exception as e:
+            err.append((e, command_modules[i].__name__))
+    for i in range(len(dynamiclib_modules)):
+        try:
+            dynamiclib_modules[i] = (importlib.reload(dynamiclib_modules[i]))
+        except Exception as e:
+            err.append((e, dynamiclib_modules[i].__name__))
+
+    # Update hashmaps
+    for module in command_modules:
+        try:
+            command_modules_dict.update(module.commands)
+        except AttributeError:
+            err.append((KernelSyntaxError("Missing commands"), module.__name__))
+    for module in dynamiclib_modules:
+        try:
+            add_module_to_exec_dict(module.commands, getattr(module, "filters", {}))
+            dynamiclib_modules_dict.update(module.commands)
+        except AttributeError:
+            err.append((KernelSyntaxError("Missing commands"), module.__name__))
+        _record_dlib_manifest(module, new_manifest)
+
+    # Only drop caches whose producer changed its cache version
+    invalidate_ramfs({i.__name__ for i in loaded_libraries} | {i.__name__ for i in command_modules if not isinstance(i, lazy_command_module)} | {i.__name__ for i in dynamiclib_modules})
+
+    compress_exec_dict()
+    compile_event_dispatch()
+    warn_missing_intents()
+
+    if new_manifest != manifest:
+        write_module_manifest(new_manifest)
+
+    global module_source_hashes
+    module_source_hashes = _hash_sources(_module_source_paths())
+
+    log_kernel_info(f"Reloaded Kernel Modules in {(time.monotonic()-start_reload_modules)*1000:.1f}ms")
+
+    if err: return ("\n".join([f"Error reimporting {i[1]}: {type(i[0]).__name__}: {i[0]}" for i in err]), [i[0] for i in err])
+    else: return None
+
+
+def kernel_update_command_modules(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    """
+    Reloads only the modules whose source changed since the last load, plus every module that imports them
+    """
+    log_kernel_info("Updating Kernel Modules")
+    global dynamiclib_modules_dict, dynamiclib_modules_exec_dict, module_source_hashes
+
+    start_update_modules = time.monotonic()
+    importlib.invalidate_caches()
+
+    paths = _module_source_paths()
+    hashes = _hash_sources(paths)
+
+    changed = {name for name, digest in hashes.items() if module_source_hashes.get(name) != digest}
+    removed = set(module_source_hashes) - set(hashes)
+
+    if not changed and not removed:
+        return "No modules changed since last load", []
+
+    # Build the reverse import graph and mark everything that transitively imports a changed module
+    graph: Dict[str, Set[str]] = {}
+    for name, path in paths.items():
+        cached = module_import_cache.get(name)
+        if cached is None or cached[0] != hashes.get(name):
+            cached = module_import_cache[name] = (hashes.get(name, ""), _module_imports(path, set(paths)))
+        graph[name] = cached[1]
+
+    dependents: Dict[str, Set[str]] = {}
+    for name, deps in graph.items():
+        for dep in deps:
+            dependents.setdefault(dep, set()).add(name)
+
+    dirty = set(changed)
+    stack = list(changed)
+    while stack:
+        for dependent in dependents.get(stack.pop(), set()):
+            if dependent not in dirty:
+                dirty.add(dependent)
+                stack.append(dependent)
+
+    err: List[Tuple[Exception, str]] = []
+
+    manifest = read_module_manifest()
+    new_manifest = {k: v for k, v in manifest.items() if k not in removed}
+
+    # Drop modules whose source was deleted
+    for name in removed:
+        for module in [i for i in command_modules if i.__name__ == name]:
+            command_modules.remove(module)
+            for cname, command in getattr(module, "commands", {}).items():
+                if command_modules_dict.get(cname) is command:
+                    del command_modules_dict[cname]
+    dynamiclib_modules[:] = [i for i in dynamiclib_modules if i.__name__ not in removed]
+
+    reloaded: List[str] = []
+
+    for name in _reload_order(dirty, graph):
+        try:
+            if name.startswith("cmd_"):
+
+                old = next((i for i in command_modules if i.__name__ == name), None)
+                # reloading mutates the module in place, so keep the old table to know which entries it owned
+                old_commands: Dict[str, Any] = dict(getattr(old, "commands", {})) if old is not None else {}
+
+                module = _load_command_module(name, manifest, new_manifest, reload=True)
+
+                for cname, command in old_commands.items():
+                    if command_modules_dict.get(cname) is command:
+                        del command_modules_dict[cname]
+
+                if old is not None:
+                    command_modules[command_modules.index(old)] = module
+                else:
+                    command_modules.append(module)
+
+                try:
+                    command_modules_dict.update(module.commands)
+                except AttributeError:
+                    err.append((KernelSyntaxError("Missing commands"), name))
+
+            elif name.startswith("dlib_"):
+
+                if (idx := next((i for i, m in enumerate(dynamiclib_modules) if m.__name__ == name), None)) is not None:
+                    dynamiclib_modules[idx] = importlib.reload(dynamiclib_modules[idx])
+                else:
+                    dynamiclib_modules.append(importlib.import_module(name))
+
+            elif name in sys.modules:
+                importlib.reload(sys.modules[name])
+
+            else:
+                # not imported yet, its first importer will load the new source
+                continue
+
+            reloaded.append(name)
+
+        except Exception as e:
+            err.append((e, name))
+            # keep it marked as changed so the next update retries it
+            hashes[name] = ""
+
+    # The exec dict is only rebuilt if an event handler could have changed
+    if removed or any(name.startswith("dlib_") for name in dirty):
+        dynamiclib_modules_dict = {}
+        dynamiclib_modules_exec_dict = {}
+
+        for module in dynamiclib_modules:
+            try:
+                add_module_to_exec_dict(module.commands, getattr(module, "filters", {}))
+                dynamiclib_modules_dict.update(module.commands)
+            except AttributeError:
+                err.append((KernelSyntaxError("Missing commands"), module.__name__))
+            _record_dlib_manifest(module, new_manifest)
+
+        compress_exec_dict()
+        warn_missing_intents()
+
+    invalidate_ramfs(set(reloaded))
+
+    compile_event_dispatch()
+
+    if new_manifest != manifest:
+        write_module_manifest(new_manifest)
+
+    module_source_hashes = hashes
+
+    log_kernel_info(f"Updated {len(reloaded)} Kernel Modules ({', '.join(reloaded)}) in {(time.monotonic()-start_update_modules)*1000:.1f}ms")
+
+    if err: return ("\n".join([f"Error reimporting {i[1]}: {type(i[0]).__name__}: {i[0]}" for i in err]), [i[0] for i in err])
+    else: return None
+
+
+def kernel_blacklist_guild(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    log_kernel_info(f"Attempting to blacklist guild with args {args}")
+
+    try:
+        blacklist.add("guild", int(args[0]))
+    except (ValueError, IndexError):
+        return "Asking value is not INT", []
+
+    return None
+
+
+def kernel_blacklist_user(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    log_kernel_info(f"Attempting to blacklist user with args {args}")
+
+    try:
+        blacklist.add("user", int(args[0]))
+    except (ValueError, IndexError):
+        return "Asking value is not INT", []
+
+    return None
+
+
+def kernel_unblacklist_guild(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    log_kernel_info(f"Attempting to unblacklist guild with args {args}")
+
+    try:
+        if not blacklist.remove("guild", int(args[0])):
+            return "Item is not blacklisted", []
+    except (ValueError, IndexError):
+        return "Asking value is not INT", []
+
+    return None
+
+
+def kernel_unblacklist_user(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    log_kernel_info(f"Attempting to unblacklist user with args {args}")
+
+    try:
+        if not blacklist.remove("user", int(args[0])):
+            return "Item is not blacklisted", []
+    except (ValueError, IndexError):
+        return "Asking value is not INT", []
+
+    return None
+
+
+def kernel_logout(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    log_kernel_info("Logging out of discord client session")
+    asyncio.create_task(Client.close())
+    return None
+
+
+def kernel_drop_dlibs(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    log_kernel_info("Dropping dynamiclib modules")
+    global dynamiclib_modules, dynamiclib_modules_dict, dynamiclib_modules_exec_dict
+    dynamiclib_modules = []
+    dynamiclib_modules_dict = {}
+    dynamiclib_modules_exec_dict = {}
+    compile_event_dispatch()
+    return None
+
+
+def kernel_drop_cmds(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    log_kernel_info("Dropping command modules")
+    global command_modules, command_modules_dict
+    command_modules = []
+    command_modules_dict = {}
+    compile_event_dispatch()
+    return None
+
+
+def logging_toggle(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+
+    is_debug = logger.isEnabledFor(logging.DEBUG)
+
+    log_kernel_info(f"Swapping log visibility to {'INFO' if is_debug else 'DEBUG'}")
+
+    if is_debug:
+        logger.setLevel(logging.INFO)
+        return "Logging at L20 (INFO)", []
+    else:
+        logger.setLevel(logging.DEBUG)
+        return "Logging at L10 (DEBUG)", []
+
+
+def kernel_error_report(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    global error_dedup
+
+    if args and args[0] == "reset":
+        log_kernel_info("Resetting error counts")
+        error_dedup = error_deduplicator()
+        return "Error counts reset", []
+
+    return f"```\n{(error_dedup.report() or 'No errors recorded')[:1900]}\n```", []
+
+
+def kernel_metrics_report(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    global metrics
+
+    if args and args[0] == "reset":
+        log_kernel_info("Resetting kernel metrics")
+        metrics = kernel_metrics()
+        return "Kernel metrics reset", []
+
+    # discord message limit is 2000 chars, full metrics are available from the prometheus textfile
+    return f"```\n{metrics.report()[:1900]}\n```", []
+
+
+def kernel_guild_cost(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+
+    if args and args[0] == "reset":
+        log_kernel_info("Resetting guild costs")
+        metrics.guilds.clear()
+        _guild_db_stats().clear()
+        return "Guild costs reset", []
+
+    try:
+        top = int(args[0]) if args else 10
+    except ValueError:
+        return "Invalid guild count", []
+
+    key = args[1] if len(args) > 1 else "cpu"
+    if key not in ("cpu", "wall", "events", "db"):
+        return "Sort must be one of cpu, wall, events or db", []
+
+    total_cpu = max(sum(c.cpu for c in metrics.guilds.values()), 1e-9)
+
+    out = [f"Top {top} guilds by {key} over {time.monotonic()-metrics.start:.0f}s ({len(metrics.guilds)} guilds seen):"]
+    for gid, cost, queries, dbtime in metrics.top_guilds(top, key):
+        out.append(f"{gid}: {cost.events} events, cpu {cost.cpu*1000:.1f}ms ({100*cost.cpu/total_cpu:.1f}%), wall {cost.wall*1000:.1f}ms, db {queries} queries {dbtime*1000:.1f}ms")
+
+    return f"```\n{chr(10).join(out)[:1900]}\n```", []
+
+
+def kernel_loop_lag(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+
+    if loop_monitor is None:
+        return "Loop lag monitor is not running", []
+
+    try:
+        frames = int(args[0]) if args else 6
+    except ValueError:
+        return "Invalid frame count", []
+
+    return f"```\n{loop_monitor.report(frames)[:1900]}\n```", []
+
+
+def kernel_handler_budget(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+
+    if watchdog is None:
+        return "No handler budgets are set", []
+
+    try:
+        frames = int(args[0]) if args else 6
+    except ValueError:
+        return "Invalid frame count", []
+
+    return f"```\n{watchdog.report(frames)[:1900]}\n```", []
+
+
+def _ramfs_usage_report(name: str, fs: ram_filesystem, top: int) -> str:
+
+    guilds: List[Tuple[int, str]] = []
+    entries: Dict[str, int] = {}
+    total = 0
+
+    for gname, size in fs.usage_by_entry().items():
+        total += size
+
+        if gname.isdigit() and gname in fs.directory_table:
+            guilds.append((size, gname))
+            for entry, esize in fs.directory_table[gname].usage_by_entry().items():
+                entries[entry] = entries.get(entry, 0) + esize
+
+    guilds.sort(reverse=True)
+
+    out = [f"{name}: ~{total/1000:.1f}KB total, {len(guilds)} guilds"]
+    out.extend(f"  {gname}: ~{size/1000:.1f}KB" for size, gname in guilds[:top])
+    out.append("  per entry:")
+    out.extend(f"    {entry}: ~{size/1000:.1f}KB" for entry, size in sorted(entries.items(), key=lambda i: i[1], reverse=True))
+
+    return "\n".join(out)
+
+
+def kernel_ramfs_usage(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+
+    try:
+        top = int(args[0]) if args else 10
+    except ValueError:
+        return "Invalid guild count", []
+
+    report = f"{_ramfs_usage_report('ramfs', ramfs, top)}\n{_ramfs_usage_report('kernel_ramfs', kernel_ramfs, top)}"
+
+    return f"```\n{report[:1900]}\n```", []
+
+
+# LeXdPyK 2.1: heap snapshots, tracemalloc is off until the bot owner starts it since tracing slows every allocation
+def _memory_module(filename: str) -> str:
+    """
+    Groups an allocation site filename by module, kernel files by name and installed packages by top level package
+    """
+
+    parts = os.path.normpath(filename).split(os.sep)
+    parts[-1] = parts[-1][:-3] if parts[-1].endswith(".py") else parts[-1]
+
+    for marker in ("site-packages", "dist-packages"):
+        if marker in parts and parts.index(marker) + 1 < len(parts):
+            return parts[parts.index(marker) + 1]
+
+    # stdlib modules are grouped by package, e.g. asyncio/events.py becomes asyncio
+    for i, part in enumerate(parts):
+        if part.startswith("python3") and i + 1 < len(parts):
+            return parts[i + 1]
+
+    return parts[-1]
+
+
+def _task_counts() -> Dict[str, int]:
+
+    counts: Dict[str, int] = {}
+
+    try:
+        tasks = asyncio.all_tasks()
+    except RuntimeError:
+        return counts
+
+    for task in tasks:
+        name = getattr(task.get_coro(), "__qualname__", "unknown")
+        counts[name] = counts.get(name, 0) + 1
+
+    return counts
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class memory_snapshot:
+    """
+    A heap snapshot (if tracemalloc is tracing) alongside ramfs sizes, discord.py cache sizes and pending tasks
+    """
+    __slots__ = "heap", "ramfs", "kernel_ramfs", "messages", "users", "tasks", "rss"
+
+    # Allocations made by tracing itself and by the import system are noise
+    filters = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"), tracemalloc.Filter(False, "<unknown>"))
+
+    def __init__(self) -> None:
+        self.heap = tracemalloc.take_snapshot().filter_traces(self.filters) if tracemalloc.is_tracing() else None
+        self.ramfs = ramfs.du()
+        self.kernel_ramfs = kernel_ramfs.du()
+        self.messages = len(Client.cached_messages)
+        self.users = len(Client.users)
+        self.tasks = _task_counts()
+        self.rss = _rss_bytes()
+
+    def summary(self, old: Optional["memory_snapshot"] = None) -> str:
+        def fmt(now: int, before: Optional[int], scale: int = 1, unit: str = "") -> str:
+            value = f"{now/scale:.1f}{unit}" if unit else str(now)
+            if before is None:
+                return value
+            change = f"{(now-before)/scale:+.1f}{unit}" if unit else f"{now-before:+}"
+            return f"{value} ({change})"
+
+        out = []
+        if self.rss is not None:
+            out.append(f"RSS: {fmt(self.rss, old.rss if old else None, 1000000, 'MB')}")
+        out.append(f"ramfs: ~{fmt(self.ramfs, old.ramfs if old else None, 1000, 'KB')}, kernel_ramfs: ~{fmt(self.kernel_ramfs, old.kernel_ramfs if old else None, 1000, 'KB')}")
+        out.append(f"discord.py cache: {fmt(self.messages, old.messages if old else None)} messages, {fmt(self.users, old.users if old else None)} users")
+
+        out.append(f"Pending tasks: {fmt(sum(self.tasks.values()), sum(old.tasks.values()) if old else None)}")
+        names = set(self.tasks) | (set(old.tasks) if old else set())
+        for name in sorted(names, key=lambda n: -self.tasks.get(n, 0))[:10]:
+            out.append(f"  {name}: {fmt(self.tasks.get(name, 0), old.tasks.get(name, 0) if old else None)}")
+
+        return "\n".join(out)
+
+
+def _heap_by_module(stats: List[Any], top: int, diff: bool) -> str:
+
+    modules: Dict[str, List[int]] = {}
+
+    for stat in stats:
+        totals = modules.setdefault(_memory_module(stat.traceback[0].filename), [0, 0])
+        totals[0] += stat.size_diff if diff else stat.size
+        totals[1] += stat.count_diff if diff else stat.count
+
+    ranked = sorted(modules.items(), key=lambda i: -abs(i[1][0]))[:top]
+
+    if diff:
+        return "\n".join(f"  {name}: {size/1000:+.1f}KB ({count:+} blocks)" for name, (size, count) in ranked)
+    else:
+        return "\n".join(f"  {name}: {size/1000:.1f}KB ({count} blocks)" for name, (size, count) in ranked)
+
+
+mem_baseline: Optional[memory_snapshot] = None
+
+
+def kernel_mem_snapshot(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+    global mem_baseline
+
+    if args and args[0] == "start":
+        if tracemalloc.is_tracing():
+            return "tracemalloc is already tracing", []
+        tracemalloc.start(1)
+        mem_baseline = None
+        log_kernel_info("Started tracemalloc")
+        return "Started tracemalloc, take a snapshot to set the baseline for debug-mem-diff", []
+
+    if args and args[0] == "stop":
+        tracemalloc.stop()
+        mem_baseline = None
+        log_kernel_info("Stopped tracemalloc")
+        return "Stopped tracemalloc and dropped the baseline", []
+
+    try:
+        top = int(args[0]) if args else 15
+    except ValueError:
+        return "Invalid module count", []
+
+    mem_baseline = snapshot = memory_snapshot()
+
+    out = [snapshot.summary()]
+    if snapshot.heap is not None:
+        out.append(f"Traced heap by module (snapshot saved as baseline):\n{_heap_by_module(snapshot.heap.statistics('filename'), top, diff=False)}")
+    else:
+        out.append("tracemalloc is not tracing, run debug-mem-snapshot start for allocation sites")
+
+    return f"```\n{chr(10).join(out)[:1900]}\n```", []
+
+
+def kernel_mem_diff(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+
+    if mem_baseline is None:
+        return "No baseline, take one with debug-mem-snapshot", []
+
+    try:
+        top = int(args[0]) if args else 15
+    except ValueError:
+        return "Invalid module count", []
+
+    snapshot = memory_snapshot()
+
+    out = [snapshot.summary(mem_baseline)]
+    if snapshot.heap is not None and mem_baseline.heap is not None:
+        out.append(f"Traced heap growth by module since baseline:\n{_heap_by_module(snapshot.heap.compare_to(mem_baseline.heap, 'filename'), top, diff=True)}")
+    else:
+        out.append("No heap baseline, run debug-mem-snapshot start then debug-mem-snapshot for allocation sites")
+
+    return f"```\n{chr(10).join(out)[:1900]}\n```", []
+
+
+class DebugCallable(Protocol):
+    def __call__(self, args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
+        return None
+
+
+# Generate debug command subset
+debug_commands: Dict[str, DebugCallable] = {
+    "debug-add-guild-blacklist": kernel_blacklist_guild,
+    "debug-add-user-blacklist": kernel_blacklist_user,
+    "debug-remove-guild-blacklist": kernel_unblacklist_guild,
+    "debug-remove-user-blacklist": kernel_unblacklist_user,
+    "debug-modules-load": kernel_load_command_modules,
+    "debug-modules-reload": kernel_reload_command_modules,
+    "debug-modules-update": kernel_update_command_modules,
+    "debug-logout-system": kernel_logout,
+    "debug-drop-ramfs": regenerate_ramfs,
+    "debug-drop-kramfs": regenerate_kernel_ramfs,
+    "debug-drop-modules": kernel_drop_dlibs,
+    "debug-drop-commands": kernel_drop_cmds,
+    "debug-toggle-logging": logging_toggle,
+    "debug-metrics": kernel_metrics_report,
+    "debug-errors": kernel_error_report,
+    "debug-ramfs-usage": kernel_ramfs_usage,
+    "debug-loop-lag": kernel_loop_lag,
+    "debug-handler-budget": kernel_handler_budget,
+    "debug-guild-cost": kernel_guild_cost,
+    "debug-mem-snapshot": kernel_mem_snapshot,
+    "debug-mem-diff": kernel_mem_diff,
+    }
+
+
+def error_signature(err: BaseException) -> str:
+    """
+    Returns a short signature of an exception type and the code locations in its traceback, ignoring the message
+    """
+
+    frames = "|".join(f"{frame.f_code.co_filename}:{lineno}:{frame.f_code.co_name}" for frame, lineno in traceback.walk_tb(err.__traceback__))
+
+    return hashlib.sha256(f"{type(err).__qualname__}|{frames}".encode("utf8")).hexdigest()[:12]
+
+
+class error_record:
+    __slots__ = "name", "count", "logged_count", "last_logged", "last_seen"
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.count = 0
+        self.logged_count = 0
+        self.last_logged = 0.0
+        self.last_seen = 0.0
+
+
+class error_deduplicator:
+    """
+    Counts errors by traceback signature, a traceback is only logged in full the first time it is seen and then once per window
+    """
+    __slots__ = "records", "window"
+
+    def __init__(self, window: float = 300.0) -> None:
+        self.records: Dict[str, error_record] = {}
+        self.window = window
+
+    def observe(self, signature: str, err: BaseException) -> Optional[int]:
+        """
+        Records an occurrence of an error
+
+        :returns: Optional[int] - None if this occurrence should not be logged, otherwise how many occurrences went unlogged before it
+        """
+
+        now = time.monotonic()
+
+        try:
+            record = self.records[signature]
+        except KeyError:
+            record = self.records[signature] = error_record(f"{type(err).__name__}: {str(err)[:100]}")
+
+        record.count += 1
+        record.last_seen = now
+
+        if record.logged_count and now - record.last_logged < self.window:
+            return None
+
+        suppressed = record.count - record.logged_count - 1
+        record.logged_count = record.count
+        record.last_logged = now
+
+        return suppressed
+
+    def report(self) -> str:
+        by_count = sorted(self.records.items(), key=lambda i: -i[1].count)
+        return "\n".join(f"{sig} x{record.count} (last {time.monotonic()-record.last_seen:.0f}s ago) {record.name}" for sig, record in by_count)
+
+
+error_dedup = error_deduplicator()
+
+
+# A object used to pass error messages from the kernel callers to the event handlers
+class errtype:
+    __slots__ = "err", "errmsg", "signature"
+
+    def __init__(self, err: Exception, argtype: str):
+
+        self.err = err
+        self.signature = error_signature(err)
+        owner: str = f"<@!{BOT_OWNER[0]}>" if BOT_OWNER else "BOT OWNER"
+        # truncate to 1k chars to clip message to reasonable length, this makes message print to discord even if it is oversize
+        # the alternative is messages too large not being accepted by discord and causing a error in kernel handling code
+        # full error message can be obtained from err.log/stderr so this should be fine
+        self.errmsg = f"FATAL ERROR in {argtype}\nPlease contact {owner}\nErr: `{type(err).__name__}: {err}` (`{self.signature}`)"[:1000]
+
+        metrics.inc("errors", type(err).__name__)
+
+        # repeated errors only get counted, the full traceback is logged once per dedup window
+        if (suppressed := error_dedup.observe(self.signature, err)) is None:
+            return
+
+        formatted = "".join(traceback.format_exception(type(self.err), self.err, self.err.__traceback__)).rstrip("\n")
+        repeats = f" (seen {suppressed} more times since last logged)" if suppressed else ""
+
+        log_kernel_info(f"Error {self.signature}{repeats}:\n{formatted}")
+        error_logger.error(f"AT {datetime.datetime.now(datetime.timezone.utc).isoformat()} [{self.signature}]{repeats}:\n{formatted}")
+
+
+# KeyError sentinel so we don't catch KeyError
+class KernelKeyError(KeyError):
+    pass
+
+
+# Catch errors
+@Client.event
+async def on_error(event: str, *args: Any, **kwargs: Any) -> None:
+    raise
+
+
+# LeXdPyK 2.1: per guild fair scheduling
+class scheduler_slot:
+    __slots__ = "guild", "released", "timer"
+
+    def __init__(self, guild: int) -> None:
+        self.guild = guild
+        self.released = False
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class fair_scheduler:
+    """
+    Bounds in flight guild events per guild and overall, waiting events are queued per guild and granted by deficit round robin
+    A guild is charged its average handler CPU per event, so guilds with expensive events get fewer grants per round
+    Slots are leases, an event still running after lease seconds (a command sleeping out a mute) stops counting against the limits
+    """
+    __slots__ = "max_inflight", "per_guild", "lease", "quantum", "inflight", "guild_inflight", "queues", "ring", "deficit", "depth"
+
+    def __init__(self, max_inflight: int, per_guild: int, lease: float = 2.0, quantum: float = 0.001) -> None:
+        self.max_inflight = max_inflight
+        self.per_guild = per_guild
+        self.lease = lease
+        # CPU seconds of credit a guild gets each round
+        self.quantum = quantum
+        self.inflight = 0
+        self.guild_inflight: Dict[int, int] = {}
+        self.queues: Dict[int, "collections.deque[asyncio.Future[scheduler_slot]]"] = {}
+        # guilds with queued events in round robin order
+        self.ring: "collections.deque[int]" = collections.deque()
+        self.deficit: Dict[int, float] = {}
+        # events waiting across every guild queue
+        self.depth = 0
+
+    def _start(self, guild_id: int) -> scheduler_slot:
+        self.inflight += 1
+        self.guild_inflight[guild_id] = self.guild_inflight.get(guild_id, 0) + 1
+        slot = scheduler_slot(guild_id)
+        slot.timer = asyncio.get_running_loop().call_later(self.lease, self._expire, slot)
+        return slot
+
+    def try_acquire(self, guild_id: int) -> Optional[scheduler_slot]:
+        """
+        Returns a slot if the guild can run an event right away, without jumping ahead of its own queued events
+        """
+        if self.inflight < self.max_inflight and self.guild_inflight.get(guild_id, 0) < self.per_guild and guild_id not in self.queues:
+            return self._start(guild_id)
+        return None
+
+    async def wait(self, guild_id: int) -> scheduler_slot:
+        """
+        Queues an event until the scheduler grants it a slot
+        """
+
+        waiter: "asyncio.Future[scheduler_slot]" = asyncio.get_running_loop().create_future()
+
+        if guild_id not in self.queues:
+            self.queues[guild_id] = collections.deque()
+            self.deficit[guild_id] = 0.0
+            self.ring.append(guild_id)
+        self.queues[guild_id].append(waiter)
+        self.depth += 1
+
+        tstart = time.monotonic()
+
+        try:
+            slot = await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # granted in the same loop iteration it was cancelled
+                self.release(waiter.result())
+            elif (queue := self.queues.get(guild_id)) is not None and waiter in queue:
+                queue.remove(waiter)
+                self.depth -= 1
+                if not queue:
+                    self._drop(guild_id)
+            raise
+
+        metrics.queue_wait.observe(time.monotonic() - tstart)
+
+        return slot
+
+    def release(self, slot: scheduler_slot) -> None:
+
+        if slot.released:
+            return
+
+        slot.released = True
+        if slot.timer is not None:
+            slot.timer.cancel()
+
+        self.inflight -= 1
+        if (count := self.guild_inflight[slot.guild] - 1):
+            self.guild_inflight[slot.guild] = count
+        else:
+            del self.guild_inflight[slot.guild]
+
+        self._dispatch()
+
+    def _expire(self, slot: scheduler_slot) -> None:
+        metrics.inc("scheduler_lease_expired", "events")
+        slot.timer = None
+        self.release(slot)
+
+    def _drop(self, guild_id: int) -> None:
+        del self.queues[guild_id]
+        del self.deficit[guild_id]
+        self.ring.remove(guild_id)
+
+    def _price(self, guild_id: int) -> float:
+        cost = metrics.guilds.get(guild_id)
+        return max(cost.cpu / cost.events, 0.00001) if cost is not None and cost.events else self.quantum
+
+    def _dispatch(self) -> None:
+
+        # guilds skipped in a row for being at their own limit, once every queued guild is the loop ends
+        blocked = 0
+
+        while self.inflight < self.max_inflight and blocked < len(self.ring):
+
+            guild_id = self.ring[0]
+
+            if self.guild_inflight.get(guild_id, 0) >= self.per_guild:
+                blocked += 1
+                self.ring.rotate(-1)
+                continue
+
+            blocked = 0
+            price = self._price(guild_id)
+
+            if self.deficit[guild_id] < price:
+                self.deficit[guild_id] += self.quantum
+                self.ring.rotate(-1)
+                continue
+
+            self.deficit[guild_id] -= price
+
+            queue = self.queues[guild_id]
+            queue.popleft().set_result(self._start(guild_id))
+            self.depth -= 1
+
+            if not queue:
+                self._drop(guild_id)
+
+    def queued(self) -> Dict[int, int]:
+        return {guild_id: len(queue) for guild_id, queue in self.queues.items()}
+
+
+# Set by main, None runs every event as soon as it arrives
+scheduler: Optional[fair_scheduler] = fair_scheduler(64, 4)
+
+
+@types.coroutine
+def _charge_cpu(coro: Coroutine[Any, Any, Any], cost: guild_cost) -> Generator[Any, Any, Any]:
+    """
+    Runs a coroutine, charging the CPU time of each step it runs to a guild, so time spent suspended while other tasks run is not counted
+    """
+
+    send: Any = None
+    error: Optional[BaseException] = None
+
+    while True:
+        tstart = time.thread_time()
+        try:
+            step = coro.send(send) if error is None else coro.throw(error)
+        except StopIteration as done:
+            return done.value
+        finally:
+            cost.cpu += time.thread_time() - tstart
+
+        try:
+            send, error = (yield step), None
+        except GeneratorExit:
+            coro.close()
+            raise
+        except BaseException as e:
+            send, error = None, e
+
+
+async def do_event_return_error(event: Tuple[str, Any, Any], args: Tuple[Any, ...], cost: Optional[guild_cost] = None) -> Optional[Exception]:
+
+    name, func, _ = event
+    tstart = time.monotonic()
+
+    try:
+        if cost is None:
+            await func(*args)
+        else:
+            await _charge_cpu(func(*args), cost)
+        metrics.observe_handler(name, time.monotonic() - tstart, False)
+        return None
+    except Exception as e:
+        metrics.observe_handler(name, time.monotonic() - tstart, True)
+        return e
+
+
+def _event_filtered(event: Tuple[str, Any, Any], args: Tuple[Any, ...], argtype: str, etypes: List[errtype], cost: Optional[guild_cost]) -> bool:
+    """
+    Returns True if the filter declared for a handler rejects the event, a filter that raises lets the handler run
+    The filter runs outside the handler, so its CPU time is charged to the guild here
+    """
+
+    tstart = time.thread_time()
+
+    try:
+        if event[2](*args):
+            return False
+    except Exception as e:
+        etypes.append(errtype(e, argtype))
+        return False
+    finally:
+        if cost is not None:
+            cost.cpu += time.thread_time() - tstart
+
+    metrics.inc("filtered_events", event[0])
+    return True
+
+
+def _await_stack(coro: Any) -> traceback.StackSummary:
+    """
+    Returns the stack a suspended coroutine is waiting in, outermost frame first
+    """
+
+    frames: List[Tuple[types.FrameType, int]] = []
+
+    while coro is not None and (frame := getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)) is not None:
+        frames.append((frame, frame.f_lineno))
+        # _charge_cpu steps the handler by hand instead of delegating to it, so follow its coro local
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or (frame.f_locals.get("coro") if frame.f_code is _charge_cpu.__code__ else None)
+
+    return traceback.StackSummary.extract(frames)
+
+
+# LeXdPyK 2.1: handler budgets
+class handler_watchdog:
+    """
+    Reports handlers still running past the budget for their event type, with the stack they are waiting in
+    With detach set a tier that overruns is left to finish in the background, so later tiers of the event can proceed
+    """
+    __slots__ = "budgets", "default", "detach", "overruns"
+
+    def __init__(self, budgets: Dict[str, float], default: Optional[float], detach: bool, keep: int = 20) -> None:
+        self.budgets = budgets
+        self.default = default
+        self.detach = detach
+        # (unix time, event, handler name, budget, stack) of the most recent overruns
+        self.overruns: "collections.deque[Tuple[float, str, str, float, traceback.StackSummary]]" = collections.deque(maxlen=keep)
+
+    def budget(self, event: str) -> Optional[float]:
+        return self.budgets.get(event, self.default)
+
+    async def run_tier(self, event: str, ftable: Tuple[Any, ...], args: Tuple[Any, ...], cost: Optional[guild_cost], budget: float) -> List[errtype]:
+
+        tasks = {asyncio.create_task(do_event_return_error(func, args, cost)): func[0] for func in ftable}
+
+        _, pending = await asyncio.wait(tasks, timeout=budget)
+
+        for task in pending:
+            name = tasks[task]
+            self.overruns.append((time.time(), event, name, budget, _await_stack(task.get_coro())))
+            # labelled by module, handler names are module.qualname
+            metrics.inc("handler_overruns", name.split(".", 1)[0])
+            log_kernel_info(f"{name} overran its {budget}s budget for {event}{', detaching' if self.detach else ''}")
+
+        if pending and self.detach:
+            for task in pending:
+                metrics.inc("handlers_detached", tasks[task].split(".", 1)[0])
+                task.add_done_callback(functools.partial(self._detached_done, event))
+            tasks = {t: n for t, n in tasks.items() if t not in pending}
+        elif pending:
+            await asyncio.wait(pending)
+
+        return [errtype(e, event) for task in tasks if (e := task.result())]
+
+    def _detached_done(self, event: str, task: "asyncio.Task[Optional[Exception]]") -> None:
+        # nobody awaits a detached handler, so its error is logged here instead of reported to a channel
+        if not task.cancelled() and (e := task.result()):
+            errtype(e, event)
+
+    def report(self, frames: int = 6) -> str:
+
+        buf = io.StringIO()
+        buf.write(f"Default budget: {'none' if self.default is None else f'{self.default}s'}, detach: {self.detach}\n")
+        for event, seconds in self.budgets.items():
+            buf.write(f"{event}: {seconds}s\n")
+        buf.write(f"Overruns: {sum(metrics.counters.get('handler_overruns', {}).values())}, detached: {sum(metrics.counters.get('handlers_detached', {}).values())}\n")
+
+        # most recent first, since output gets truncated to fit a message
+        for at, event, name, budget, stack in reversed(self.overruns):
+            buf.write(f"\n{datetime.datetime.fromtimestamp(at, datetime.timezone.utc).isoformat(timespec='seconds')} {name} ran past {budget}s in {event}\n")
+            buf.write("".join(traceback.StackSummary.from_list(stack[-frames:]).format()) if stack else "  (no stack captured)\n")
+
+        return buf.getvalue()
+
+
+# Set by main, None runs handlers without budgets
+watchdog: Optional[handler_watchdog] = None
+
+
+def _event_guild(args: Tuple[Any, ...]) -> Optional[int]:
+    """
+    Returns the id of the guild an event belongs to, or None if it has no guild
+    """
+
+    if not args:
+        return None
+
+    obj = args[0]
+
+    # raw payloads carry guild_id, everything else carries a guild or is one
+    if (guild_id := getattr(obj, "guild_id", None)) is None:
+        guild = obj if isinstance(obj, discord.Guild) else getattr(obj, "guild", None)
+        if guild is None:
+            return None
+        guild_id = guild.id
+
+    return int(guild_id)
+
+
+def _event_shard(guild_id: Optional[int]) -> Optional[int]:
+    """
+    Returns the shard id of a guild, or None if it has no guild
+    """
+
+    if guild_id is None or not (shard_count := Client.shard_count):
+        return None
+
+    return (guild_id >> 22) % shard_count
+
+
+def shard_summary() -> Dict[int, Dict[str, float]]:
+    """
+    Returns per shard event throughput and latency since the last metrics reset, along with gateway latency
+    Published to modules through kernel_ramfs at global/shard_summary
+    """
 
-    compress_exec_dict()
+    uptime = max(time.monotonic() - metrics.start, 1e-9)
 
-    log_kernel_info(f"Loaded Kernel Modules in {(time.monotonic()-start_load_modules)*1000:.1f}ms")
+    summary: Dict[int, Dict[str, float]] = {}
 
-    if err: return ("\n".join([f"Error importing {i[1]}: {type(i[0]).__name__}: {i[0]}" for i in err]), [i[0] for i in err])
-    else: return None
+    if isinstance(Client, discord.AutoShardedClient):
+        for shard_id, latency in Client.latencies:
+            summary[shard_id] = {"events": 0, "events_per_second": 0.0, "p50": 0.0, "p95": 0.0, "gateway_latency": latency}
 
+    for shard, hist in metrics.shards.items():
+        entry = summary.setdefault(int(shard), {"gateway_latency": float("nan")})
+        entry.update(events=hist.count, events_per_second=hist.count / uptime, p50=hist.percentile(50), p95=hist.percentile(95))
 
-def regenerate_ramfs(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
-    log_kernel_info("Regenerating ramfs")
-    global ramfs
-    ramfs = ram_filesystem()
-    return None
+    return summary
 
 
-def regenerate_kernel_ramfs(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
-    log_kernel_info("Regenerating kernel ramfs")
-    global kernel_ramfs
-    kernel_ramfs = ram_filesystem()
-    return None
+async def event_call(argtype: str, *args: Any) -> Optional[errtype]:
 
+    try:
+        functions = dynamiclib_modules_dispatch[argtype]
+    except KeyError:
+        functions = ()
 
-def kernel_reload_command_modules(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
-    log_kernel_info("Reloading Kernel Modules")
-    # Init vars
-    global command_modules, command_modules_dict, dynamiclib_modules, dynamiclib_modules_dict, dynamiclib_modules_exec_dict
-    command_modules_dict = {}
-    dynamiclib_modules_dict = {}
-    dynamiclib_modules_exec_dict = {}
+    guild_id = _event_guild(args)
+    cost = metrics.guild(guild_id) if guild_id is not None and functions else None
 
-    start_reload_modules = time.monotonic()
+    # Guild events go through the fair scheduler so one busy guild cannot delay every other guild
+    slot: Optional[scheduler_slot] = None
+    if scheduler is not None and cost is not None and guild_id is not None:
+        slot = scheduler.try_acquire(guild_id) or await scheduler.wait(guild_id)
 
-    # Init ret state
-    err = []
+    tstartexec = time.monotonic()
 
-    err.extend(reload_libraries())
+    etypes: List[errtype] = []
 
-    # Update set
-    for i in range(len(command_modules)):
-        try:
-            command_modules[i] = (importlib.reload(command_modules[i]))
-        except Exception as e:
-            err.append((e, command_modules[i].__name__))
-    for i in range(len(dynamiclib_modules)):
-        try:
-            dynamiclib_modules[i] = (importlib.reload(dynamiclib_modules[i]))
-        except Exception as e:
-            err.append((e, dynamiclib_modules[i].__name__))
+    budget = watchdog.budget(argtype) if watchdog is not None else None
 
-    # Update hashmaps
-    for module in command_modules:
-        try:
-            command_modules_dict.update(module.commands)
-        except AttributeError:
-            err.append((KernelSyntaxError("Missing commands"), module.__name__))
-    for module in dynamiclib_modules:
-        try:
-            add_module_to_exec_dict(module.commands)
-            dynamiclib_modules_dict.update(module.commands)
-        except AttributeError:
-            err.append((KernelSyntaxError("Missing commands"), module.__name__))
+    try:
+        for ftable in functions:
 
-    # Regen tempramfs
-    regenerate_ramfs()
+            # Most tiers have one handler, awaiting it in place skips scheduling a task
+            if len(ftable) == 1 and budget is None:
+                if ftable[0][2] is not None and _event_filtered(ftable[0], args, argtype, etypes, cost):
+                    continue
+                if err := (await do_event_return_error(ftable[0], args, cost)):
+                    etypes.append(errtype(err, argtype))
+                continue
 
-    compress_exec_dict()
+            # Handlers whose filter rejects the event are dropped before anything is scheduled
+            if not (ftable := tuple(f for f in ftable if f[2] is None or not _event_filtered(f, args, argtype, etypes, cost))):
+                continue
 
-    log_kernel_info(f"Reloaded Kernel Modules in {(time.monotonic()-start_reload_modules)*1000:.1f}ms")
+            if budget is not None and watchdog is not None:
+                etypes.extend(await watchdog.run_tier(argtype, ftable, args, cost, budget))
+                continue
 
-    if err: return ("\n".join([f"Error reimporting {i[1]}: {type(i[0]).__name__}: {i[0]}" for i in err]), [i[0] for i in err])
-    else: return None
+            tasks = [asyncio.create_task(do_event_return_error(func, args, cost)) for func in ftable]
 
+            for i in tasks:
+                if e := (await i):
+                    etypes.append(errtype(e, argtype))
+    finally:
+        if slot is not None and scheduler is not None:
+            scheduler.release(slot)
 
-def kernel_blacklist_guild(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
-    log_kernel_info(f"Attempting to blacklist guild with args {args}")
+    metrics.observe_event(argtype, time.monotonic() - tstartexec)
 
-    try:
-        blacklist["guild"].append(int(args[0]))
-    except (ValueError, IndexError):
-        return "Asking value is not INT", []
+    if cost is not None:
+        cost.events += 1
+        cost.wall += time.monotonic() - tstartexec
 
-    with open("common/blacklist.json", "w", encoding="utf-8") as blacklist_file:
-        json.dump(blacklist, blacklist_file)
+    if sharded and (shard_id := _event_shard(guild_id)) is not None:
+        metrics.observe_shard(shard_id, time.monotonic() - tstartexec)
 
-    return None
+    if DEVELOPMENT_MODE:
+        log_kernel_info(f"EVENT {argtype} : {round((time.monotonic()-tstartexec)*100000)/100}ms CC {len(functions)}")
+
+    if etypes:
+        return etypes[0]
+    else:
+        return None
 
 
-def kernel_blacklist_user(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
-    log_kernel_info(f"Attempting to blacklist user with args {args}")
+async def metrics_export_loop() -> None:
+    """
+    Periodically writes the prometheus textfile, the file is replaced atomically for textfile collectors
+    """
 
-    try:
-        blacklist["user"].append(int(args[0]))
-    except (ValueError, IndexError):
-        return "Asking value is not INT", []
+    while metrics_textfile is not None:
 
-    with open("common/blacklist.json", "w", encoding="utf-8") as blacklist_file:
-        json.dump(blacklist, blacklist_file)
+        try:
+            with open(f"{metrics_textfile}.tmp", "w", encoding="utf-8") as textfile:
+                textfile.write(metrics.prometheus())
+            os.replace(f"{metrics_textfile}.tmp", metrics_textfile)
+        except OSError as e:
+            log_kernel_info(f"Failed to write metrics textfile: {e}")
 
-    return None
+        await asyncio.sleep(metrics_interval)
 
 
-def kernel_unblacklist_guild(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
-    log_kernel_info(f"Attempting to unblacklist guild with args {args}")
+async def ramfs_maintenance_loop() -> None:
+    """
+    Periodically drops expired ramfs entries and evicts least recently used guilds past the memory budget
+    """
 
-    try:
-        if int(args[0]) in blacklist["guild"]:
-            del blacklist["guild"][blacklist["guild"].index(int(args[0]))]
-        else:
-            return "Item is not blacklisted", []
-    except (ValueError, IndexError):
-        return "Asking value is not INT", []
+    while True:
 
-    with open("common/blacklist.json", "w", encoding="utf-8") as blacklist_file:
-        json.dump(blacklist, blacklist_file)
+        await asyncio.sleep(ramfs_maintenance_interval)
 
-    return None
+        for name, fs, budget in (("ramfs", ramfs, ramfs_budget), ("kernel_ramfs", kernel_ramfs, kernel_ramfs_budget)):
+            if expired := fs.expire():
+                metrics.inc("ramfs_expired", name, expired)
 
+            if budget is not None and (evicted := fs.evict_lru(budget)):
+                metrics.inc("ramfs_evictions", name, len(evicted))
+                if DEVELOPMENT_MODE:
+                    log_kernel_info(f"Evicted {len(evicted)} guilds from {name}")
 
-def kernel_unblacklist_user(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
-    log_kernel_info(f"Attempting to unblacklist user with args {args}")
 
-    try:
-        if int(args[0]) in blacklist["user"]:
-            del blacklist["user"][blacklist["user"].index(int(args[0]))]
-        else:
-            return "Item is not blacklisted", []
-    except (ValueError, IndexError):
-        return "Asking value is not INT", []
+# LeXdPyK 2.1: event loop lag monitor
+class loop_lag_monitor:
+    """
+    Measures event loop lag as how late a periodic wakeup runs, and optionally captures the stack of any callback holding the loop past a threshold
+    Stack capture rearms a process wide SIGALRM timer on every wakeup so it only fires while something blocks the loop, its handler then runs inside that callback
+    The signal can interrupt blocking C calls (database connectors, sqlite busy waits) with EINTR, and a stall inside one is only attributed once it returns,
+    so capture is off unless a threshold is set
+    """
+    __slots__ = "interval", "threshold", "stalls", "last_lag", "_stack"
 
-    with open("common/blacklist.json", "w", encoding="utf-8") as blacklist_file:
-        json.dump(blacklist, blacklist_file)
+    def __init__(self, interval: float, threshold: float, keep: int = 20) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        # (unix time, seconds blocked, stack) of the most recent stalls
+        self.stalls: "collections.deque[Tuple[float, float, traceback.StackSummary]]" = collections.deque(maxlen=keep)
+        self.last_lag = 0.0
+        self._stack: Optional[traceback.StackSummary] = None
 
-    return None
+    def _on_alarm(self, signum: int, frame: Optional[types.FrameType]) -> None:
+        if frame is not None:
+            self._stack = traceback.extract_stack(frame)
 
+    async def run(self) -> None:
 
-def kernel_logout(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
-    log_kernel_info("Logging out of discord client session")
-    asyncio.create_task(Client.close())
-    return None
+        # Without a threshold or without SIGALRM (windows) lag is still measured, only stack capture is lost
+        can_alarm = self.threshold > 0 and hasattr(signal, "setitimer")
+        if can_alarm:
+            signal.signal(signal.SIGALRM, self._on_alarm)
 
+        try:
+            while True:
+                self._stack = None
+                if can_alarm:
+                    signal.setitimer(signal.ITIMER_REAL, self.interval + self.threshold)
+
+                expected = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                lag = self.last_lag = max(time.monotonic() - expected, 0.0)
+
+                if can_alarm:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+
+                metrics.loop_lag.observe(lag)
+
+                if self.threshold > 0 and lag >= self.threshold:
+                    stack = self._stack or traceback.StackSummary()
+                    self.stalls.append((time.time(), lag, stack))
+                    # labelled by the innermost frame, usually the blocking call itself
+                    metrics.inc("loop_stalls", f"{os.path.basename(stack[-1].filename)}:{stack[-1].lineno} {stack[-1].name}" if stack else "unknown")
+        finally:
+            if can_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+
+    def report(self, frames: int = 6) -> str:
+        """
+        Returns loop lag percentiles and the most recent stalls with the innermost frames of their stacks
+        """
 
-def kernel_drop_dlibs(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
-    log_kernel_info("Dropping dynamiclib modules")
-    global dynamiclib_modules, dynamiclib_modules_dict, dynamiclib_modules_exec_dict
-    dynamiclib_modules = []
-    dynamiclib_modules_dict = {}
-    dynamiclib_modules_exec_dict = {}
-    return None
+        lag = metrics.loop_lag
 
+        buf = io.StringIO()
+        buf.write(f"Loop lag over {lag.count} samples every {self.interval*1000:.0f}ms: ")
+        buf.write(f"p50={lag.percentile(50)*1000:.2f}ms p95={lag.percentile(95)*1000:.2f}ms p99={lag.percentile(99)*1000:.2f}ms max={lag.max*1000:.2f}ms\n")
+        if self.threshold > 0:
+            buf.write(f"Stalls over {self.threshold*1000:.0f}ms: {sum(metrics.counters.get('loop_stalls', {}).values())}\n")
+        else:
+            buf.write("Stall stack capture is off, enable it with --loop-lag-threshold\n")
 
-def kernel_drop_cmds(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
-    log_kernel_info("Dropping command modules")
-    global command_modules, command_modules_dict
-    command_modules = []
-    command_modules_dict = {}
-    return None
+        # most recent first, since output gets truncated to fit a message
+        for at, seconds, stack in reversed(self.stalls):
+            buf.write(f"\n{datetime.datetime.fromtimestamp(at, datetime.timezone.utc).isoformat(timespec='seconds')} blocked {seconds*1000:.0f}ms\n")
+            buf.write("".join(traceback.StackSummary.from_list(stack[-frames:]).format()) if stack else "  (no stack captured)\n")
 
+        return buf.getvalue()
 
-def logging_toggle(args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
 
-    is_debug = logger.isEnabledFor(logging.DEBUG)
+# Started in on_connect, the threshold is set by main, lag is always measured since the load shedder reads it
+loop_lag_interval = 0.1
+loop_lag_threshold = 0.0
+loop_monitor: Optional[loop_lag_monitor] = None
+loop_monitor_task: Optional["asyncio.Task[None]"] = None
 
-    log_kernel_info(f"Swapping log visibility to {'INFO' if is_debug else 'DEBUG'}")
 
-    if is_debug:
-        logger.setLevel(logging.INFO)
-        return "Logging at L20 (INFO)", []
-    else:
-        logger.setLevel(logging.DEBUG)
-        return "Logging at L10 (DEBUG)", []
+# LeXdPyK 2.1: load shedding
+class load_shedder:
+    """
+    Handles work modules tag as deferrable (logging, statistics, caching), anything not routed through here is critical and always runs
+    Pressure is the last loop lag or the fair scheduler queue depth against its threshold, whichever is worse
+    At 1x deferrable work is held in a backlog and run once pressure drops, at 2x or with the backlog full it is dropped
+    Published to modules through kernel_ramfs at global/load_shedder
+    """
+    __slots__ = "lag_threshold", "depth_threshold", "max_backlog", "max_delay", "backlog", "_drain_task"
+
+    def __init__(self, lag_threshold: float, depth_threshold: int, max_backlog: int = 1024, max_delay: float = 30.0) -> None:
+        self.lag_threshold = lag_threshold
+        self.depth_threshold = depth_threshold
+        self.max_backlog = max_backlog
+        # held work older than this is dropped instead of run late
+        self.max_delay = max_delay
+        self.backlog: "collections.deque[Tuple[float, str, Coroutine[Any, Any, Any]]]" = collections.deque()
+        self._drain_task: Optional["asyncio.Task[None]"] = None
+
+    def pressure(self) -> float:
+        lag = loop_monitor.last_lag / self.lag_threshold if loop_monitor is not None and self.lag_threshold > 0 else 0.0
+        depth = scheduler.depth / self.depth_threshold if scheduler is not None and self.depth_threshold > 0 else 0.0
+        return max(lag, depth)
+
+    def shed(self, name: str) -> bool:
+        """
+        Returns True if deferrable work too cheap to be worth holding, like a statistics counter, should be skipped
+        """
+        if self.pressure() >= 1:
+            metrics.inc("shed_work", name)
+            return True
+        return False
 
+    def defer(self, name: str, work: Coroutine[Any, Any, Any]) -> None:
+        """
+        Runs deferrable work now, later, or never depending on pressure
+        """
 
-class DebugCallable(Protocol):
-    def __call__(self, args: List[str] = []) -> Optional[Tuple[str, List[Exception]]]:
-        return None
+        pressure = self.pressure()
 
+        # work queued behind an existing backlog keeps its order
+        if pressure < 1 and not self.backlog:
+            asyncio.create_task(work)
+            return
 
-# Generate debug command subset
-debug_commands: Dict[str, DebugCallable] = {
-    "debug-add-guild-blacklist": kernel_blacklist_guild,
-    "debug-add-user-blacklist": kernel_blacklist_user,
-    "debug-remove-guild-blacklist": kernel_unblacklist_guild,
-    "debug-remove-user-blacklist": kernel_unblacklist_user,
-    "debug-modules-load": kernel_load_command_modules,
-    "debug-modules-reload": kernel_reload_command_modules,
-    "debug-logout-system": kernel_logout,
-    "debug-drop-ramfs": regenerate_ramfs,
-    "debug-drop-kramfs": regenerate_kernel_ramfs,
-    "debug-drop-modules": kernel_drop_dlibs,
-    "debug-drop-commands": kernel_drop_cmds,
-    "debug-toggle-logging": logging_toggle,
-    }
+        if pressure >= 2 or len(self.backlog) >= self.max_backlog:
+            work.close()
+            metrics.inc("shed_work", name)
+            return
 
+        self.backlog.append((time.monotonic(), name, work))
+        metrics.inc("deferred_work", name)
 
-# A object used to pass error messages from the kernel callers to the event handlers
-class errtype:
-    __slots__ = "err", "errmsg"
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain())
 
-    def __init__(self, err: Exception, argtype: str):
+    async def _drain(self) -> None:
 
-        self.err = err
-        owner: str = f"<@!{BOT_OWNER[0]}>" if BOT_OWNER else "BOT OWNER"
-        # truncate to 1k chars to clip message to reasonable length, this makes message print to discord even if it is oversize
-        # the alternative is messages too large not being accepted by discord and causing a error in kernel handling code
-        # full error message can be obtained from err.log/stderr so this should be fine
-        self.errmsg = f"FATAL ERROR in {argtype}\nPlease contact {owner}\nErr: `{type(err).__name__}: {err}`"[:1000]
+        while self.backlog:
 
-        log_kernel_info("".join(traceback.format_exception(type(self.err), self.err, self.err.__traceback__)))
+            if self.pressure() >= 1:
+                await asyncio.sleep(loop_lag_interval)
+                continue
 
-        # accept penalty of fopen syscall because errors should not be frequent and deleting/moving logs may be needed
-        with open("err.log", "a+", encoding="utf-8") as logfile:
-            logfile.write(f"AT {datetime.datetime.now(datetime.timezone.utc).isoformat()}:\n")
-            logfile.write("".join(traceback.format_exception(type(self.err), self.err, self.err.__traceback__)))
+            queued_at, name, work = self.backlog.popleft()
 
+            if time.monotonic() - queued_at > self.max_delay:
+                work.close()
+                metrics.inc("shed_work", name)
+                continue
 
-# KeyError sentinel so we don't catch KeyError
-class KernelKeyError(KeyError):
-    pass
+            asyncio.create_task(work)
+            # let the released work run before measuring pressure again
+            await asyncio.sleep(0)
 
 
-# Catch errors
-@Client.event
-async def on_error(event: str, *args: Any, **kwargs: Any) -> None:
-    raise
+# Thresholds are set by main
+shedder = load_shedder(0.5, 512)
 
 
-async def do_event_return_error(event: Any, args: Tuple[Any, ...]) -> Optional[Exception]:
-    try:
+# LeXdPyK 2.1: gateway recording, logs are replayed offline by build_tools/replay_events.py
+class gateway_recorder:
+    """
+    Appends raw gateway dispatches to a gzip compressed log
+    one event per line, as seconds since recording started, a space, then the raw json payload
+    """
+    __slots__ = "_file", "_start", "count"
 
-        await event(
-            *args,
-            client=Client,
-            ramfs=ramfs,
-            bot_start=bot_start_time,
-            command_modules=[command_modules, command_modules_dict],
-            dynamiclib_modules=[dynamiclib_modules, dynamiclib_modules_dict],
-            kernel_version=version_info,
-            kernel_ramfs=kernel_ramfs
-            )
-        return None
-    except Exception as e:
-        return e
+    def __init__(self, path: str) -> None:
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._start = time.monotonic()
+        self.count = 0
 
+    def record(self, msg: str) -> None:
 
-async def event_call(argtype: str, *args: Any) -> Optional[errtype]:
+        try:
+            payload = json.loads(msg)
+        except ValueError:
+            return
 
-    # used by dev mode
-    tstartexec = time.monotonic()
+        # Only dispatches carry state, heartbeats and other opcodes are connection bookkeeping
+        if payload.get("op") != 0 or not payload.get("t"):
+            return
 
-    etypes = []
+        # newlines can only occur as whitespace between json tokens, so this keeps one event per line
+        self._file.write(f"{time.monotonic()-self._start:.6f} {msg.replace(chr(10), ' ')}\n")
+        self.count += 1
 
-    try:
-        functions = dynamiclib_modules_exec_dict[argtype]
-    except KeyError:
-        functions = []
+    def close(self) -> None:
+        self._file.close()
 
-    for ftable in functions:
-        tasks = [asyncio.create_task(do_event_return_error(func, args)) for func in ftable]
 
-        for i in tasks:
-            if e := (await i):
-                etypes.append(errtype(e, argtype))
+def read_gateway_log(path: str) -> Iterator[Tuple[float, str, Dict[str, Any]]]:
+    """
+    Yields (seconds since recording started, event name, event data) from a gateway_recorder log
+    """
 
-    if DEVELOPMENT_MODE:
-        log_kernel_info(f"EVENT {argtype} : {round((time.monotonic()-tstartexec)*100000)/100}ms CC {len(functions)}")
+    with gzip.open(path, "rt", encoding="utf-8") as log:
+        for line in log:
+            offset, raw = line.split(" ", 1)
+            payload = json.loads(raw)
+            yield float(offset), payload["t"], payload["d"]
 
-    if etypes:
-        return etypes[0]
-    else:
-        return None
+
+# Set by main when running with --record-events
+event_recorder: Optional[gateway_recorder] = None
+
+
+async def on_socket_raw_receive(msg: str) -> None:
+    if event_recorder is not None:
+        event_recorder.record(msg)
 
 
 UT = TypeVar("UT", bound=Union[discord.User, discord.Member])
@@ -749,7 +2988,7 @@ async def safety_check(guild: Optional[discord.Guild] = None, guild_id: Optional
     if user: user_id = user.id
     non_null_guild: discord.Guild
 
-    if user_id and user_id in blacklist["user"] and guild_id:
+    if user_id and user_id in blacklist.user and guild_id:
 
         try:
             user = await Client.fetch_user(user_id)
@@ -765,7 +3004,7 @@ async def safety_check(guild: Optional[discord.Guild] = None, guild_id: Optional
             await non_null_guild.ban(lexdpyk_to_snowflake(user), reason="LeXdPyK: SYSTEM LEVEL BLACKLIST", delete_message_days=0)
         except discord.errors.Forbidden:
 
-            # call kernel_blacklist_guild to add to json db, blacklist guild
+            # call kernel_blacklist_guild to add to blacklist journal, blacklist guild
             # because it must be controlled by user that is blacklisted if there are no perms
             kernel_blacklist_guild([str(guild_id)])
             try:
@@ -779,7 +3018,7 @@ async def safety_check(guild: Optional[discord.Guild] = None, guild_id: Optional
 
         return False
 
-    if guild_id and guild_id in blacklist["guild"]:
+    if guild_id and guild_id in blacklist.guild:
 
         try:
             non_null_guild = await Client.fetch_guild(guild_id)
@@ -805,9 +3044,60 @@ async def sendable_send(sendable: object, message: str) -> None:
             pass
 
 
+# Seconds between reports of the same error to the same channel, and the last report time/suppressed count per (channel, signature)
+error_report_interval = 60.0
+error_reports: Dict[Tuple[int, str], Tuple[float, int]] = {}
+
+
+async def report_error(sendable: object, err: errtype) -> None:
+    """
+    Sends an error message to a channel, repeats of the same error in the same channel are sent at most once per error_report_interval
+    """
+
+    if not isinstance(sendable, (discord.TextChannel, discord.DMChannel)):
+        return
+
+    now = time.monotonic()
+    key = (sendable.id, err.signature)
+
+    last, suppressed = error_reports.get(key, (0.0, 0))
+
+    if now - last < error_report_interval:
+        error_reports[key] = (last, suppressed + 1)
+        metrics.inc("error_reports_suppressed", type(err.err).__name__)
+        return
+
+    # drop stale entries instead of letting a long error storm grow this forever
+    if len(error_reports) > 4096:
+        for k in [k for k, v in error_reports.items() if now - v[0] >= error_report_interval]:
+            del error_reports[k]
+
+    error_reports[key] = (now, 0)
+
+    await sendable_send(sendable, f"{err.errmsg}\n({suppressed} similar errors not reported)" if suppressed else err.errmsg)
+
+
+metrics_export_task: Optional["asyncio.Task[None]"] = None
+ramfs_maintenance_task: Optional["asyncio.Task[None]"] = None
+
+
 @Client.event
 async def on_connect() -> None:
     log_kernel_info(f"Connection to discord established {(time.monotonic()-kernel_start):.2f}s after boot")
+
+    global metrics_export_task
+    if metrics_textfile is not None and metrics_export_task is None:
+        metrics_export_task = asyncio.create_task(metrics_export_loop())
+
+    global ramfs_maintenance_task
+    if ramfs_maintenance_task is None:
+        ramfs_maintenance_task = asyncio.create_task(ramfs_maintenance_loop())
+
+    global loop_monitor, loop_monitor_task
+    if loop_monitor_task is None:
+        loop_monitor = loop_lag_monitor(loop_lag_interval, loop_lag_threshold)
+        loop_monitor_task = asyncio.create_task(loop_monitor.run())
+
     await event_call("on-connect")
 
 
@@ -826,6 +3116,27 @@ async def on_resumed() -> None:
     await event_call("on-resumed")
 
 
+@Client.event
+async def on_shard_connect(shard_id: int) -> None:
+    log_kernel_info(f"Shard {shard_id} connected")
+    await event_call("on-shard-connect", shard_id)
+
+
+@Client.event
+async def on_shard_disconnect(shard_id: int) -> None:
+    await event_call("on-shard-disconnect", shard_id)
+
+
+@Client.event
+async def on_shard_ready(shard_id: int) -> None:
+    await event_call("on-shard-ready", shard_id)
+
+
+@Client.event
+async def on_shard_resumed(shard_id: int) -> None:
+    await event_call("on-shard-resumed", shard_id)
+
+
 @Client.event
 async def on_message(message: discord.Message) -> None:
 
@@ -844,104 +3155,104 @@ async def on_message(message: discord.Message) -> None:
 
     if await safety_check(guild=message.guild, user=message.author):
         if err := await event_call("on-message", message):
-            await sendable_send(message.channel, err.errmsg)
+            await report_error(message.channel, err)
 
 
 @Client.event
 async def on_message_delete(message: discord.Message) -> None:
     if await safety_check(guild=message.guild, user=message.author):
         if e := await event_call("on-message-delete", message):
-            await sendable_send(message.channel, e.errmsg)
+            await report_error(message.channel, e)
 
 
 @Client.event
 async def on_bulk_message_delete(messages: List[discord.Message]) -> None:
     if await safety_check(guild=messages[0].guild, user=messages[0].author):
         if e := await event_call("on-bulk-message-delete", messages):
-            await sendable_send(messages[0].channel, e.errmsg)
+            await report_error(messages[0].channel, e)
 
 
 @Client.event
 async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent) -> None:
     if await safety_check(guild_id=payload.guild_id):
         if e := await event_call("on-raw-message-delete", payload):
-            await sendable_send(Client.get_channel(payload.channel_id), e.errmsg)
+            await report_error(Client.get_channel(payload.channel_id), e)
 
 
 @Client.event
 async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent) -> None:
     if await safety_check(guild_id=payload.guild_id):
         if e := await event_call("on-raw-bulk-message-delete", payload):
-            await sendable_send(Client.get_channel(payload.channel_id), e.errmsg)
+            await report_error(Client.get_channel(payload.channel_id), e)
 
 
 @Client.event
 async def on_message_edit(old_message: discord.Message, message: discord.Message) -> None:
     if await safety_check(guild=message.guild, user=message.author):
         if e := await event_call("on-message-edit", old_message, message):
-            await sendable_send(message.channel, e.errmsg)
+            await report_error(message.channel, e)
 
 
 @Client.event
 async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent) -> None:
     if e := await event_call("on-raw-message-edit", payload):
-        await sendable_send(Client.get_channel(payload.channel_id), e.errmsg)
+        await report_error(Client.get_channel(payload.channel_id), e)
 
 
 @Client.event
 async def on_reaction_add(reaction: discord.Reaction, user: Union[discord.Member, discord.User]) -> None:
     if await safety_check(guild=reaction.message.guild, user=user):
         if e := await event_call("on-reaction-add", reaction, user):
-            await sendable_send(reaction.message.channel, e.errmsg)
+            await report_error(reaction.message.channel, e)
 
 
 @Client.event
 async def on_raw_reaction_add(payload: discord.RawReactionActionEvent) -> None:
     if await safety_check(guild_id=payload.guild_id, user_id=payload.user_id):
         if e := await event_call("on-raw-reaction-add", payload):
-            await sendable_send(Client.get_channel(payload.channel_id), e.errmsg)
+            await report_error(Client.get_channel(payload.channel_id), e)
 
 
 @Client.event
 async def on_reaction_remove(reaction: discord.Reaction, user: Union[discord.Member, discord.User]) -> None:
     if await safety_check(guild=reaction.message.guild, user=user):
         if e := await event_call("on-reaction-remove", reaction, user):
-            await sendable_send(reaction.message.channel, e.errmsg)
+            await report_error(reaction.message.channel, e)
 
 
 @Client.event
 async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent) -> None:
     if await safety_check(guild_id=payload.guild_id, user_id=payload.user_id):
         if e := await event_call("on-raw-reaction-remove", payload):
-            await sendable_send(Client.get_channel(payload.channel_id), e.errmsg)
+            await report_error(Client.get_channel(payload.channel_id), e)
 
 
 @Client.event
 async def on_reaction_clear(message: discord.Message, reactions: List[discord.Reaction]) -> None:
     if await safety_check(guild=message.guild, user=message.author):
         if e := await event_call("on-reaction-clear", message, reactions):
-            await sendable_send(message.channel, e.errmsg)
+            await report_error(message.channel, e)
 
 
 @Client.event
 async def on_raw_reaction_clear(payload: discord.RawReactionClearEvent) -> None:
     if await safety_check(guild_id=payload.guild_id):
         if e := await event_call("on-raw-reaction-clear", payload):
-            await sendable_send(Client.get_channel(payload.channel_id), e.errmsg)
+            await report_error(Client.get_channel(payload.channel_id), e)
 
 
 @Client.event
 async def on_reaction_clear_emoji(reaction: discord.Reaction) -> None:
     if await safety_check(guild=reaction.message.guild):
         if e := await event_call("on-reaction-clear-emoji", reaction):
-            await sendable_send(reaction.message.channel, e.errmsg)
+            await report_error(reaction.message.channel, e)
 
 
 @Client.event
 async def on_raw_reaction_clear_emoji(payload: discord.RawReactionClearEvent) -> None:
     if await safety_check(guild_id=payload.guild_id):
         if e := await event_call("on-raw-reaction-clear-emoji", payload):
-            await sendable_send(Client.get_channel(payload.channel_id), e.errmsg)
+            await report_error(Client.get_channel(payload.channel_id), e)
 
 
 @Client.event
@@ -1038,7 +3349,7 @@ async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent) -> None:
 
 async def on_presence_update(before: discord.Member, after: discord.Member) -> None:
     if await safety_check(guild=before.guild, user=before):
-        await event_call("on-presence-update")
+        await event_call("on-presence-update", before, after)
 
 
 def gentoken() -> str:
@@ -1057,6 +3368,23 @@ def gentoken() -> str:
     return TOKEN
 
 
+def parse_shard_ids(spec: str) -> List[int]:
+    """
+    Parses a shard id range (0-3) or list (0,2,5), raises ValueError on malformed input
+    """
+
+    ids: List[int] = []
+
+    for part in spec.split(","):
+        if "-" in part:
+            start, end = part.split("-", 1)
+            ids.extend(range(int(start), int(end) + 1))
+        else:
+            ids.append(int(part))
+
+    return sorted(set(ids))
+
+
 # Main function, handles userland startup
 def main(args: List[str]) -> int:
 
@@ -1065,10 +3393,53 @@ def main(args: List[str]) -> int:
     parser.add_argument("--generate-token", action="store_true", help="discards the current token file if there is one, and generates a new encrypted tokenfile")
     parser.add_argument("--version", "-v", action="store_true", help="print version info and exit")
     parser.add_argument("--development", "--dev", action="store_true", help="enables development mode (prints event handling and dumps ramfs on exit), may cause performance issues")
+    parser.add_argument("--metrics-textfile", default=None, help="periodically write kernel metrics to this path in the prometheus text format")
+    parser.add_argument("--metrics-interval", type=float, default=15.0, help="seconds between metrics textfile writes (default 15)")
+    parser.add_argument("--ramfs-budget", type=float, default=None, help="approximate ramfs size in MB before least recently used guilds are evicted (default unlimited)")
+    parser.add_argument("--kramfs-budget", type=float, default=None, help="approximate kernel_ramfs size in MB before least recently used guilds are evicted (default unlimited)")
+    parser.add_argument("--shards", default=None, help="run with an AutoShardedClient, 'auto' lets discord pick the shard count, a number sets it")
+    parser.add_argument("--shard-ids", default=None, help="only run these shards in this process, as a range (0-3) or list (0,2), requires --shards COUNT")
+    parser.add_argument(
+        "--loop-lag-threshold",
+        type=float,
+        default=0.0,
+        help="seconds a callback may block the event loop before its stack is captured, 0 disables (default 0), "
+        "capture arms a SIGALRM timer that can interrupt blocking database calls with EINTR, so only enable it while debugging stalls"
+        )
+    parser.add_argument("--guild-concurrency", type=int, default=4, help="guild events that may run at once per guild before more are queued, 0 disables fair scheduling (default 4)")
+    parser.add_argument("--event-concurrency", type=int, default=64, help="guild events that may run at once across all guilds (default 64)")
+    parser.add_argument("--shed-loop-lag", type=float, default=0.5, help="loop lag in seconds past which deferrable work is delayed, and dropped past twice it, 0 disables (default 0.5)")
+    parser.add_argument("--shed-queue-depth", type=int, default=512, help="queued guild events past which deferrable work is delayed, and dropped past twice it, 0 disables (default 512)")
+    parser.add_argument("--handler-budget", action="append", default=[], help="seconds a handler may hold up its event as EVENT=SECONDS (on-message=2), or SECONDS for every event, may be repeated")
+    parser.add_argument("--detach-over-budget", action="store_true", help="leave handlers that overrun their budget running in the background so later tiers proceed")
+    parser.add_argument("--record-events", default=None, help="record raw gateway events to this gzip file, for offline replay with build_tools/replay_events.py")
     parsed = parser.parse_args()
 
-    global DEVELOPMENT_MODE
+    global DEVELOPMENT_MODE, metrics_textfile, metrics_interval, ramfs_budget, kernel_ramfs_budget, event_recorder, loop_lag_threshold, scheduler, watchdog
     DEVELOPMENT_MODE = parsed.development
+    metrics_textfile = parsed.metrics_textfile
+    metrics_interval = parsed.metrics_interval
+    ramfs_budget = None if parsed.ramfs_budget is None else int(parsed.ramfs_budget * 1000000)
+    kernel_ramfs_budget = None if parsed.kramfs_budget is None else int(parsed.kramfs_budget * 1000000)
+    loop_lag_threshold = parsed.loop_lag_threshold
+    scheduler = fair_scheduler(max(parsed.event_concurrency, 1), parsed.guild_concurrency) if parsed.guild_concurrency > 0 else None
+    shedder.lag_threshold = parsed.shed_loop_lag
+    shedder.depth_threshold = parsed.shed_queue_depth
+
+    budgets: Dict[str, float] = {}
+    default_budget: Optional[float] = None
+    for spec in parsed.handler_budget:
+        event, _, seconds = spec.rpartition("=")
+        try:
+            if event:
+                budgets[event] = float(seconds)
+            else:
+                default_budget = float(seconds)
+        except ValueError:
+            parser.error(f"invalid handler budget {spec!r}, expected EVENT=SECONDS or SECONDS")
+
+    if budgets or default_budget is not None:
+        watchdog = handler_watchdog(budgets, default_budget, parsed.detach_over_budget)
 
     if parsed.version:
         import platform
@@ -1103,10 +3474,63 @@ def main(args: List[str]) -> int:
             print("Invalid TOKEN password")
             return 1
 
+    client_extra: Dict[str, Any] = {}
+
+    if parsed.shards is not None:
+        try:
+            shard_count = None if parsed.shards == "auto" else int(parsed.shards)
+            shard_ids = None if parsed.shard_ids is None else parse_shard_ids(parsed.shard_ids)
+        except ValueError:
+            print("Invalid --shards or --shard-ids value")
+            return 1
+
+        if shard_ids is not None and (shard_count is None or any(not 0 <= i < shard_count for i in shard_ids)):
+            print("--shard-ids must be within a fixed --shards count")
+            return 1
+
+        client_extra["shard_count"] = shard_count
+        if shard_ids is not None:
+            client_extra["shard_ids"] = shard_ids
+
+    publish_kernel_info()
+
     # Load command modules
     if e := kernel_load_command_modules():
         print(e[0])
 
+    # Narrow gateway intents to the events loaded modules handle, the client is rebuilt since discord.py fixes them at construction
+    events = set(dynamiclib_modules_exec_dict)
+    try:
+        policy_intents, member_cache_flags, chunk_guilds = gateway_policy(events)
+    except TypeError as e:
+        print(f"Invalid GATEWAY_INTENTS in LeXdPyK_conf: {e}")
+        return 1
+
+    # Raw gateway payloads are only handed to the client with debug events enabled
+    if parsed.record_events is not None:
+        client_extra["enable_debug_events"] = True
+
+    rebuild_client(parsed.shards is not None, intents=policy_intents, member_cache_flags=member_cache_flags, chunk_guilds_at_startup=chunk_guilds, **client_extra)
+
+    if parsed.record_events is not None:
+        try:
+            event_recorder = gateway_recorder(parsed.record_events)
+        except OSError as e:
+            print(f"Could not open event recording: {e}")
+            return 1
+        Client.event(on_socket_raw_receive)
+        log_kernel_info(f"Recording gateway events to {parsed.record_events}")
+
+    # Presence updates are only requested from discord when a module handles them
+    if policy_intents.presences:
+        Client.event(on_presence_update)
+
+    compile_event_dispatch()
+
+    if parsed.shards is not None:
+        log_kernel_info(f"Running sharded, shard count {client_extra['shard_count'] or 'auto'}, shards {client_extra.get('shard_ids', 'all')}")
+    log_kernel_info(f"Gateway intents: {', '.join(name for name, enabled in policy_intents if enabled)}, chunking guilds at startup: {chunk_guilds}")
+
     # Start bot
     if TOKEN:
         try:
@@ -1118,12 +3542,27 @@ def main(args: List[str]) -> int:
         print("You need a token set in SONNET_TOKEN or RHEA_TOKEN environment variables, or a encrypted token in .tokenfile, to use sonnet")
         return 1
 
+    if event_recorder is not None:
+        event_recorder.close()
+        print(f"Recorded {event_recorder.count} gateway events")
+
     if DEVELOPMENT_MODE:
         print("Dumping ramfs:")
         print(ramfs._dump_data())
         print("Dumping kramfs:")
         print(kernel_ramfs._dump_data())
 
+    # Commit database writes the write-behind queue is still holding, read through sys.modules so the kernel keeps not importing libs
+    if (flush_db := getattr(sys.modules.get("lib_sonnetdb"), "flush_write_behind", None)) is not None:
+        try:
+            flush_db()
+        except Exception as e:
+            # logged like any kernel caught error, the rest of shutdown still has to run
+            errtype(e, "write-behind flush")
+
+    # Fold blacklist journal into snapshot at exit
+    blacklist.compact()
+
     # Clear cache at exit
     for i in glob.glob("datastore/*.cache.db"):
         os.remove(i)